@@ -112,7 +112,7 @@ const CompaniesPage = () => {
                       </td>
                       <td>{company.industry || "-"}</td>
                       <td>{company.size || "-"}</td>
-                      <td>{company.customers?.length || 0}</td>
+                      <td>{company.customer_count || 0}</td>
                       <td>{company.deal_value || "-"}</td>
                     </tr>
                   ))
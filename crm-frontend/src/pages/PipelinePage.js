@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import api from "../api/axios";
 import Layout from "../components/Layout";
 import {
@@ -14,54 +14,154 @@ const STAGES = [
   { key: "negotiation", label: "Negotiation", color: "#e74c3c" },
 ];
 
+// Drops made within this window are sent together in one /api/deals/moves request
+const MOVE_BATCH_DELAY_MS = 400;
+
+const emptyBoard = () =>
+  Object.fromEntries(
+    STAGES.map((stage) => [stage.key, { deals: [], count: 0, nextCursor: null }])
+  );
+
 const PipelinePage = () => {
-  const [columns, setColumns] = useState({
-    prospecting: [],
-    qualification: [],
-    proposal: [],
-    negotiation: [],
-  });
+  const [columns, setColumns] = useState(emptyBoard);
   const [loading, setLoading] = useState(true);
 
   const fetchDeals = async () => {
     setLoading(true);
     try {
-      const res = await api.get("/api/deals/");
-      const grouped = {
-        prospecting: [],
-        qualification: [],
-        proposal: [],
-        negotiation: [],
-      };
-
-      res.data.forEach((deal) => {
-        const stage = deal.stage?.toLowerCase();
-        if (grouped[stage]) {
-          grouped[stage].push(deal);
-        }
+      const res = await api.get("/api/deals/board", {
+        params: { stages: STAGES.map((stage) => stage.key).join(",") },
+      });
+      const board = emptyBoard();
+
+      // The server returns stages in their configured spelling (e.g. "Proposal")
+      res.data.forEach((column) => {
+        board[column.stage.toLowerCase()] = {
+          deals: column.deals,
+          count: column.count,
+          nextCursor: column.next_cursor,
+        };
       });
 
-      setColumns(grouped);
+      setColumns(board);
     } catch (e) {
       console.error("Pipeline fetch error:", e);
     }
     setLoading(false);
   };
 
+  const loadMore = async (stageKey) => {
+    try {
+      const res = await api.get("/api/deals/board", {
+        params: { stage: stageKey, cursor: columns[stageKey].nextCursor },
+      });
+      const [column] = res.data;
+      setColumns((prev) => ({
+        ...prev,
+        [stageKey]: {
+          ...prev[stageKey],
+          deals: [...prev[stageKey].deals, ...column.deals],
+          nextCursor: column.next_cursor,
+        },
+      }));
+    } catch (e) {
+      console.error("Pipeline load more error:", e);
+    }
+  };
+
   useEffect(() => {
     fetchDeals();
   }, []);
 
-  const updateDealStage = async (dealId, newStage) => {
+  // Moves waiting to be sent, keyed by deal id (a later drop of the same deal replaces it)
+  const pendingMoves = useRef(new Map());
+  // Latest version the server reported per deal, for moves sent after an earlier batch
+  const versions = useRef(new Map());
+  const flushTimer = useRef(null);
+  const inFlight = useRef(Promise.resolve());
+
+  const applyMoveResults = (results) => {
+    const byId = new Map(results.map((r) => [r.id, r]));
+    setColumns((prev) =>
+      Object.fromEntries(
+        Object.entries(prev).map(([key, column]) => [
+          key,
+          {
+            ...column,
+            deals: column.deals.map((deal) => {
+              const r = byId.get(deal.id);
+              return r ? { ...deal, position: r.position, version: r.version } : deal;
+            }),
+          },
+        ])
+      )
+    );
+  };
+
+  const sendMoves = async () => {
+    const moves = Array.from(pendingMoves.current.values()).map((move) => ({
+      ...move,
+      version: versions.current.get(move.deal_id) ?? move.version,
+    }));
+    pendingMoves.current.clear();
+    if (moves.length === 0) return;
     try {
-      await api.patch(`/api/deals/${dealId}/`, { stage: newStage });
+      const res = await api.patch("/api/deals/moves", { moves });
+      res.data.forEach((r) => {
+        if (r.version !== null && r.version !== undefined) versions.current.set(r.id, r.version);
+      });
+      applyMoveResults(res.data.filter((r) => r.status === "moved" || r.status === "unchanged"));
+      if (res.data.some((r) => r.status === "conflict" || r.status === "not_found")) {
+        // Someone else changed or deleted a moved deal; show the server's board
+        versions.current.clear();
+        fetchDeals();
+      }
     } catch (err) {
       console.error("Stage update failed:", err);
+      versions.current.clear();
+      fetchDeals();
     }
   };
 
-  const onDragEnd = async (result) => {
-    const { source, destination, draggableId } = result;
+  const flushMoves = () => {
+    clearTimeout(flushTimer.current);
+    flushTimer.current = null;
+    // One batch at a time, so each batch sees the versions returned by the previous one
+    inFlight.current = inFlight.current.then(sendMoves);
+    return inFlight.current;
+  };
+
+  const queueMove = (deal, stage, position) => {
+    const queued = pendingMoves.current.get(deal.id);
+    pendingMoves.current.set(deal.id, {
+      deal_id: deal.id,
+      stage,
+      position,
+      version: queued ? queued.version : deal.version,
+    });
+    clearTimeout(flushTimer.current);
+    flushTimer.current = setTimeout(flushMoves, MOVE_BATCH_DELAY_MS);
+  };
+
+  useEffect(() => {
+    // Send queued moves when leaving the page
+    return () => {
+      if (flushTimer.current) flushMoves();
+    };
+  }, []);
+
+  // Position between the neighbours of `index` in the column's board order
+  const positionAt = (items, index) => {
+    const before = items[index - 1]?.position;
+    const after = items[index + 1]?.position;
+    if (before != null && after != null) return (before + after) / 2;
+    if (before != null) return before + 1;
+    if (after != null) return after - 1;
+    return index;
+  };
+
+  const onDragEnd = (result) => {
+    const { source, destination } = result;
 
     if (!destination) return;
 
@@ -75,36 +175,41 @@ const PipelinePage = () => {
     const sourceStage = source.droppableId;
     const destStage = destination.droppableId;
 
-    const sourceItems = Array.from(columns[sourceStage]);
+    const sourceItems = Array.from(columns[sourceStage].deals);
     const destItems =
       sourceStage === destStage
         ? sourceItems
-        : Array.from(columns[destStage]);
+        : Array.from(columns[destStage].deals);
 
     const [moved] = sourceItems.splice(source.index, 1);
+    destItems.splice(destination.index, 0, moved);
+    const position = positionAt(destItems, destination.index);
+    destItems[destination.index] = { ...moved, stage: destStage, position };
 
     if (sourceStage === destStage) {
       // Reorder in same column
-      destItems.splice(destination.index, 0, moved);
       setColumns((prev) => ({
         ...prev,
-        [sourceStage]: destItems,
+        [sourceStage]: { ...prev[sourceStage], deals: destItems },
       }));
     } else {
       // Move across columns
-      destItems.splice(destination.index, 0, { ...moved, stage: destStage });
       setColumns((prev) => ({
         ...prev,
-        [sourceStage]: sourceItems,
-        [destStage]: destItems,
+        [sourceStage]: {
+          ...prev[sourceStage],
+          deals: sourceItems,
+          count: prev[sourceStage].count - 1,
+        },
+        [destStage]: {
+          ...prev[destStage],
+          deals: destItems,
+          count: prev[destStage].count + 1,
+        },
       }));
-      // backend update
-      try {
-        await updateDealStage(parseInt(draggableId, 10), destStage);
-      } catch (e) {
-        console.error(e);
-      }
     }
+    // backend update, batched with other drops made shortly after
+    queueMove(moved, destStage, position);
   };
 
   if (loading) {
@@ -146,13 +251,13 @@ const PipelinePage = () => {
                         <h2 className="font-semibold">{stage.label}</h2>
                       </div>
                       <span className="text-xs bg-gray-100 px-2 py-1 rounded-full">
-                        {columns[stage.key]?.length || 0}
+                        {columns[stage.key]?.count || 0}
                       </span>
                     </div>
 
                     {/* Cards */}
-                    {columns[stage.key] && columns[stage.key].length > 0 ? (
-                      columns[stage.key].map((deal, index) => (
+                    {columns[stage.key] && columns[stage.key].deals.length > 0 ? (
+                      columns[stage.key].deals.map((deal, index) => (
                         <Draggable
                           key={deal.id}
                           draggableId={deal.id.toString()}
@@ -190,6 +295,15 @@ const PipelinePage = () => {
                     )}
 
                     {provided.placeholder}
+
+                    {columns[stage.key]?.nextCursor && (
+                      <button
+                        className="text-sm text-blue-600 mt-3"
+                        onClick={() => loadMore(stage.key)}
+                      >
+                        Load more
+                      </button>
+                    )}
                   </div>
                 )}
               </Droppable>
@@ -0,0 +1,127 @@
+"""
+Buffered activity-log writer.
+
+Write endpoints hand events to an in-process buffer and return immediately;
+a background task writes them with insert_many whenever a batch fills up or
+the flush interval passes. A full buffer makes `record_activity` wait
+(backpressure) instead of growing without bound, and shutdown drains
+everything still buffered.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from pymongo.errors import PyMongoError
+from app.config import get_settings
+from app.models.activity_log import ActionType
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ActivityWriter:
+    def __init__(self, max_buffer: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        self._collection = db.activity_logs
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything buffered so far, then stop the background task."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def record(self, event: dict) -> None:
+        if not self.running:
+            # Database never came up; don't let the buffer fill and block requests
+            self.dropped += 1
+            return
+        await self._queue.put(event)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        event = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            await self._collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except PyMongoError as e:
+            self.failed += len(batch)
+            logger.warning("Failed to write %d activity log entries: %s", len(batch), e)
+        except Exception:
+            # e.g. bson.errors.InvalidDocument; drop the batch but keep the writer alive
+            self.failed += len(batch)
+            logger.exception("Unexpected error writing %d activity log entries", len(batch))
+        self.flushes += 1
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self._queue.qsize(),
+            "max_buffer": self._queue.maxsize,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+        }
+
+
+activity_writer = ActivityWriter(
+    max_buffer=get_settings().activity_buffer_size,
+    batch_size=get_settings().activity_batch_size,
+    flush_interval=get_settings().activity_flush_interval_seconds,
+)
+
+
+async def record_activity(action_type: ActionType, model: str, object_id, object_repr: str, user=None) -> None:
+    """Queue an activity log entry for a create/edit/delete on `model`."""
+    await activity_writer.record({
+        "user_id": user.id if user else None,
+        "user_name": (user.full_name or user.username) if user else "Anonymous",
+        "user_avatar": None,
+        "action_type": action_type.value,
+        "object_id": str(object_id),
+        "object_repr": object_repr,
+        "model": model,
+        "action_time": datetime.utcnow(),
+    })
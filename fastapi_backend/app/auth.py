@@ -1,21 +1,128 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 import bcrypt
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from app.cache import TTLCache, get_invalidation_bus
 from app.config import get_settings
 from app.models.user import User, TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
+
+# User documents keyed by token subject (username)
+USER_CACHE_CHANNEL = "users"
+user_cache = TTLCache(
+    maxsize=get_settings().user_cache_size,
+    ttl=get_settings().user_cache_ttl_seconds,
+)
+get_invalidation_bus().subscribe(USER_CACHE_CHANNEL, user_cache.delete)
+
+
+async def invalidate_user(username: str) -> None:
+    """Drop a user from the cache in every worker; call after updating or deactivating them."""
+    await get_invalidation_bus().publish(USER_CACHE_CHANNEL, username)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
+    if not hashed_password:
+        return False
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    rounds = get_settings().bcrypt_rounds
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with a different cost factor than configured."""
+    try:
+        return int(hashed_password.split("$")[2]) != get_settings().bcrypt_rounds
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+
+class PasswordHashStats:
+    """Counters for bcrypt work, including time spent waiting for a free worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.queue_time_total_ms = 0.0
+        self.queue_time_max_ms = 0.0
+
+    def started(self, queue_time_ms: float):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.queue_time_total_ms += queue_time_ms
+            self.queue_time_max_ms = max(self.queue_time_max_ms, queue_time_ms)
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "workers": get_settings().password_hash_workers,
+                "calls": self.calls,
+                "in_flight": self.in_flight,
+                "queue_time_avg_ms": self.queue_time_total_ms / self.calls if self.calls else 0.0,
+                "queue_time_max_ms": self.queue_time_max_ms,
+            }
+
+
+password_hash_stats = PasswordHashStats()
+
+# bcrypt is CPU bound; the pool size caps how many hashes run at once so the event loop stays free
+_password_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_password_executor() -> ThreadPoolExecutor:
+    """Shared bcrypt pool, created on first use and again after a shutdown."""
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=get_settings().password_hash_workers,
+            thread_name_prefix="password-hash",
+        )
+    return _password_executor
+
+
+async def _run_password_work(func, *args):
+    submitted = time.perf_counter()
+
+    def timed():
+        password_hash_stats.started((time.perf_counter() - submitted) * 1000)
+        try:
+            return func(*args)
+        finally:
+            password_hash_stats.finished()
+
+    return await asyncio.get_running_loop().run_in_executor(get_password_executor(), timed)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_work(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_work(get_password_hash, password)
+
+
+def shutdown_password_executor():
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -58,13 +165,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     except JWTError:
         raise credentials_exception
     
-    user = await User.find_one({"username": token_data.username})
+    user = user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        user = await User.find_one({"username": token_data.username})
+        if user is None:
+            raise credentials_exception
+        user_cache.set(token_data.username, user)
     
     return user
 
 
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[User]:
+    """The authenticated user if a valid token was sent, otherwise None."""
+    if not token:
+        return None
+    try:
+        return await get_current_user(token)
+    except HTTPException:
+        return None
+
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -1,20 +1,50 @@
 """
 Azure AD SSO Authentication Module
-Handles Azure AD token validation via Microsoft Graph API
+Handles Azure AD token validation, either locally against the tenant's
+signing keys (JWKS) or via Microsoft Graph API
 """
 
+import asyncio
+import time
+from datetime import datetime
 import httpx
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Optional
 from functools import lru_cache
+from app.auth import invalidate_user
 from app.config import get_settings
 from app.database import get_db
 
 # Azure AD configuration
 security = HTTPBearer(auto_error=False)
 
+GRAPH_ME_URL = "https://graph.microsoft.com/v1.0/me"
+
+# Unknown kids can force a JWKS refetch at most this often (seconds)
+JWKS_MIN_REFRESH_INTERVAL = 30.0
+
+# Shared HTTP client so Graph / JWKS calls reuse connections and TLS sessions
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10.0)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+
 
 class AzureADSettings(BaseModel):
     tenant_id: str
@@ -32,6 +62,56 @@ class AzureUser(BaseModel):
     roles: list = []
 
 
+class JWKSCache:
+    """
+    Signing keys for one tenant, cached with a TTL.
+    An unknown `kid` triggers a refresh (rate limited), and concurrent
+    refreshes are single-flighted behind a lock.
+    """
+
+    def __init__(self, jwks_uri: str, ttl_seconds: float):
+        self.jwks_uri = jwks_uri
+        self.ttl_seconds = ttl_seconds
+        self._keys: Dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return bool(self._keys) and time.monotonic() - self._fetched_at < self.ttl_seconds
+
+    async def _refresh(self, requested_at: float):
+        async with self._lock:
+            # Another caller finished a refresh while we were waiting
+            if self._fetched_at > requested_at:
+                return
+            response = await get_http_client().get(self.jwks_uri)
+            response.raise_for_status()
+            self._keys = {k["kid"]: k for k in response.json().get("keys", []) if "kid" in k}
+            self._fetched_at = time.monotonic()
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        requested_at = time.monotonic()
+        if not self._is_fresh():
+            await self._refresh(requested_at)
+        elif kid not in self._keys and requested_at - self._fetched_at > JWKS_MIN_REFRESH_INTERVAL:
+            # Key rotation: refetch once for a kid we have not seen
+            await self._refresh(requested_at)
+        return self._keys.get(kid)
+
+
+_jwks_cache: Optional[JWKSCache] = None
+
+
+def get_jwks_cache(azure_settings: AzureADSettings) -> JWKSCache:
+    global _jwks_cache
+    if _jwks_cache is None:
+        _jwks_cache = JWKSCache(
+            f"https://login.microsoftonline.com/{azure_settings.tenant_id}/discovery/v2.0/keys",
+            get_settings().azure_jwks_cache_ttl_seconds,
+        )
+    return _jwks_cache
+
+
 @lru_cache(maxsize=1)
 def get_azure_settings() -> Optional[AzureADSettings]:
     """Get Azure AD settings from environment"""
@@ -48,8 +128,10 @@ def get_azure_settings() -> Optional[AzureADSettings]:
 
 async def validate_azure_token(token: str) -> AzureUser:
     """
-    Validate Azure AD token by calling Microsoft Graph API.
-    This is the most reliable method as it works with any valid Azure token.
+    Validate an Azure AD token.
+    In "jwks" mode the signature and claims are checked locally and Graph is
+    only called for optional profile enrichment; in "graph" mode the token is
+    validated by calling Microsoft Graph API.
     """
     azure_settings = get_azure_settings()
     if not azure_settings:
@@ -58,50 +140,139 @@ async def validate_azure_token(token: str) -> AzureUser:
             detail="Azure AD SSO is not configured"
         )
     
+    if get_settings().azure_token_validation == "jwks":
+        azure_user = await validate_azure_token_locally(token, azure_settings)
+        if get_settings().azure_graph_enrichment:
+            azure_user = await enrich_from_graph(azure_user, token)
+        return azure_user
+    
+    return await validate_azure_token_via_graph(token)
+
+
+async def validate_azure_token_locally(token: str, azure_settings: AzureADSettings) -> AzureUser:
+    """
+    Verify signature, expiry, audience and issuer against the tenant JWKS.
+    Works for ID tokens and tokens issued for this app's API (not Graph
+    access tokens, which are not meant to be verified by third parties).
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid Azure AD token",
+    )
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        raise invalid
+    
+    try:
+        key = await get_jwks_cache(azure_settings).get_key(header.get("kid", ""))
+    except httpx.HTTPError as e:
+        print(f"[Azure SSO] JWKS fetch failed: {type(e).__name__}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Unable to fetch Azure AD signing keys"
+        )
+    if key is None:
+        raise invalid
+    
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            options={"verify_aud": False, "verify_at_hash": False},
+        )
+    except JWTError as e:
+        print(f"[Azure SSO] Token verification failed: {str(e)}")
+        raise invalid
+    
+    client_id = azure_settings.client_id
+    audiences = {client_id, f"api://{client_id}"}
+    tenant = azure_settings.tenant_id
+    issuers = {
+        f"https://login.microsoftonline.com/{tenant}/v2.0",
+        f"https://sts.windows.net/{tenant}/",
+    }
+    if claims.get("aud") not in audiences or claims.get("iss") not in issuers:
+        raise invalid
+    
+    username = claims.get("preferred_username") or claims.get("upn") or claims.get("unique_name", "")
+    return AzureUser(
+        oid=claims.get("oid", ""),
+        preferred_username=username,
+        email=claims.get("email") or username or None,
+        name=claims.get("name"),
+        given_name=claims.get("given_name"),
+        family_name=claims.get("family_name"),
+        roles=claims.get("roles", []),
+    )
+
+
+async def enrich_from_graph(azure_user: AzureUser, token: str) -> AzureUser:
+    """Fill profile fields from Graph; failures leave the user unchanged."""
+    try:
+        response = await get_http_client().get(GRAPH_ME_URL, headers={"Authorization": f"Bearer {token}"})
+        if response.status_code != 200:
+            return azure_user
+        profile = response.json()
+    except httpx.HTTPError:
+        return azure_user
+    
+    return azure_user.model_copy(update={
+        "email": profile.get("mail") or azure_user.email,
+        "name": profile.get("displayName") or azure_user.name,
+        "given_name": profile.get("givenName") or azure_user.given_name,
+        "family_name": profile.get("surname") or azure_user.family_name,
+    })
+
+
+async def validate_azure_token_via_graph(token: str) -> AzureUser:
+    """
+    Validate Azure AD token by calling Microsoft Graph API.
+    This works with any valid Azure token but costs an external round trip.
+    """
     print(f"[Azure SSO] Validating token via Microsoft Graph API...")
     print(f"[Azure SSO] Token length: {len(token)}")
     
     try:
         # Validate by calling Microsoft Graph API
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://graph.microsoft.com/v1.0/me",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10.0
+        response = await get_http_client().get(
+            GRAPH_ME_URL,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        
+        print(f"[Azure SSO] Graph API response status: {response.status_code}")
+        
+        if response.status_code == 401:
+            try:
+                error_detail = response.json()
+            except:
+                error_detail = response.text
+            print(f"[Azure SSO] Graph API 401 error: {error_detail}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid Azure AD token - rejected by Microsoft Graph"
             )
-            
-            print(f"[Azure SSO] Graph API response status: {response.status_code}")
-            
-            if response.status_code == 401:
-                try:
-                    error_detail = response.json()
-                except:
-                    error_detail = response.text
-                print(f"[Azure SSO] Graph API 401 error: {error_detail}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid Azure AD token - rejected by Microsoft Graph"
-                )
-            
-            if response.status_code != 200:
-                print(f"[Azure SSO] Graph API error: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail=f"Microsoft Graph API error: {response.status_code}"
-                )
-            
-            user_data = response.json()
-            print(f"[Azure SSO] Successfully authenticated user: {user_data.get('userPrincipalName')}")
-            
-            return AzureUser(
-                oid=user_data.get("id", ""),
-                preferred_username=user_data.get("userPrincipalName", ""),
-                email=user_data.get("mail") or user_data.get("userPrincipalName"),
-                name=user_data.get("displayName"),
-                given_name=user_data.get("givenName"),
-                family_name=user_data.get("surname"),
-                roles=[]
+        
+        if response.status_code != 200:
+            print(f"[Azure SSO] Graph API error: {response.status_code} - {response.text}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Microsoft Graph API error: {response.status_code}"
             )
+        
+        user_data = response.json()
+        print(f"[Azure SSO] Successfully authenticated user: {user_data.get('userPrincipalName')}")
+        
+        return AzureUser(
+            oid=user_data.get("id", ""),
+            preferred_username=user_data.get("userPrincipalName", ""),
+            email=user_data.get("mail") or user_data.get("userPrincipalName"),
+            name=user_data.get("displayName"),
+            given_name=user_data.get("givenName"),
+            family_name=user_data.get("surname"),
+            roles=[]
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -112,67 +283,98 @@ async def validate_azure_token(token: str) -> AzureUser:
         )
 
 
+def _duplicate_key_field(error: DuplicateKeyError) -> Optional[str]:
+    """Name of the unique index field that rejected a write."""
+    key_pattern = (error.details or {}).get("keyPattern") or {}
+    return next(iter(key_pattern), None)
+
+
 async def get_or_create_azure_user(azure_user: AzureUser):
     """
     Get existing user or create new one from Azure AD info.
     Returns the user document from MongoDB.
+
+    The common case is a single upsert keyed on the Azure OID. The unique
+    indexes on azure_oid, email and username turn the rare cases into
+    duplicate key errors: a concurrent first login (retry and match the
+    winner), an existing password account with the same email (link it),
+    or a taken username (retry with the next candidate).
     """
     db = await get_db()
     
-    # Try to find existing user by Azure OID
-    user = await db.users.find_one({"azure_oid": azure_user.oid})
-    
-    if user:
-        # Update user info from Azure (in case name/email changed)
-        await db.users.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {
-                    "email": azure_user.email or azure_user.preferred_username,
-                    "full_name": azure_user.name or f"{azure_user.given_name or ''} {azure_user.family_name or ''}".strip(),
-                }
-            }
-        )
-        return await db.users.find_one({"_id": user["_id"]})
-    
-    # Try to find by email (for existing users migrating to SSO)
     email = azure_user.email or azure_user.preferred_username
-    user = await db.users.find_one({"email": email})
-    
-    if user:
-        # Link existing user to Azure account
-        await db.users.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {
-                    "azure_oid": azure_user.oid,
-                    "auth_provider": "azure_ad"
-                }
-            }
+    base_username = azure_user.preferred_username.split("@")[0]  # Use email prefix as username
+    full_name = azure_user.name or f"{azure_user.given_name or ''} {azure_user.family_name or ''}".strip() or base_username
+    
+    # Deterministic fallbacks when the email prefix is already taken
+    username_candidates = [base_username, f"{base_username}_{azure_user.oid[:8]}", f"{base_username}_{azure_user.oid}"]
+    
+    for username in username_candidates:
+        for _ in range(2):
+            try:
+                user = await db.users.find_one_and_update(
+                    {"azure_oid": azure_user.oid},
+                    {
+                        # Refresh profile from Azure (in case name/email changed)
+                        "$set": {"email": email, "full_name": full_name},
+                        "$setOnInsert": {
+                            "username": username,
+                            "auth_provider": "azure_ad",
+                            "is_active": True,
+                            "is_staff": "Admin" in azure_user.roles,  # Map Azure roles
+                            "hashed_password": None,  # No password for SSO users
+                            "created_at": datetime.utcnow(),
+                        },
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                await invalidate_user(user["username"])
+                return user
+            except DuplicateKeyError as e:
+                field = _duplicate_key_field(e)
+            
+            if field == "azure_oid":
+                # A concurrent first login created the user; the retry matches it
+                continue
+            if field == "email":
+                return await _link_or_refresh_by_email(db, azure_user, email, full_name)
+            break  # username taken, try the next candidate
+    
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Could not allocate a unique username for this Azure AD account",
+    )
+
+
+async def _link_or_refresh_by_email(db, azure_user: AzureUser, email: str, full_name: str):
+    """Handle an upsert rejected because another account already has this email."""
+    try:
+        # Existing password user signing in with SSO for the first time
+        user = await db.users.find_one_and_update(
+            {"email": email, "azure_oid": {"$not": {"$type": "string"}}},
+            {"$set": {"azure_oid": azure_user.oid, "auth_provider": "azure_ad"}},
+            return_document=ReturnDocument.AFTER,
         )
-        return await db.users.find_one({"_id": user["_id"]})
-    
-    # Create new user from Azure AD info
-    username = azure_user.preferred_username.split("@")[0]  # Use email prefix as username
-    
-    # Ensure unique username
-    existing = await db.users.find_one({"username": username})
-    if existing:
-        username = f"{username}_{azure_user.oid[:8]}"
-    
-    new_user = {
-        "username": username,
-        "email": email,
-        "full_name": azure_user.name or f"{azure_user.given_name or ''} {azure_user.family_name or ''}".strip() or username,
-        "azure_oid": azure_user.oid,
-        "auth_provider": "azure_ad",
-        "is_active": True,
-        "is_staff": "Admin" in azure_user.roles,  # Map Azure roles
-        "hashed_password": None  # No password for SSO users
-    }
+        if user:
+            await invalidate_user(user["username"])
+            return user
+    except DuplicateKeyError:
+        pass
     
-    result = await db.users.insert_one(new_user)
-    return await db.users.find_one({"_id": result.inserted_id})
+    # The OID user exists but its new email belongs to someone else: keep the old email
+    user = await db.users.find_one_and_update(
+        {"azure_oid": azure_user.oid},
+        {"$set": {"full_name": full_name}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Email is already linked to another Azure AD account",
+        )
+    await invalidate_user(user["username"])
+    return user
 
 
 async def get_current_azure_user(
@@ -0,0 +1,252 @@
+"""
+Batch create/update/delete for the CRUD routers.
+
+A batch is validated in one pass: schemas per item, one $in query for the
+documents being updated or deleted, and one $in query per referenced
+collection. Valid items are then written with a single unordered
+bulk_write and every item gets a compact result entry.
+
+Updates and deletes are guarded by the version read in that pass, so a
+document changed by someone else in between is reported as a conflict
+rather than overwritten, and the pre-read image is exactly the before
+image of every write that did apply.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple, Type
+from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.activity import record_activity
+from app.models.activity_log import ActionType
+from app.writes import version_guard
+
+MAX_BULK_OPERATIONS = 10000
+
+ACTION_TYPES = {"create": ActionType.create, "update": ActionType.edit, "delete": ActionType.delete}
+RESULT_STATUS = {"create": "created", "update": "updated", "delete": "deleted"}
+
+
+class BulkOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None  # Required for update and delete
+    data: Dict[str, Any] = {}  # Validated against the resource's create/update schema
+
+
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation] = Field(..., max_length=MAX_BULK_OPERATIONS)
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: Literal["created", "updated", "deleted", "conflict", "error"]
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    failed: int = 0  # Errors and conflicts
+    results: List[BulkItemResult] = []
+
+
+def _validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+async def find_missing_ids(collection, ids: List[ObjectId]) -> set:
+    """IDs from `ids` that do not exist in `collection` (one query)."""
+    if not ids:
+        return set()
+    found = await collection.find({"_id": {"$in": list(set(ids))}}, {"_id": 1}).to_list(length=None)
+    return set(ids) - {doc["_id"] for doc in found}
+
+
+def _update_landed(current: Optional[dict], before: dict, changes: dict) -> bool:
+    """Whether `current` shows the guarded $set of `changes` on `before` (and nothing after it)."""
+    return (
+        current is not None
+        and current.get("version", 0) == before.get("version", 0) + 1
+        and all(current.get(field) == value for field, value in changes.items())
+    )
+
+
+async def _find_conflicts(collection, guarded: list, existing: dict, matched: int, deleted: int) -> List[int]:
+    """
+    Indexes of guarded (index, op, oid, changes) writes that did not apply.
+
+    An unordered bulk_write only reports totals, so when they fall short the
+    targeted documents are read back: a delete applied if its document is
+    gone, an update if the document is exactly one version past the pre-read
+    with the written values. A document written again right after our write
+    counts as a conflict, and one deleted by two writers at the same moment
+    as applied, since those outcomes can no longer be told apart.
+    """
+    updates = sum(1 for _, op, _, _ in guarded if op == "update")
+    if matched == updates and deleted == len(guarded) - updates:
+        return []
+    current = {}
+    async for doc in collection.find({"_id": {"$in": [oid for _, _, oid, _ in guarded]}}):
+        current[doc["_id"]] = doc
+    return [
+        index
+        for index, op, oid, changes in guarded
+        if (oid in current if op == "delete" else not _update_landed(current.get(oid), existing[oid], changes))
+    ]
+
+
+async def execute_bulk(
+    db,
+    collection_name: str,
+    model_name: str,
+    operations: List[BulkOperation],
+    create_schema: Type[BaseModel],
+    update_schema: Type[BaseModel],
+    to_document: Callable[[dict], dict],
+    repr_field: str,
+    check_references: Optional[Callable[[Any, List[dict]], Awaitable[List[Optional[str]]]]] = None,
+    on_applied: Optional[Callable[[Any, List[Tuple[Optional[dict], Optional[dict]]]], Awaitable[None]]] = None,
+    user=None,
+) -> BulkResponse:
+    """
+    Validate and apply a batch of operations on one collection.
+
+    `to_document` turns validated schema data into stored fields (e.g. string
+    IDs to ObjectIds); `check_references` returns an error (or None) per
+    document; `on_applied` receives (before, after) pairs of applied changes.
+    Each document may be updated or deleted at most once per batch; later
+    operations on the same id are rejected.
+    """
+    collection = db[collection_name]
+    errors: Dict[int, str] = {}
+    conflicts = set()
+    conflict_message = f"{model_name.capitalize()} was modified by someone else"
+    expected_versions: Dict[int, int] = {}
+    prepared: List[Tuple[int, BulkOperation, Optional[ObjectId], dict]] = []
+    targeted = set()
+
+    # 1. Schema and ID validation
+    for index, operation in enumerate(operations):
+        try:
+            oid = ObjectId(operation.id) if operation.op != "create" else ObjectId()
+        except (InvalidId, TypeError):
+            errors[index] = "Invalid or missing id"
+            continue
+        if operation.op != "create":
+            # Every op is checked and applied against the same pre-read image,
+            # so a second op on one document would be computed from stale state
+            if oid in targeted:
+                errors[index] = "Duplicate id in batch"
+                continue
+            targeted.add(oid)
+        try:
+            if operation.op == "create":
+                data = to_document(create_schema(**operation.data).model_dump())
+            elif operation.op == "update":
+                fields = update_schema(**operation.data).model_dump(exclude_unset=True)
+                if fields.get("version") is not None:
+                    expected_versions[index] = fields["version"]
+                fields.pop("version", None)
+                data = to_document(fields)
+            else:
+                data = {}
+        except ValidationError as e:
+            errors[index] = _validation_message(e)
+            continue
+        except (InvalidId, TypeError):
+            errors[index] = "Invalid referenced id"
+            continue
+        prepared.append((index, operation, oid, data))
+
+    # 2. One query for every document being updated or deleted
+    existing_ids = [oid for _, op, oid, _ in prepared if op.op != "create"]
+    existing = {}
+    if existing_ids:
+        async for doc in collection.find({"_id": {"$in": existing_ids}}):
+            existing[doc["_id"]] = doc
+    for index, operation, oid, _ in prepared:
+        if operation.op != "create" and oid not in existing:
+            errors[index] = f"{model_name.capitalize()} not found"
+        elif index in expected_versions and existing[oid].get("version", 0) != expected_versions[index]:
+            errors[index] = conflict_message
+            conflicts.add(index)
+    prepared = [item for item in prepared if item[0] not in errors]
+
+    # 3. Batched reference checks on the resulting documents
+    afters = [
+        None if op.op == "delete" else (
+            {**existing[oid], **data, "version": existing[oid].get("version", 0) + 1}
+            if op.op == "update" else {"_id": oid, **data}
+        )
+        for _, op, oid, data in prepared
+    ]
+    if check_references:
+        checked = [(item, after) for item, after in zip(prepared, afters) if after is not None]
+        reference_errors = await check_references(db, [after for _, after in checked])
+        for ((index, *_), _), error in zip(checked, reference_errors):
+            if error:
+                errors[index] = error
+    applied = [(item, after) for item, after in zip(prepared, afters) if item[0] not in errors]
+
+    # 4. One unordered bulk write (updates without fields have nothing to write),
+    #    guarded by the versions read in step 2
+    applied = [(item, after) for item, after in applied if item[1].op != "update" or item[3]]
+    requests = []
+    for (_, operation, oid, data), _ in applied:
+        if operation.op == "create":
+            requests.append(InsertOne({"_id": oid, **data}))
+            continue
+        guard = {"_id": oid, "version": version_guard(existing[oid].get("version", 0))}
+        if operation.op == "update":
+            requests.append(UpdateOne(guard, {"$set": data, "$inc": {"version": 1}}))
+        else:
+            requests.append(DeleteOne(guard))
+
+    if requests:
+        try:
+            result = await collection.bulk_write(requests, ordered=False)
+            matched, deleted = result.matched_count, result.deleted_count
+        except BulkWriteError as e:
+            matched, deleted = e.details.get("nMatched", 0), e.details.get("nRemoved", 0)
+            for write_error in e.details.get("writeErrors", []):
+                errors[applied[write_error["index"]][0][0]] = write_error.get("errmsg", "Write failed")
+        guarded = [
+            (index, operation.op, oid, data)
+            for (index, operation, oid, data), _ in applied
+            if operation.op != "create" and index not in errors
+        ]
+        for index in await _find_conflicts(collection, guarded, existing, matched, deleted):
+            errors[index] = conflict_message
+            conflicts.add(index)
+
+    # 5. Report, audit and notify
+    response = BulkResponse()
+    changes = []
+    succeeded = {item[0]: (item, after) for item, after in applied if item[0] not in errors}
+    for index, operation in enumerate(operations):
+        if index in errors:
+            response.failed += 1
+            status = "conflict" if index in conflicts else "error"
+            response.results.append(BulkItemResult(index=index, status=status, id=operation.id, error=errors[index]))
+            continue
+        if index not in succeeded:
+            # Update with no fields: nothing to write, report as updated
+            response.updated += 1
+            response.results.append(BulkItemResult(index=index, status="updated", id=operation.id))
+            continue
+        (_, op, oid, _), after = succeeded[index]
+        status = RESULT_STATUS[op.op]
+        setattr(response, status, getattr(response, status) + 1)
+        response.results.append(BulkItemResult(index=index, status=status, id=str(oid)))
+        before = existing.get(oid)
+        changes.append((before, after))
+        await record_activity(ACTION_TYPES[op.op], model_name, oid, (after or before).get(repr_field, ""), user)
+
+    if on_applied and changes:
+        await on_applied(db, changes)
+    return response
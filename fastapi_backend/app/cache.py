@@ -0,0 +1,214 @@
+"""
+In-process caching primitives.
+
+`TTLCache` is a small TTL + LRU map used for hot lookups. Invalidations go
+through an `InvalidationBus` so that, with the "mongo" backend, an entry
+dropped in one worker is dropped in every worker sharing the database.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Mapping with per-entry expiry and least-recently-used eviction.
+    With `max_bytes`, entries are also evicted to keep the summed
+    `sizeof(value)` under that budget. `on_remove` is called with the key of
+    every entry that is deleted, expires or is evicted.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+        on_remove: Optional[Callable[[Hashable], None]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._on_remove = on_remove
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or entry[0] <= time.monotonic():
+            if entry is not _MISSING:
+                self.delete(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        self.delete(key)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, size)
+        self._bytes += size
+        while len(self._data) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            evicted_key, evicted = self._data.popitem(last=False)
+            self._bytes -= evicted[2]
+            self.evictions += 1
+            if self._on_remove:
+                self._on_remove(evicted_key)
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            if self._on_remove:
+                self._on_remove(key)
+
+    def clear(self) -> None:
+        if self._on_remove:
+            for key in list(self._data):
+                self._on_remove(key)
+        self._data.clear()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class InvalidationBus:
+    """
+    Delivers invalidation messages to subscribers in this process. A message
+    is a cache key or any other BSON-compatible payload (e.g. a list of keys).
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[Any], None]]] = defaultdict(list)
+
+    def subscribe(self, channel: str, callback: Callable[[Any], None]) -> None:
+        self._subscribers[channel].append(callback)
+
+    def _dispatch(self, channel: str, key: Any) -> None:
+        for callback in self._subscribers.get(channel, []):
+            callback(key)
+
+    async def publish(self, channel: str, key: Any) -> None:
+        self._dispatch(channel, key)
+
+    async def start(self, db) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class MongoInvalidationBus(InvalidationBus):
+    """
+    Shares invalidations between workers through a capped collection.
+    Each worker tails the collection and applies messages published by others.
+    """
+
+    COLLECTION = "cache_invalidations"
+    CAPPED_SIZE = 1024 * 1024
+
+    def __init__(self):
+        super().__init__()
+        self.origin = uuid.uuid4().hex
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db) -> None:
+        try:
+            await db.create_collection(self.COLLECTION, capped=True, size=self.CAPPED_SIZE)
+        except CollectionInvalid:
+            pass  # already exists
+        self._collection = db[self.COLLECTION]
+        # Tailable cursors on an empty capped collection die immediately; start after the newest entry
+        newest = await self._collection.find_one(sort=[("$natural", -1)])
+        if newest is None:
+            await self._collection.insert_one({"channel": None, "key": None, "origin": self.origin})
+            newest = await self._collection.find_one(sort=[("$natural", -1)])
+        self._task = asyncio.create_task(self._tail(newest["_id"]))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def publish(self, channel: str, key: Any) -> None:
+        self._dispatch(channel, key)
+        if self._collection is not None:
+            await self._collection.insert_one({"channel": channel, "key": key, "origin": self.origin})
+
+    async def _tail(self, last_id) -> None:
+        """
+        Apply messages inserted after `last_id`, in insertion ($natural) order.
+
+        ObjectIds from different processes are not ordered within a second, so
+        the cursor is not filtered on _id: it reads the collection from the
+        start, skips up to `last_id` and then stays open, waiting for new
+        messages. It is only re-created after an error.
+        """
+        while True:
+            try:
+                cursor = self._collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                caught_up = False
+                while cursor.alive:
+                    # Ends whenever a wait for new messages times out; the cursor stays open
+                    async for message in cursor:
+                        if not caught_up:
+                            caught_up = message["_id"] == last_id
+                            continue
+                        last_id = message["_id"]
+                        if message["origin"] != self.origin and message["channel"]:
+                            self._dispatch(message["channel"], message["key"])
+                    # Past the existing messages; if `last_id` was not among them it has
+                    # been overwritten since, and everything from here on is new
+                    caught_up = True
+            except PyMongoError as e:
+                logger.warning("Cache invalidation tail interrupted: %s", e)
+            await asyncio.sleep(1.0)
+
+
+_bus: Optional[InvalidationBus] = None
+
+
+def get_invalidation_bus() -> InvalidationBus:
+    global _bus
+    if _bus is None:
+        backend = get_settings().cache_invalidation_backend
+        _bus = MongoInvalidationBus() if backend == "mongo" else InvalidationBus()
+    return _bus
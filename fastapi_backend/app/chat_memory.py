@@ -0,0 +1,113 @@
+"""
+Server-side conversation memory for the deal assistant.
+
+Sessions live in a bounded in-process store with idle expiry. Each prompt is
+assembled under a token budget: the deal context is always included, recent
+turns are kept verbatim and older turns are folded into a running summary,
+so prompt size stays flat however long the conversation runs.
+"""
+
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from app.config import get_settings
+
+# Share of the history budget the running summary may use
+SUMMARY_SHARE = 0.25
+
+# How much of an old turn survives in the summary
+SUMMARY_TURN_CHARS = 160
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass
+class ChatSession:
+    id: str
+    turns: List[Tuple[str, str]] = field(default_factory=list)  # (role, content), oldest first
+    summary: str = ""
+    last_used: float = field(default_factory=time.monotonic)
+
+    def add_turn(self, role: str, content: str) -> None:
+        self.turns.append((role, content))
+
+
+def _condense(role: str, content: str) -> str:
+    first_sentence = re.split(r"(?<=[.!?])\s", content.strip(), maxsplit=1)[0]
+    if len(first_sentence) > SUMMARY_TURN_CHARS:
+        first_sentence = first_sentence[:SUMMARY_TURN_CHARS].rstrip() + "..."
+    return f"{'User' if role == 'user' else 'Assistant'}: {first_sentence}"
+
+
+def compact(session: ChatSession, history_budget: int) -> None:
+    """Fold the oldest turns into the summary until the history fits the budget."""
+    summary_budget = int(history_budget * SUMMARY_SHARE)
+    turns_budget = history_budget - summary_budget
+
+    while session.turns and sum(estimate_tokens(c) for _, c in session.turns) > turns_budget:
+        role, content = session.turns.pop(0)
+        session.summary = f"{session.summary}\n{_condense(role, content)}".strip()
+
+    # Keep the most recent part of the summary (none if the budget is used up)
+    max_chars = summary_budget * 4
+    if max_chars <= 0:
+        session.summary = ""
+    elif len(session.summary) > max_chars:
+        session.summary = session.summary[-max_chars:].split("\n", 1)[-1]
+
+
+def assemble_context(session: ChatSession, deal_context: str, message: str) -> str:
+    """Build the context note for the next turn within the configured budget."""
+    budget = get_settings().chat_prompt_token_budget
+    history_budget = max(0, budget - estimate_tokens(deal_context) - estimate_tokens(message))
+    compact(session, history_budget)
+
+    parts = [deal_context]
+    if session.summary:
+        parts.append("Summary of the earlier conversation:\n" + session.summary)
+    if session.turns:
+        recent = "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {content}" for role, content in session.turns)
+        parts.append("Recent conversation:\n" + recent)
+    return "\n\n".join(parts)
+
+
+class ConversationStore:
+    """Bounded map of sessions; idle sessions expire, the least recently used are evicted."""
+
+    def __init__(self, max_sessions: int, idle_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions and next(iter(self._sessions.values())).last_used <= cutoff:
+            self._sessions.popitem(last=False)
+
+    def get_or_create(self, session_id: Optional[str]) -> ChatSession:
+        """Return the live session for `session_id`, or start a new one with a fresh ID."""
+        self._expire()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session = ChatSession(id=uuid.uuid4().hex)
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session.id)
+        return session
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+conversation_store = ConversationStore(
+    max_sessions=get_settings().chat_session_max,
+    idle_seconds=get_settings().chat_session_idle_seconds,
+)
@@ -18,6 +18,45 @@ class Settings(BaseSettings):
     # MongoDB
     mongo_uri: str = "mongodb://localhost:27017"
     database_name: str = "crm"
+    mongo_drop_unknown_indexes: bool = False  # Drop indexes not declared on a model at startup
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int = 300000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_compressors: str = ""  # e.g. "zstd,snappy,zlib"
+
+    # Dashboard
+    dashboard_rollups_enabled: bool = False  # Maintain dashboard_rollups incrementally on deal writes
+
+    # Pipeline board
+    pipeline_stages: str = "NEW,prospecting,qualification,proposal,negotiation,WON"  # Default board columns, in order
+
+    # Deal read model
+    deal_views_enabled: bool = False  # Serve deal reads from the denormalized deal_views collection
+
+    # Activity log writer
+    activity_buffer_size: int = 10000  # Writers wait once this many events are pending
+    activity_batch_size: int = 500
+    activity_flush_interval_seconds: float = 1.0
+    activity_log_retention_days: int = 365  # 0 keeps activity logs forever
+
+    # CSV imports
+    import_chunk_rows: int = 1000  # Rows parsed, validated and inserted per batch
+    import_max_concurrent_jobs: int = 2  # Further imports wait their turn
+    import_max_jobs: int = 100  # Finished job statuses kept per worker process
+    import_max_reported_errors: int = 100  # Row errors listed per job (all are counted)
+    import_company_cache_size: int = 10000
+    import_company_cache_ttl_seconds: int = 300
+
+    # Response cache for list and dashboard endpoints
+    response_cache_backend: str = "off"  # "memory" (per worker) or "mongo" (shared)
+    response_cache_size: int = 2000
+    response_cache_max_bytes: int = 64 * 1024 * 1024  # Memory backend budget
+    response_cache_max_entry_bytes: int = 4 * 1024 * 1024  # Mongo backend; larger responses are not cached
+    response_cache_ttl_seconds: int = 300  # Upper bound on staleness from writes made outside the API
+
+    # Exports
+    export_batch_size: int = 1000  # Documents per cursor batch while streaming
 
     # JWT
     secret_key: str = "your-secret-key-here-change-in-production"
@@ -26,16 +65,54 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
 
+    # Password hashing
+    bcrypt_rounds: int = 12  # Changing this rehashes passwords on next login
+    password_hash_workers: int = 4  # Max concurrent bcrypt operations per worker process
+
+    # Authenticated-user cache
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: int = 60
+    cache_invalidation_backend: str = "local"  # "mongo" shares invalidations between workers
+
     # Azure AD SSO
     azure_tenant_id: str = ""
     azure_client_id: str = ""
     azure_client_secret: str = ""  # Optional, for confidential client flows
+    azure_token_validation: str = "graph"  # "jwks" verifies tokens locally, "graph" calls Microsoft Graph
+    azure_jwks_cache_ttl_seconds: int = 3600
+    azure_graph_enrichment: bool = False  # In jwks mode, fill profile fields from Graph when possible
 
     # OpenRouter
     openrouter_api_key: str = ""
+    openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    llm_model: str = "openai/gpt-4o-mini"
+    llm_models: str = ""  # Routing chain, e.g. "openai/gpt-4o-mini@120000,anthropic/claude-3-haiku"; empty uses llm_model
+    llm_default_max_prompt_tokens: int = 100000
+    llm_slow_p95_seconds: float = 8.0  # Models slower than this are demoted
+    llm_max_error_ratio: float = 0.2
+    llm_stats_window: int = 100
+    llm_cache_size: int = 1000
+    llm_cache_ttl_seconds: int = 3600
+    llm_cache_max_bytes: int = 8 * 1024 * 1024
+    llm_max_concurrency: int = 8
+    llm_max_queue: int = 32  # Callers beyond this get the fallback reply immediately
+    llm_timeout_seconds: float = 20.0  # Per attempt; for streams, per chunk
+    llm_max_retries: int = 2
+    llm_backoff_base_seconds: float = 0.5
+    llm_backoff_max_seconds: float = 4.0
+    llm_breaker_failure_ratio: float = 0.5
+    llm_breaker_min_calls: int = 10
+    llm_breaker_window: int = 20
+    llm_breaker_reset_seconds: float = 30.0
+    llm_breaker_probe_timeout_seconds: float = 60.0  # A half-open probe silent this long is abandoned
     openrouter_site_url: str = "http://localhost:3000"
     openrouter_site_name: str = "CRM Deal Assistant"
 
+    # Deal chat conversation memory
+    chat_session_max: int = 10000
+    chat_session_idle_seconds: int = 1800
+    chat_prompt_token_budget: int = 1500  # Deal context + history + message
+
     # CORS
     cors_origins: str = "http://localhost:3000,http://localhost:5173"
     frontend_url: str = "http://localhost:3000"
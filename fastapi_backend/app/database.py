@@ -1,44 +1,156 @@
+import logging
+import threading
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
 from beanie import init_beanie
 from app.config import get_settings
 from app.models.company import Company
 from app.models.customer import Customer
 from app.models.deal import Deal
+from app.models.deal_view import DealView
 from app.models.user import User
 from app.models.activity_log import ActivityLog
+from app.indexes import sync_indexes
 
-# Global database connection
+logger = logging.getLogger(__name__)
+
+DOCUMENT_MODELS = [
+    Company,
+    Customer,
+    Deal,
+    DealView,
+    User,
+    ActivityLog,
+]
+
+# Single client shared by the whole process; created lazily, closed by the app lifespan
+_client = None
 _db = None
 
 
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by PyMongo's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.created = 0
+        self.closed = 0
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "created": self.created,
+                "closed": self.closed,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
+
+pool_stats = PoolStats()
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Get the process-wide Motor client, creating it on first use."""
+    global _client
+    if _client is None:
+        settings = get_settings()
+        options = {
+            "maxPoolSize": settings.mongo_max_pool_size,
+            "minPoolSize": settings.mongo_min_pool_size,
+            "maxIdleTimeMS": settings.mongo_max_idle_time_ms,
+            "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+            "event_listeners": [pool_stats],
+        }
+        if settings.mongo_compressors:
+            options["compressors"] = settings.mongo_compressors
+        _client = AsyncIOMotorClient(settings.mongo_uri, **options)
+    return _client
+
+
 async def get_db():
     """Get database instance."""
     global _db
     if _db is None:
-        settings = get_settings()
-        client = AsyncIOMotorClient(settings.mongo_uri)
-        _db = client[settings.database_name]
+        _db = get_client()[get_settings().database_name]
     return _db
 
 
 async def init_db():
     """Initialize MongoDB connection and Beanie ODM."""
     settings = get_settings()
+    db = await get_db()
     
-    client = AsyncIOMotorClient(settings.mongo_uri)
-    
-    global _db
-    _db = client[settings.database_name]
+    # Indexes are reconciled here rather than by Beanie; a failure must not keep
+    # the models from being initialised, so it is logged and startup carries on
+    try:
+        await sync_indexes(db, DOCUMENT_MODELS, settings.mongo_drop_unknown_indexes)
+    except PyMongoError as e:
+        logger.error("Index reconciliation failed: %s", e)
     
     await init_beanie(
-        database=client[settings.database_name],
-        document_models=[
-            Company,
-            Customer,
-            Deal,
-            User,
-            ActivityLog,
-        ]
+        database=db,
+        document_models=DOCUMENT_MODELS,
+        skip_indexes=True,
     )
     
-    return client
+    return db
+
+
+def close_db():
+    """Close the shared client and its connection pool."""
+    global _client, _db
+    if _client is not None:
+        _client.close()
+    _client = None
+    _db = None
+    pool_stats.reset()
@@ -0,0 +1,207 @@
+"""
+Denormalized deal read model.
+
+When `deal_views_enabled` is set, every deal is also stored in the
+`deal_views` collection in its full DealResponse shape (company name and
+contacts included), so deal reads are a single indexed fetch with no joins.
+Views are refreshed with the same join pipeline plus $merge whenever a deal
+changes, and fanned out through the deals' company_id / contact_ids indexes
+when a referenced company or customer changes. Rebuild or verify them with
+
+    python -m app.deal_views rebuild
+    python -m app.deal_views check
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import List, Optional, Tuple
+from app.config import get_settings
+
+VIEW_COLLECTION = "deal_views"
+
+# Customer fields copied into a deal's contacts
+CONTACT_FIELDS = ("name", "email", "phone_number", "position")
+
+Change = Tuple[Optional[dict], Optional[dict]]
+
+MUSTAFA_AVATAR_URL = "https://static.vecteezy.com/system/resources/previews/009/292/244/non_2x/default-avatar-icon-of-social-media-user-vector.jpg"
+
+
+def deal_response_pipeline(match: dict, sort: Optional[list] = None, limit: Optional[int] = None) -> list:
+    """Aggregation stages that join company and contacts into the DealResponse shape.
+
+    Sorting and limiting happen before the joins so only returned deals are looked up.
+    """
+    stages = [{"$match": match}]
+    if sort:
+        stages.append({"$sort": dict(sort)})
+    if limit:
+        stages.append({"$limit": limit})
+    return stages + [
+        {"$lookup": {
+            "from": "companies",
+            "localField": "company_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1}}],
+            "as": "company",
+        }},
+        {"$lookup": {
+            "from": "customers",
+            "localField": "contact_ids",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1, "email": 1, "phone_number": 1, "position": 1}}],
+            "as": "contact_docs",
+        }},
+        # $lookup does not preserve array order, so walk contact_ids and pick each match
+        {"$project": {
+            "id": {"$toString": "$_id"},
+            "title": 1,
+            "amount": 1,
+            "company_id": {"$ifNull": [{"$toString": "$company_id"}, ""]},
+            "company_name": {"$arrayElemAt": ["$company.name", 0]},
+            "stage": {"$ifNull": ["$stage", "NEW"]},
+            "close_date": 1,
+            "version": {"$ifNull": ["$version", 0]},
+            "contacts": {"$filter": {
+                "input": {"$map": {
+                    "input": {"$ifNull": ["$contact_ids", []]},
+                    "as": "cid",
+                    "in": {"$first": {"$filter": {
+                        "input": "$contact_docs",
+                        "as": "c",
+                        "cond": {"$eq": ["$$c._id", "$$cid"]},
+                    }}},
+                }},
+                "as": "c",
+                "cond": {"$ne": ["$$c", None]},
+            }},
+        }},
+        {"$set": {"contacts": {"$map": {
+            "input": "$contacts",
+            "as": "c",
+            "in": {
+                "id": {"$toString": "$$c._id"},
+                "name": "$$c.name",
+                "email": "$$c.email",
+                "phone_number": "$$c.phone_number",
+                "avatar_url": {"$literal": MUSTAFA_AVATAR_URL},
+                "position": "$$c.position",
+            },
+        }}}},
+    ]
+
+
+async def refresh_deal_views(db, match: dict) -> None:
+    """Recompute the views of the deals matching `match` server-side."""
+    pipeline = deal_response_pipeline(match) + [
+        {"$merge": {"into": VIEW_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    await db.deals.aggregate(pipeline).to_list(length=None)
+
+
+async def apply_deal_changes(db, changes: List[Change]) -> None:
+    """Refresh the views of created/updated deals and drop those of deleted ones."""
+    if not get_settings().deal_views_enabled:
+        return
+    changed = [after["_id"] for _, after in changes if after is not None]
+    deleted = [before["_id"] for before, after in changes if after is None and before is not None]
+    if changed:
+        await refresh_deal_views(db, {"_id": {"$in": changed}})
+    if deleted:
+        await db[VIEW_COLLECTION].delete_many({"_id": {"$in": deleted}})
+
+
+async def apply_company_changes(db, changes: List[Change]) -> None:
+    """Refresh the deals of renamed or deleted companies."""
+    if not get_settings().deal_views_enabled:
+        return
+    affected = [
+        before["_id"]
+        for before, after in changes
+        if before is not None and (after is None or after.get("name") != before.get("name"))
+    ]
+    if affected:
+        await refresh_deal_views(db, {"company_id": {"$in": affected}})
+
+
+async def apply_customer_changes(db, changes: List[Change]) -> None:
+    """Refresh the deals listing edited or deleted customers as contacts."""
+    if not get_settings().deal_views_enabled:
+        return
+    affected = [
+        before["_id"]
+        for before, after in changes
+        if before is not None and (after is None or any(after.get(f) != before.get(f) for f in CONTACT_FIELDS))
+    ]
+    if affected:
+        await refresh_deal_views(db, {"contact_ids": {"$in": affected}})
+
+
+async def rebuild_deal_views(db) -> int:
+    """Replace the whole projection from the deals collection ($out keeps its indexes)."""
+    await db.deals.aggregate(deal_response_pipeline({}) + [{"$out": VIEW_COLLECTION}]).to_list(length=None)
+    return await db[VIEW_COLLECTION].estimated_document_count()
+
+
+async def ensure_deal_views(db) -> None:
+    """Build the projection on startup if it is enabled but clearly out of step (e.g. just switched on)."""
+    if not get_settings().deal_views_enabled:
+        return
+    if await db[VIEW_COLLECTION].estimated_document_count() != await db.deals.estimated_document_count():
+        await rebuild_deal_views(db)
+
+
+async def check_deal_views(db, max_examples: int = 20) -> dict:
+    """Compare every stored view with a freshly computed one, walking both in _id order."""
+    expected = db.deals.aggregate(deal_response_pipeline({}, sort=[("_id", 1)]))
+    stored = db[VIEW_COLLECTION].find({}).sort("_id", 1)
+    report = {"checked": 0, "missing": 0, "stale": 0, "orphaned": 0, "examples": []}
+
+    def note(kind: str, doc: dict) -> None:
+        report[kind] += 1
+        if len(report["examples"]) < max_examples:
+            report["examples"].append({"problem": kind, "deal_id": str(doc["_id"])})
+
+    want = await anext(expected, None)
+    have = await anext(stored, None)
+    while want is not None or have is not None:
+        if have is None or (want is not None and want["_id"] < have["_id"]):
+            note("missing", want)
+            want = await anext(expected, None)
+        elif want is None or have["_id"] < want["_id"]:
+            note("orphaned", have)
+            have = await anext(stored, None)
+        else:
+            report["checked"] += 1
+            if want != have:
+                note("stale", want)
+            want = await anext(expected, None)
+            have = await anext(stored, None)
+    return report
+
+
+async def _main(command: str) -> int:
+    from app.database import close_db, get_db
+
+    db = await get_db()
+    try:
+        if command == "rebuild":
+            print(f"Rebuilt {await rebuild_deal_views(db)} deal views")
+            return 0
+        report = await check_deal_views(db)
+        for example in report["examples"]:
+            print(f"{example['problem']:>8}  {example['deal_id']}")
+        print(
+            f"Checked {report['checked']} deal views: {report['missing']} missing, "
+            f"{report['stale']} stale, {report['orphaned']} orphaned"
+        )
+        return 1 if report["missing"] or report["stale"] or report["orphaned"] else 0
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or verify the deal_views projection.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    sys.exit(asyncio.run(_main(parser.parse_args().command)))
@@ -0,0 +1,98 @@
+"""
+Streaming NDJSON/CSV exports.
+
+Rows are read from a Mongo cursor in batches of `export_batch_size`,
+serialized one at a time and flushed to the client in ~64 KB chunks,
+optionally gzip-compressed on the fly. Nothing holds more than one batch
+in memory, and the cursor is closed as soon as the client goes away.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator, Callable, List
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.config import get_settings
+
+FLUSH_BYTES = 64 * 1024
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ";".join(str(v) for v in value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+async def serialize_rows(cursor, columns: List[str], to_row: Callable[[dict], dict], fmt: str) -> AsyncIterator[str]:
+    """Yield serialized text in chunks of roughly FLUSH_BYTES, closing the cursor on exit."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    try:
+        if writer:
+            writer.writerow(columns)
+        async for doc in cursor:
+            row = to_row(doc)
+            if writer:
+                writer.writerow([_csv_value(row.get(column)) for column in columns])
+            else:
+                buffer.write(json.dumps({column: row.get(column) for column in columns}, default=_json_default))
+                buffer.write("\n")
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        # Runs on completion and when the client disconnects mid-stream
+        await cursor.close()
+
+
+async def _encode(chunks: AsyncIterator[str], compress: bool) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    async for chunk in chunks:
+        data = chunk.encode("utf-8")
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def export_response(
+    cursor, columns: List[str], to_row: Callable[[dict], dict], fmt: str, compress: bool, filename: str
+) -> StreamingResponse:
+    """Stream `cursor` as an NDJSON or CSV download."""
+    cursor.batch_size(get_settings().export_batch_size)
+    filename = f"{filename}.{fmt}" + (".gz" if compress else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    media_type = MEDIA_TYPES[fmt]
+    if compress:
+        media_type = "application/gzip"
+    return StreamingResponse(
+        _encode(serialize_rows(cursor, columns, to_row, fmt), compress),
+        media_type=media_type,
+        headers=headers,
+        # Starlette runs this right after the stream ends or the client disconnects,
+        # even if the generators above are only finalized later
+        background=BackgroundTask(cursor.close),
+    )
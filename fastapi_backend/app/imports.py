@@ -0,0 +1,268 @@
+"""
+Background CSV imports for companies and customers.
+
+The upload is spooled to a temporary file and parsed by a background task in
+chunks of `import_chunk_rows` rows; file reads and CSV parsing run in a
+worker thread so the event loop never blocks. Each chunk is validated
+against the resource's Create schema and written with one insert_many, so
+memory use depends on the chunk size, not the file size. Customer rows may
+reference their company by `company_id` or by `company_name`; both are
+resolved with one batched query per chunk through a per-job cache.
+"""
+
+import asyncio
+import csv
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
+from app.activity import record_activity
+from app.cache import TTLCache
+from app.config import get_settings
+from app.models.activity_log import ActionType
+from app.response_cache import response_cache
+from app.routers.companies import CompanyCreate
+from app.routers.customers import CustomerCreate
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# (line number in the file, stored document or None, error or None)
+PreparedRow = Tuple[int, Optional[dict], Optional[str]]
+
+
+@dataclass
+class ImportJob:
+    id: str
+    resource: str
+    filename: str
+    status: str = "queued"  # queued, running, completed, failed
+    rows_processed: int = 0
+    inserted: int = 0
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)  # First `import_max_reported_errors` row errors
+    error: Optional[str] = None  # Set when the whole job failed
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < get_settings().import_max_reported_errors:
+            self.errors.append({"row": line, "error": message})
+
+
+class ImportJobStore:
+    """Job statuses for this process; the oldest finished jobs are forgotten first."""
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def create(self, resource: str, filename: str) -> ImportJob:
+        job = ImportJob(id=uuid.uuid4().hex, resource=resource, filename=filename)
+        self._jobs[job.id] = job
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        while len(self._jobs) > self.max_jobs and finished:
+            del self._jobs[finished.pop(0)]
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self._jobs.get(job_id)
+
+    def track(self, job: ImportJob, task: asyncio.Task) -> None:
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def cancel_all(self) -> None:
+        """Stop running imports (on shutdown); rows already written stay written."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+import_jobs = ImportJobStore(max_jobs=get_settings().import_max_jobs)
+_job_slots = asyncio.Semaphore(get_settings().import_max_concurrent_jobs)
+
+
+def _validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+def _schema_fields(row: dict, schema) -> dict:
+    """Columns known to `schema`, with blank cells treated as missing."""
+    return {
+        key: value.strip()
+        for key, value in row.items()
+        if key in schema.model_fields and value is not None and value.strip()
+    }
+
+
+class CompanyResolver:
+    """Resolves company names and IDs for one import, caching hits and misses."""
+
+    def __init__(self, db):
+        settings = get_settings()
+        self._companies = db.companies
+        self.cache = TTLCache(maxsize=settings.import_company_cache_size, ttl=settings.import_company_cache_ttl_seconds)
+
+    async def resolve(self, keys: List[Tuple[str, object]]) -> Dict[Tuple[str, object], Optional[ObjectId]]:
+        """Map ("name", name) / ("id", ObjectId) keys to company IDs (None if missing)."""
+        resolved = {}
+        misses = set()
+        for key in keys:
+            value = self.cache.get(key, _MISSING)
+            if value is _MISSING:
+                misses.add(key)
+            else:
+                resolved[key] = value
+        if misses:
+            names = [value for kind, value in misses if kind == "name"]
+            ids = [value for kind, value in misses if kind == "id"]
+            query = {"$or": [{"name": {"$in": names}}, {"_id": {"$in": ids}}]}
+            found = {}
+            # Sorted by _id so that, for duplicate names, the oldest company wins
+            async for company in self._companies.find(query, {"name": 1}).sort("_id", 1):
+                found.setdefault(("name", company["name"]), company["_id"])
+                found[("id", company["_id"])] = company["_id"]
+            for key in misses:
+                resolved[key] = found.get(key)
+                self.cache.set(key, resolved[key])
+        return resolved
+
+
+async def prepare_companies(db, rows: List[Tuple[int, dict]], resolver: CompanyResolver) -> List[PreparedRow]:
+    prepared = []
+    for line, row in rows:
+        try:
+            prepared.append((line, CompanyCreate(**_schema_fields(row, CompanyCreate)).model_dump(), None))
+        except ValidationError as e:
+            prepared.append((line, None, _validation_message(e)))
+    return prepared
+
+
+async def prepare_customers(db, rows: List[Tuple[int, dict]], resolver: CompanyResolver) -> List[PreparedRow]:
+    """Validate customer rows; `company_id` wins over `company_name` when both are given."""
+    keyed = []
+    for line, row in rows:
+        company_id = (row.get("company_id") or "").strip()
+        company_name = (row.get("company_name") or "").strip()
+        if company_id:
+            try:
+                key = ("id", ObjectId(company_id))
+            except InvalidId:
+                keyed.append((line, row, None, "Invalid company_id"))
+                continue
+        elif company_name:
+            key = ("name", company_name)
+        else:
+            keyed.append((line, row, None, "company_id or company_name is required"))
+            continue
+        keyed.append((line, row, key, None))
+
+    companies = await resolver.resolve([key for _, _, key, _ in keyed if key])
+    prepared = []
+    for line, row, key, error in keyed:
+        if error:
+            prepared.append((line, None, error))
+            continue
+        company = companies.get(key)
+        if company is None:
+            prepared.append((line, None, f"Company not found: {key[1]}"))
+            continue
+        try:
+            customer = CustomerCreate(**{**_schema_fields(row, CustomerCreate), "company_id": str(company)}).model_dump()
+        except ValidationError as e:
+            prepared.append((line, None, _validation_message(e)))
+            continue
+        customer["company_id"] = company
+        prepared.append((line, customer, None))
+    return prepared
+
+
+IMPORTERS = {
+    "companies": ("companies", "company", prepare_companies),
+    "customers": ("customers", "customer", prepare_customers),
+}
+
+
+def _read_chunk(reader: csv.DictReader, size: int) -> List[Tuple[int, dict]]:
+    """Next `size` rows with the line each one ends on (runs in a worker thread)."""
+    rows = []
+    for row in islice(reader, size):
+        rows.append((reader.line_num, row))
+    return rows
+
+
+async def _write_chunk(collection, model_name: str, job: ImportJob, prepared: List[PreparedRow]) -> None:
+    for line, _, error in prepared:
+        if error:
+            job.add_error(line, error)
+    valid = [(line, doc) for line, doc, error in prepared if not error]
+    if not valid:
+        return
+    try:
+        # insert_many assigns _id to each document, so the cache tags below can name them
+        await collection.insert_many([doc for _, doc in valid], ordered=False)
+        job.inserted += len(valid)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        job.inserted += len(valid) - len(write_errors)
+        for write_error in write_errors:
+            job.add_error(valid[write_error["index"]][0], write_error.get("errmsg", "Write failed"))
+    finally:
+        await response_cache.invalidate_changes(model_name, [(None, doc) for _, doc in valid if "_id" in doc])
+
+
+async def run_import(job: ImportJob, path: str, db, user=None) -> None:
+    """Parse, validate and insert the spooled CSV at `path`, then remove it."""
+    collection_name, model_name, prepare = IMPORTERS[job.resource]
+    collection = db[collection_name]
+    chunk_rows = get_settings().import_chunk_rows
+    try:
+        async with _job_slots:
+            job.status = "running"
+            resolver = CompanyResolver(db)
+            with await asyncio.to_thread(open, path, newline="", encoding="utf-8-sig") as f:
+                reader = csv.DictReader(f)
+                while True:
+                    rows = await asyncio.to_thread(_read_chunk, reader, chunk_rows)
+                    if not rows:
+                        break
+                    await _write_chunk(collection, model_name, job, await prepare(db, rows, resolver))
+                    job.rows_processed += len(rows)
+            job.status = "completed"
+    except (csv.Error, UnicodeDecodeError, PyMongoError) as e:
+        job.status = "failed"
+        job.error = str(e)
+        logger.warning("Import %s failed after %d rows: %s", job.id, job.rows_processed, e)
+    except asyncio.CancelledError:
+        job.status = "failed"
+        job.error = "Import was interrupted"
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.error = f"Import failed unexpectedly: {e}"
+        logger.exception("Import %s failed after %d rows", job.id, job.rows_processed)
+    finally:
+        job.finished_at = datetime.utcnow()
+        await asyncio.to_thread(os.remove, path)
+        if job.inserted:
+            summary = f"Imported {job.inserted} {job.resource} from {job.filename}"
+            await record_activity(ActionType.create, model_name, job.id, summary, user)
@@ -0,0 +1,155 @@
+"""
+Index reconciliation for the Beanie document models.
+
+Each model declares its indexes in `Settings.indexes`; `sync_indexes` compares
+them with what exists in MongoDB and creates, rebuilds or (optionally) drops
+indexes so the database matches the declarations. Run
+
+    python -m app.indexes            # print the diff
+    python -m app.indexes --apply    # apply it
+
+from the fastapi_backend directory to inspect or apply the plan by hand.
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Index options that make two indexes with the same keys different
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+@dataclass
+class IndexChange:
+    collection: str
+    action: str  # "create", "rebuild", "collmod" or "drop"
+    name: str
+    spec: Optional[IndexModel] = None
+    replaces: Optional[str] = None  # Existing index over the same keys under another name
+
+    def describe(self) -> str:
+        detail = f" {dict(self.spec.document['key'])}" if self.spec else ""
+        replaced = f" (replaces {self.replaces})" if self.replaces else ""
+        return f"{self.action:8} {self.collection}.{self.name}{detail}{replaced}"
+
+
+def _normalize(info: dict) -> dict:
+    """Reduce index info (declared or from index_information) to comparable fields."""
+    normalized = {"key": [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+                          for field, direction in info["key"]]}
+    for option in COMPARED_OPTIONS:
+        if info.get(option) not in (None, False):
+            normalized[option] = info[option]
+    return normalized
+
+
+async def plan_indexes(db, models: list, drop_unknown: bool = False) -> List[IndexChange]:
+    """Compute the changes needed to bring the database in line with the models."""
+    changes = []
+    for model in models:
+        collection = model.Settings.name
+        declared = {idx.document["name"]: idx for idx in getattr(model.Settings, "indexes", [])}
+        existing = await db[collection].index_information()
+        replaced = set()
+
+        for name, idx in declared.items():
+            document = dict(idx.document, key=list(idx.document["key"].items()))
+            wanted = _normalize(document)
+            if name not in existing:
+                # MongoDB refuses a second index over the same keys with other
+                # options, so an undeclared one with those keys is replaced
+                same_keys = next((other for other, info in existing.items()
+                                  if other != "_id_" and other not in declared
+                                  and _normalize(info)["key"] == wanted["key"]), None)
+                if same_keys:
+                    replaced.add(same_keys)
+                    changes.append(IndexChange(collection, "rebuild", name, idx, replaces=same_keys))
+                else:
+                    changes.append(IndexChange(collection, "create", name, idx))
+                continue
+            current = _normalize(existing[name])
+            if current == wanted:
+                continue
+            # TTL values can be changed in place; anything else, including
+            # turning a plain index into a TTL one, needs a rebuild
+            same_but_ttl = {k: v for k, v in current.items() if k != "expireAfterSeconds"} == \
+                {k: v for k, v in wanted.items() if k != "expireAfterSeconds"}
+            in_place = same_but_ttl and "expireAfterSeconds" in wanted and "expireAfterSeconds" in current
+            changes.append(IndexChange(collection, "collmod" if in_place else "rebuild", name, idx))
+
+        if drop_unknown:
+            for name in existing:
+                if name != "_id_" and name not in declared and name not in replaced:
+                    changes.append(IndexChange(collection, "drop", name))
+    return changes
+
+
+async def apply_index_changes(db, changes: List[IndexChange]) -> List[IndexChange]:
+    """
+    Apply `changes` one by one and return those that succeeded. A change the
+    data rejects (e.g. a unique index over existing duplicates) is logged and
+    skipped so the remaining indexes are still reconciled.
+    """
+    applied = []
+    for change in changes:
+        logger.info("Index change: %s", change.describe())
+        try:
+            await _apply_index_change(db, change)
+        except OperationFailure as e:
+            logger.error("Index change failed: %s: %s", change.describe(), e)
+            continue
+        applied.append(change)
+    return applied
+
+
+async def _apply_index_change(db, change: IndexChange) -> None:
+    collection = db[change.collection]
+    if change.action == "create":
+        await collection.create_indexes([change.spec])
+    elif change.action == "rebuild":
+        await collection.drop_index(change.replaces or change.name)
+        await collection.create_indexes([change.spec])
+    elif change.action == "collmod":
+        await db.command({
+            "collMod": change.collection,
+            "index": {
+                "name": change.name,
+                "expireAfterSeconds": change.spec.document["expireAfterSeconds"],
+            },
+        })
+    elif change.action == "drop":
+        await collection.drop_index(change.name)
+
+
+async def sync_indexes(db, models: list, drop_unknown: bool = False) -> List[IndexChange]:
+    """Idempotently reconcile declared indexes; returns the changes applied."""
+    changes = await plan_indexes(db, models, drop_unknown)
+    return await apply_index_changes(db, changes)
+
+
+async def _main(apply: bool) -> None:
+    from app.config import get_settings
+    from app.database import DOCUMENT_MODELS, get_db
+
+    db = await get_db()
+    changes = await plan_indexes(db, DOCUMENT_MODELS, get_settings().mongo_drop_unknown_indexes)
+    if not changes:
+        print("Indexes are up to date")
+        return
+    for change in changes:
+        print(change.describe())
+    if apply:
+        applied = await apply_index_changes(db, changes)
+        print(f"Applied {len(applied)} of {len(changes)} index change(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or apply the MongoDB index diff")
+    parser.add_argument("--apply", action="store_true", help="apply the changes instead of only printing them")
+    asyncio.run(_main(parser.parse_args().apply))
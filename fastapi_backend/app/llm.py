@@ -1,57 +1,233 @@
-import os
-from openai import OpenAI
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import AsyncIterator, List, Optional
+from openai import AsyncOpenAI, APIConnectionError, APIError, APITimeoutError, InternalServerError, RateLimitError
+from app.cache import TTLCache
 from app.config import get_settings
+from app.chat_memory import estimate_tokens
+from app.llm_router import build_model_router
+from app.resilience import AdmissionLimiter, CircuitOpen, Overloaded, call_with_retries
 
+FALLBACK_REPLY = "I am having trouble answering right now. Try again in a moment."
 
-def get_llm_client():
-    settings = get_settings()
-    if not settings.openrouter_api_key:
-        print("WARNING: OPENROUTER_API_KEY is not set. LLM replies will fail.")
-        return None
+SYSTEM_PROMPT = (
+    "You are a helpful CRM assistant inside a web app.\n"
+    "You help a sales user create and manage deals.\n"
+    "You are inside a step-based flow but the user should not see that.\n"
+    "Keep replies short, clear, and conversational.\n"
+    "Do not mention prompts, tools, APIs, or OpenRouter.\n"
+)
+
+# One client per process so HTTP connections to OpenRouter are reused
+_client: Optional[AsyncOpenAI] = None
+
+# Replies to identical (model, system prompt, context, message) turns
+completion_cache = TTLCache(
+    maxsize=get_settings().llm_cache_size,
+    ttl=get_settings().llm_cache_ttl_seconds,
+    max_bytes=get_settings().llm_cache_max_bytes,
+    sizeof=lambda reply: len(reply.encode("utf-8")),
+)
+
+
+# Errors worth retrying; anything else means the request itself was rejected
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+llm_limiter = AdmissionLimiter(
+    max_concurrency=get_settings().llm_max_concurrency,
+    max_queue=get_settings().llm_max_queue,
+)
+# Picks the model (and fallbacks) per call; holds one circuit breaker per model
+model_router = build_model_router()
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def completion_cache_key(user_prompt: str, context_note: str) -> str:
+    # Keyed on the configured model set, so routing decisions don't split the cache
+    model = ",".join(route.name for route in model_router.routes)
+    payload = json.dumps([model, _normalize(SYSTEM_PROMPT), _normalize(context_note), _normalize(user_prompt)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_llm_client() -> Optional[AsyncOpenAI]:
+    global _client
+    if _client is None:
+        settings = get_settings()
+        if not settings.openrouter_api_key:
+            print("WARNING: OPENROUTER_API_KEY is not set. LLM replies will fail.")
+            return None
+        
+        _client = AsyncOpenAI(
+            base_url=settings.openrouter_base_url,
+            api_key=settings.openrouter_api_key,
+            max_retries=0,  # retries are handled by call_with_retries
+            default_headers={
+                "HTTP-Referer": settings.openrouter_site_url,
+                "X-Title": settings.openrouter_site_name,
+            },
+        )
+    return _client
+
+
+async def close_llm_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+    _client = None
+
+
+def build_messages(user_prompt: str, context_note: str = "") -> List[dict]:
+    if context_note:
+        combined = context_note + "\n\n" + user_prompt
+    else:
+        combined = user_prompt
     
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=settings.openrouter_api_key,
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": combined},
+    ]
+
+
+async def _create_completion(client: AsyncOpenAI, model: str, **kwargs):
+    """Start a completion on `model` under the deadline, retry and breaker policy."""
+    settings = get_settings()
+    return await call_with_retries(
+        lambda: client.chat.completions.create(model=model, **kwargs),
+        model_router.breakers[model],
+        timeout=settings.llm_timeout_seconds,
+        retries=settings.llm_max_retries,
+        backoff_base=settings.llm_backoff_base_seconds,
+        backoff_cap=settings.llm_backoff_max_seconds,
+        retry_on=RETRYABLE_ERRORS,
     )
 
 
-def generate_reply(user_prompt: str, context_note: str = "") -> str:
+async def generate_reply(user_prompt: str, context_note: str = "", use_cache: bool = True) -> str:
     """
-    Call OpenRouter (openai/gpt-4o-mini) and return a short conversational reply.
+    Call OpenRouter and return a short conversational reply.
+    Identical turns are answered from the completion cache unless `use_cache` is off.
+    The model is chosen by the router; on failure the next model in its chain is tried.
     """
-    settings = get_settings()
     client = get_llm_client()
     
     if client is None:
-        return "I am having trouble answering right now. Try again in a moment."
-    
-    system_content = (
-        "You are a helpful CRM assistant inside a web app.\n"
-        "You help a sales user create and manage deals.\n"
-        "You are inside a step-based flow but the user should not see that.\n"
-        "Keep replies short, clear, and conversational.\n"
-        "Do not mention prompts, tools, APIs, or OpenRouter.\n"
-    )
+        return FALLBACK_REPLY
+    
+    cache_key = completion_cache_key(user_prompt, context_note)
+    if use_cache:
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    messages = build_messages(user_prompt, context_note)
+    chain = model_router.route(sum(estimate_tokens(m["content"]) for m in messages))
+    
+    try:
+        async with llm_limiter.slot():
+            for position, model in enumerate(chain):
+                model_router.record_selection(model, fallback=position > 0)
+                started = time.perf_counter()
+                try:
+                    completion = await _create_completion(client, model, messages=messages, temperature=0.6)
+                except (CircuitOpen, asyncio.TimeoutError, *RETRYABLE_ERRORS) as e:
+                    if not isinstance(e, CircuitOpen):
+                        model_router.record_failure(model)
+                    print(f"LLM model {model} failed ({type(e).__name__}), trying next")
+                    continue
+                model_router.record_success(model, time.perf_counter() - started)
+                reply = completion.choices[0].message.content.strip()
+                if use_cache:
+                    completion_cache.set(cache_key, reply)
+                return reply
+        return FALLBACK_REPLY
+    except Overloaded:
+        print("LLM call rejected: Overloaded")
+        return FALLBACK_REPLY
+    except Exception as e:
+        print("OpenRouter error:", e)
+        return FALLBACK_REPLY
 
-    if context_note:
-        combined = context_note + "\n\n" + user_prompt
-    else:
-        combined = user_prompt
 
+async def stream_reply(user_prompt: str, context_note: str = "", use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    Like generate_reply, but yield the reply in pieces as the model produces them.
+    A cached reply is yielded in one piece. Models are only switched before the
+    first piece has been sent.
+    """
+    settings = get_settings()
+    client = get_llm_client()
+    
+    if client is None:
+        yield FALLBACK_REPLY
+        return
+    
+    cache_key = completion_cache_key(user_prompt, context_note)
+    if use_cache:
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    messages = build_messages(user_prompt, context_note)
+    chain = model_router.route(sum(estimate_tokens(m["content"]) for m in messages))
+    
+    parts = []
     try:
-        completion = client.chat.completions.create(
-            model="openai/gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": combined},
-            ],
-            temperature=0.6,
-            extra_headers={
-                "HTTP-Referer": settings.openrouter_site_url,
-                "X-Title": settings.openrouter_site_name,
-            },
-        )
-        return completion.choices[0].message.content.strip()
+        async with llm_limiter.slot():
+            for position, model in enumerate(chain):
+                model_router.record_selection(model, fallback=position > 0)
+                started = time.perf_counter()
+                try:
+                    stream = await _create_completion(
+                        client, model, messages=messages, temperature=0.6, stream=True,
+                    )
+                except (CircuitOpen, asyncio.TimeoutError, *RETRYABLE_ERRORS) as e:
+                    # call_with_retries has already reported these to the breaker
+                    if not isinstance(e, CircuitOpen):
+                        model_router.record_failure(model)
+                    print(f"LLM model {model} failed ({type(e).__name__}), trying next")
+                    continue
+                try:
+                    # Closing the stream returns its connection to the pool, also when the
+                    # client disconnects (GeneratorExit at the yield) or a chunk times out
+                    async with stream:
+                        chunks = stream.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), settings.llm_timeout_seconds)
+                            except StopAsyncIteration:
+                                break
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta:
+                                if not parts:
+                                    # Time to first token is what the user feels
+                                    model_router.record_success(model, time.perf_counter() - started)
+                                parts.append(delta)
+                                yield delta
+                except (asyncio.TimeoutError, APIError) as e:
+                    # Failed mid-stream (stalled, cut off or an error event), after
+                    # call_with_retries reported success
+                    model_router.record_failure(model)
+                    model_router.breakers[model].record_failure()
+                    if parts:
+                        raise
+                    print(f"LLM model {model} failed ({type(e).__name__}), trying next")
+                    continue
+                if use_cache and parts:
+                    completion_cache.set(cache_key, "".join(parts).strip())
+                break
+        if not parts:
+            yield FALLBACK_REPLY
+    except Overloaded:
+        print("LLM call rejected: Overloaded")
+        yield FALLBACK_REPLY
     except Exception as e:
         print("OpenRouter error:", e)
-        return "I am having trouble answering right now. Try again in a moment."
+        if not parts:
+            yield FALLBACK_REPLY
@@ -0,0 +1,146 @@
+"""
+Latency-aware model routing for the LLM layer.
+
+Models are configured in preference order (`LLM_MODELS`, entries
+"name" or "name@max_prompt_tokens"). For each call the router drops models
+whose prompt limit is too small, then orders the rest: healthy models in
+preference order first, then models that are slow (rolling p95 over
+`LLM_SLOW_P95_SECONDS`) or erroring, fastest first. Models whose circuit
+breaker is open go last. The caller walks the list as a fallback chain.
+"""
+
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List
+from app.config import get_settings
+from app.resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Minimum samples before latency statistics influence routing
+MIN_LATENCY_SAMPLES = 5
+
+
+@dataclass
+class ModelRoute:
+    name: str
+    max_prompt_tokens: int
+
+
+class ModelStats:
+    """Rolling latency and error statistics for one model."""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.selected = 0
+        self.fallbacks = 0
+
+    def record(self, latency: float = None, error: bool = False) -> None:
+        self.calls += 1
+        self.errors += int(error)
+        self.outcomes.append(not error)
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    @property
+    def error_ratio(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "recent_error_ratio": self.error_ratio,
+            "p50_seconds": self.percentile(0.50),
+            "p95_seconds": self.percentile(0.95),
+            "selected_as_primary": self.selected,
+            "used_as_fallback": self.fallbacks,
+        }
+
+
+class ModelRouter:
+    def __init__(self, routes: List[ModelRoute], slow_p95_seconds: float, max_error_ratio: float, window: int):
+        settings = get_settings()
+        self.routes = routes
+        self.slow_p95_seconds = slow_p95_seconds
+        self.max_error_ratio = max_error_ratio
+        self.stats: Dict[str, ModelStats] = {r.name: ModelStats(window) for r in routes}
+        self.breakers: Dict[str, CircuitBreaker] = {
+            r.name: CircuitBreaker(
+                failure_ratio=settings.llm_breaker_failure_ratio,
+                min_calls=settings.llm_breaker_min_calls,
+                window=settings.llm_breaker_window,
+                reset_seconds=settings.llm_breaker_reset_seconds,
+                probe_timeout=settings.llm_breaker_probe_timeout_seconds,
+            )
+            for r in routes
+        }
+
+    def _is_degraded(self, name: str) -> bool:
+        stats = self.stats[name]
+        slow = len(stats.latencies) >= MIN_LATENCY_SAMPLES and stats.percentile(0.95) > self.slow_p95_seconds
+        return slow or stats.error_ratio > self.max_error_ratio
+
+    def route(self, prompt_tokens: int) -> List[str]:
+        """Fallback chain for a prompt of `prompt_tokens`, best candidate first."""
+        fitting = [r.name for r in self.routes if prompt_tokens <= r.max_prompt_tokens]
+        if not fitting:
+            # Nothing advertises a large enough window; let the largest try
+            fitting = [max(self.routes, key=lambda r: r.max_prompt_tokens).name]
+
+        open_circuit = [n for n in fitting if self.breakers[n].state == CircuitBreaker.OPEN]
+        available = [n for n in fitting if n not in open_circuit]
+        healthy = [n for n in available if not self._is_degraded(n)]
+        degraded = sorted((n for n in available if n not in healthy), key=lambda n: self.stats[n].percentile(0.95))
+        chain = healthy + degraded + open_circuit
+
+        if chain[0] != self.routes[0].name:
+            logger.info("LLM routing: %s chosen over %s (prompt ~%d tokens)", chain[0], self.routes[0].name, prompt_tokens)
+        return chain
+
+    def record_selection(self, name: str, fallback: bool) -> None:
+        if fallback:
+            self.stats[name].fallbacks += 1
+        else:
+            self.stats[name].selected += 1
+
+    def record_success(self, name: str, latency: float) -> None:
+        self.stats[name].record(latency=latency)
+
+    def record_failure(self, name: str) -> None:
+        self.stats[name].record(error=True)
+
+    def snapshot(self) -> dict:
+        return {
+            name: {**self.stats[name].snapshot(), "breaker": self.breakers[name].stats()}
+            for name in self.stats
+        }
+
+
+def parse_routes(spec: str, default_model: str, default_max_prompt_tokens: int) -> List[ModelRoute]:
+    """Parse "model[@max_prompt_tokens], ..." into routes; falls back to the single default model."""
+    routes = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, limit = entry.partition("@")
+        routes.append(ModelRoute(name=name.strip(), max_prompt_tokens=int(limit) if limit else default_max_prompt_tokens))
+    return routes or [ModelRoute(name=default_model, max_prompt_tokens=default_max_prompt_tokens)]
+
+
+def build_model_router() -> ModelRouter:
+    settings = get_settings()
+    return ModelRouter(
+        parse_routes(settings.llm_models, settings.llm_model, settings.llm_default_max_prompt_tokens),
+        slow_p95_seconds=settings.llm_slow_p95_seconds,
+        max_error_ratio=settings.llm_max_error_ratio,
+        window=settings.llm_stats_window,
+    )
@@ -1,9 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.database import init_db
-from app.routers import companies, customers, deals, auth, dashboard, deal_chat, activity_log
+from app.database import init_db, close_db
+from app.azure_auth import close_http_client
+from app.activity import activity_writer
+from app.auth import shutdown_password_executor
+from app.cache import get_invalidation_bus
+from app.deal_views import ensure_deal_views
+from app.rollups import normalize_stages
+from app.response_cache import response_cache
+from app.imports import import_jobs
+from app.llm import close_llm_client
+from app.routers import companies, customers, deals, auth, dashboard, deal_chat, activity_log, metrics, imports
 from app.config import get_settings
+from app.pagination import NEXT_CURSOR_HEADER
 import os
 
 
@@ -12,13 +22,25 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
     # Startup: Initialize database connection
     try:
-        await init_db()
+        db = await init_db()
+        await ensure_deal_views(db)
+        await get_invalidation_bus().start(db)
+        activity_writer.start(db)
+        await response_cache.start(db)
+        await normalize_stages(db)
         print("Database initialized successfully")
     except Exception as e:
         print(f"Warning: Database initialization failed: {e}")
         print("API will start but database operations may fail")
     yield
-    # Shutdown: nothing to clean up (motor handles connection pooling)
+    # Shutdown: stop background tasks, then close the shared MongoDB client and its pool
+    await import_jobs.cancel_all()
+    await activity_writer.stop()
+    await get_invalidation_bus().stop()
+    close_db()
+    await close_http_client()
+    shutdown_password_executor()
+    await close_llm_client()
 
 
 app = FastAPI(
@@ -40,6 +62,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Include routers
@@ -50,6 +73,8 @@ app.include_router(deals.router, prefix="/api")
 app.include_router(dashboard.router, prefix="/api")
 app.include_router(deal_chat.router, prefix="/api")
 app.include_router(activity_log.router, prefix="/api")
+app.include_router(imports.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
 
 
 @app.get("/")
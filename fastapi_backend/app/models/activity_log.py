@@ -1,5 +1,7 @@
 from beanie import Document, PydanticObjectId
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from pymongo import DESCENDING, IndexModel
+from app.config import get_settings
 from typing import Optional
 from datetime import datetime
 from enum import Enum
@@ -11,17 +13,39 @@ class ActionType(str, Enum):
     delete = "Delete"
 
 
+def _retention_index() -> IndexModel:
+    """
+    TTL index on action_time; retention of 0 days keeps logs forever. It keeps
+    the name of the plain action_time index it replaces so existing databases
+    get it converted in place instead of a conflicting second index.
+    """
+    days = get_settings().activity_log_retention_days
+    if days > 0:
+        return IndexModel([("action_time", DESCENDING)], name="action_time_desc", expireAfterSeconds=days * 86400)
+    return IndexModel([("action_time", DESCENDING)], name="action_time_desc")
+
+
 class ActivityLog(Document):
-    user_id: PydanticObjectId
+    user_id: Optional[PydanticObjectId] = None  # None for unauthenticated requests
     user_name: str
     user_avatar: Optional[str] = None
     action_type: str
+    object_id: Optional[str] = None
     object_repr: str
     model: str
-    action_time: datetime = datetime.utcnow()
+    action_time: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
         name = "activity_logs"
+        indexes = [
+            _retention_index(),
+            # Keyset paging of the global feed and of one entity's timeline
+            IndexModel([("action_time", DESCENDING), ("_id", DESCENDING)], name="action_time_id"),
+            IndexModel(
+                [("model", DESCENDING), ("object_id", DESCENDING), ("action_time", DESCENDING), ("_id", DESCENDING)],
+                name="model_object_action_time_id",
+            ),
+        ]
 
 
 class ActivityLogResponse(BaseModel):
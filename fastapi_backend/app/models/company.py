@@ -1,4 +1,5 @@
 from beanie import Document
+from pymongo import ASCENDING, IndexModel
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from enum import Enum
@@ -38,12 +39,16 @@ class Company(Document):
     website: Optional[str] = None
     industry: Optional[str] = None
     location: Optional[str] = None
+    version: int = 0  # Bumped on every write; missing means 0
 
     def industry_color(self) -> str:
         return INDUSTRY_COLORS.get(self.industry, "default")
 
     class Settings:
         name = "companies"
+        indexes = [
+            IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name_id"),
+        ]
 
 
 # Pydantic schemas for request/response
@@ -1,5 +1,6 @@
 from beanie import Document, PydanticObjectId
 from pydantic import BaseModel, EmailStr, Field
+from pymongo import ASCENDING, IndexModel
 from typing import Optional
 
 
@@ -9,9 +10,14 @@ class Customer(Document):
     phone_number: Optional[str] = None
     position: Optional[str] = None
     company_id: PydanticObjectId  # Reference to Company
+    version: int = 0  # Bumped on every write; missing means 0
 
     class Settings:
         name = "customers"
+        indexes = [
+            IndexModel([("company_id", ASCENDING), ("_id", ASCENDING)], name="company_id_id"),
+            IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name_id"),
+        ]
 
 
 # Pydantic schemas for request/response
@@ -1,5 +1,6 @@
 from beanie import Document, PydanticObjectId
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
 from typing import Optional, List
 from datetime import date
 from enum import Enum
@@ -18,9 +19,18 @@ class Deal(Document):
     stage: str = "proposal"
     close_date: Optional[date] = None
     contact_ids: List[PydanticObjectId] = []  # References to Customers
+    position: Optional[float] = None  # Order within the stage column on the board
+    version: int = 0  # Bumped on every write; missing means 0
 
     class Settings:
         name = "deals"
+        indexes = [
+            IndexModel([("company_id", ASCENDING)], name="company_id"),
+            IndexModel([("contact_ids", ASCENDING)], name="contact_ids"),
+            IndexModel([("amount", ASCENDING), ("_id", ASCENDING)], name="amount_id"),
+            IndexModel([("close_date", ASCENDING), ("_id", ASCENDING)], name="close_date_id"),
+            IndexModel([("stage", ASCENDING), ("position", ASCENDING), ("_id", ASCENDING)], name="stage_position_id"),
+        ]
 
 
 # Pydantic schemas for request/response
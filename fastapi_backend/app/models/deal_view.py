@@ -0,0 +1,23 @@
+from beanie import Document
+from pymongo import ASCENDING, IndexModel
+from typing import List, Optional
+
+
+class DealView(Document):
+    """Denormalized deal in the DealResponse shape (plus `id` as a string), maintained by app.deal_views."""
+
+    title: str
+    amount: float = 0.0
+    company_id: str = ""
+    company_name: Optional[str] = None
+    stage: str = "NEW"
+    close_date: Optional[str] = None
+    contacts: List[dict] = []
+    version: int = 0
+
+    class Settings:
+        name = "deal_views"
+        indexes = [
+            IndexModel([("amount", ASCENDING), ("_id", ASCENDING)], name="amount_id"),
+            IndexModel([("close_date", ASCENDING), ("_id", ASCENDING)], name="close_date_id"),
+        ]
@@ -1,5 +1,6 @@
 from beanie import Document
 from pydantic import BaseModel, EmailStr
+from pymongo import ASCENDING, IndexModel
 from typing import Optional
 from datetime import datetime
 
@@ -15,6 +16,17 @@ class User(Document):
 
     class Settings:
         name = "users"
+        indexes = [
+            IndexModel([("username", ASCENDING)], name="username", unique=True),
+            IndexModel([("email", ASCENDING)], name="email", unique=True),
+            # SSO users only; password users have no azure_oid
+            IndexModel(
+                [("azure_oid", ASCENDING)],
+                name="azure_oid",
+                unique=True,
+                partialFilterExpression={"azure_oid": {"$type": "string"}},
+            ),
+        ]
 
 
 # Pydantic schemas for request/response
@@ -0,0 +1,75 @@
+"""
+Keyset (cursor) pagination helpers shared by the list endpoints.
+
+Pages are ordered by a sort key with `_id` as tie-breaker, and the opaque
+cursor carries the last row's (sort value, _id) so the next page starts with
+an index seek instead of a skip.
+"""
+
+import base64
+from typing import Any, List, Optional, Tuple
+from bson import json_util
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+# Page size when `limit` is omitted; the lists were capped at this before they were paged
+DEFAULT_PAGE_SIZE = 1000
+
+
+def encode_cursor(sort_field: str, doc: dict) -> str:
+    """Build an opaque cursor pointing just after `doc`."""
+    raw = json_util.dumps({"s": sort_field, "v": doc.get(sort_field), "id": doc["_id"]})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str) -> Tuple[Any, Any]:
+    """Return the (sort value, _id) encoded in `cursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if data["s"] != sort_field:
+            raise ValueError("cursor was issued for a different sort")
+        return data["v"], data["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(sort_field: str, cursor: Optional[str], descending: bool = False) -> dict:
+    """Filter matching rows strictly after the cursor position."""
+    if not cursor:
+        return {}
+    value, last_id = decode_cursor(cursor, sort_field)
+    op = "$lt" if descending else "$gt"
+    if sort_field == "_id":
+        return {"_id": {op: last_id}}
+    if value is None:
+        # Missing values sort before everything else in ascending order
+        after_nulls = [] if descending else [{sort_field: {"$ne": None}}]
+        return {"$or": [{sort_field: None, "_id": {op: last_id}}, *after_nulls]}
+    before_nulls = [{sort_field: None}] if descending else []
+    return {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: last_id}},
+        *before_nulls,
+    ]}
+
+
+def sort_spec(sort_field: str, descending: bool = False) -> List[Tuple[str, int]]:
+    direction = -1 if descending else 1
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+
+def trim_page(docs: list, limit: Optional[int], sort_field: str) -> Tuple[list, Optional[str]]:
+    """Split a `limit + 1` fetch into the page and the cursor for the next one."""
+    if limit is None or len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(sort_field, docs[-1])
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,175 @@
+"""
+Admission control, retry and circuit breaking for calls to slow or flaky
+upstream services (currently the LLM provider).
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+
+class Overloaded(Exception):
+    """Raised when the wait queue for an upstream is full."""
+
+
+class CircuitOpen(Exception):
+    """Raised when the circuit breaker is rejecting calls."""
+
+
+class AdmissionLimiter:
+    """Caps concurrent calls and how many callers may wait for a slot."""
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded()
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """
+    Opens when the failure ratio over the last `window` calls reaches
+    `failure_ratio` (after at least `min_calls`), rejects calls for
+    `reset_seconds`, then lets a single probe through (half-open) to decide
+    whether to close again. A probe that reports no outcome within
+    `probe_timeout` seconds is abandoned and the next caller probes instead.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_ratio: float, min_calls: int, window: int, reset_seconds: float, probe_timeout: float):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_seconds = reset_seconds
+        self.probe_timeout = probe_timeout
+        self._outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and (
+            not self._probe_in_flight or time.monotonic() - self._probe_started_at >= self.probe_timeout
+        ):
+            self._probe_in_flight = True
+            self._probe_started_at = time.monotonic()
+            return True
+        self.short_circuited += 1
+        return False
+
+    def release_probe(self) -> None:
+        """Give up a call that ended without an outcome (e.g. cancelled) so another probe can run."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "recent_calls": calls,
+            "recent_failure_ratio": self._outcomes.count(False) / calls if calls else 0.0,
+            "short_circuited": self.short_circuited,
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def call_with_retries(
+    func: Callable[[], Awaitable[T]],
+    breaker: CircuitBreaker,
+    timeout: float,
+    retries: int,
+    backoff_base: float,
+    backoff_cap: float,
+    retry_on: Tuple[Type[BaseException], ...],
+) -> T:
+    """
+    Run `func` with a per-attempt deadline, retrying `retry_on` errors with
+    jittered backoff. Every attempt's outcome feeds the breaker; an attempt
+    cancelled by the caller records none but frees the half-open probe.
+    """
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            raise CircuitOpen()
+        try:
+            result = await asyncio.wait_for(func(), timeout)
+        except (asyncio.TimeoutError, *retry_on):
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, backoff_base, backoff_cap))
+            continue
+        except Exception:
+            # The upstream answered (e.g. rejected the request), so it is healthy
+            breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled (e.g. the client disconnected): not the upstream's fault
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
@@ -0,0 +1,359 @@
+"""
+Response cache for hot read endpoints.
+
+Serialized responses are cached under a key made of the route, the query
+parameters and a scope (shared data uses "public"). Every entry carries
+tags naming the entities it contains ("company:<id>", "deal:<id>") and the
+lists whose membership or order it depends on ("companies", "deals"); write
+paths invalidate exactly the tags they affect. Concurrent misses for the
+same key share one computation.
+
+Backends, chosen by `response_cache_backend`:
+
+- "memory": per-process TTL + LRU store with a byte budget; invalidations
+  reach other workers through the cache invalidation bus, one message each
+- "mongo": one `response_cache` collection shared by all workers, expired
+  by a TTL index
+- "off" (default): responses are always computed
+
+A response computed while an invalidation happened (in any worker) is not
+kept: the memory backend counts invalidations received from the bus, and
+the mongo backend keeps a shared invalidation counter that each write is
+checked against.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from app.cache import TTLCache, get_invalidation_bus
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_CHANNEL = "responses"
+
+# List tag per entity kind: invalidated when an entity is created or deleted,
+# or when a field that orders lists or feeds dashboard totals changes
+LIST_TAGS = {"company": "companies", "customer": "customers", "deal": "deals"}
+LIST_FIELDS = {
+    "company": ("name",),
+    "customer": ("name",),
+    "deal": ("amount", "close_date", "stage"),
+}
+
+# List tags carried by every cached response that can embed an entity of each kind
+EMBEDDING_LISTS = {
+    "company": ("companies", "customers", "deals"),
+    "customer": ("customers", "deals"),
+    "deal": ("deals",),
+}
+# Larger invalidations are collapsed to list tags
+MAX_INVALIDATION_TAGS = 1000
+
+# (body, headers, tags)
+CachedResponse = Tuple[bytes, Dict[str, str], List[str]]
+
+
+def entity_tag(kind: str, oid) -> str:
+    return f"{kind}:{oid}"
+
+
+def change_tags(kind: str, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> Set[str]:
+    """Tags to invalidate for a batch of (before, after) changes of one kind."""
+    tags = set()
+    for before, after in changes:
+        doc = after if after is not None else before
+        tags.add(entity_tag(kind, doc["_id"]))
+        if before is None or after is None or any(before.get(f) != after.get(f) for f in LIST_FIELDS[kind]):
+            tags.add(LIST_TAGS[kind])
+        if kind == "customer":
+            # Company responses embed their customers and customer count
+            for state in (before, after):
+                if state and state.get("company_id"):
+                    tags.add(entity_tag("company", state["company_id"]))
+    return tags
+
+
+def collapse_tags(tags: Set[str]) -> Set[str]:
+    """Replace entity tags with the list tags that cover them (drops more entries, in fewer tags)."""
+    collapsed = set()
+    for tag in tags:
+        kind, sep, _ = tag.partition(":")
+        collapsed.update(EMBEDDING_LISTS[kind] if sep else (tag,))
+    return collapsed
+
+
+class MemoryBackend:
+    """Per-process store; a tag index lets an invalidation drop exactly the tagged entries."""
+
+    def __init__(self, maxsize: int, ttl: float, max_bytes: int):
+        self._tags: Dict[str, Set[str]] = defaultdict(set)
+        self._entry_tags: Dict[str, List[str]] = {}
+        self.store = TTLCache(
+            maxsize=maxsize,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: len(entry[0]),
+            on_remove=self._untag,
+        )
+
+    def _untag(self, key: str) -> None:
+        for tag in self._entry_tags.pop(key, []):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def drop_tags(self, tags: List[str]) -> None:
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self.store.delete(key)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return self.store.get(key)
+
+    async def snapshot(self) -> None:
+        # Invalidations are counted by ResponseCache as they arrive
+        return None
+
+    async def set(self, key: str, entry: CachedResponse, snapshot=None) -> None:
+        if len(entry[0]) > self.store.max_bytes:
+            return
+        self.store.set(key, entry)
+        self._entry_tags[key] = entry[2]
+        for tag in entry[2]:
+            self._tags[tag].add(key)
+
+    async def invalidate(self, tags: Set[str]) -> None:
+        # Every worker, this one included, drops the tagged entries when the message arrives
+        await get_invalidation_bus().publish(RESPONSE_CACHE_CHANNEL, sorted(tags))
+
+    async def start(self, db) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {**self.store.stats(), "tags": len(self._tags)}
+
+
+class MongoBackend:
+    """
+    Store shared by every worker; entries expire through a TTL index.
+
+    A counter document is bumped by every invalidation. Each entry records the
+    counter value read before its response was computed and is re-checked
+    after it is written, so a response computed across an invalidation in
+    any worker is removed again.
+    """
+
+    COLLECTION = "response_cache"
+    GENERATION_ID = "generation"  # Cache keys are hex digests, so this cannot collide
+
+    def __init__(self, ttl: float, max_entry_bytes: int):
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._collection = None
+
+    async def start(self, db) -> None:
+        self._collection = db[self.COLLECTION]
+        await self._collection.create_indexes([
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+            IndexModel([("tags", ASCENDING)], name="tags"),
+        ])
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        if self._collection is None:
+            return None
+        doc = await self._collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return (doc["body"], doc["headers"], doc["tags"]) if doc else None
+
+    async def snapshot(self) -> Optional[int]:
+        if self._collection is None:
+            return None
+        doc = await self._collection.find_one({"_id": self.GENERATION_ID})
+        return doc["value"] if doc else 0
+
+    async def set(self, key: str, entry: CachedResponse, snapshot: Optional[int] = None) -> None:
+        body, headers, tags = entry
+        if self._collection is None or snapshot is None or len(body) > self.max_entry_bytes:
+            return
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        doc = {"_id": key, "body": body, "headers": headers, "tags": tags, "generation": snapshot, "expires_at": expires_at}
+        await self._collection.replace_one({"_id": key}, doc, upsert=True)
+        # An invalidation that bumped the counter after this check deletes the entry itself
+        if await self.snapshot() != snapshot:
+            await self._collection.delete_one({"_id": key, "generation": snapshot})
+
+    async def invalidate(self, tags: Set[str]) -> None:
+        if self._collection is not None:
+            # Bump first, so a writer either sees the bump or wrote before the delete below
+            await self._collection.update_one({"_id": self.GENERATION_ID}, {"$inc": {"value": 1}}, upsert=True)
+            await self._collection.delete_many({"tags": {"$in": list(tags)}})
+
+    def stats(self) -> dict:
+        return {"ttl_seconds": self.ttl, "max_entry_bytes": self.max_entry_bytes}
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Bumped by every invalidation seen by this process (local or from the bus);
+        # a response computed across a bump is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        if isinstance(backend, MemoryBackend):
+            get_invalidation_bus().subscribe(RESPONSE_CACHE_CHANNEL, self._on_invalidation)
+
+    def _on_invalidation(self, tags: List[str]) -> None:
+        self._generation += 1
+        self.backend.drop_tags(tags)
+
+    @staticmethod
+    def key(request: Request, scope: str) -> str:
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        raw = f"{scope}|{request.url.path}|{params}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def serve(
+        self,
+        request: Request,
+        compute: Callable[[Dict[str, str]], Awaitable[Tuple[object, Iterable[str]]]],
+        scope: str = "public",
+    ) -> Response:
+        """
+        Return the cached response for this request, or build it with
+        `compute(headers)`, which returns (content, tags) and may add
+        response headers to `headers`.
+        """
+        if self.backend is None:
+            return (await self._build(compute))[0]
+
+        key = self.key(request, scope)
+        try:
+            cached = await self.backend.get(key)
+        except PyMongoError as e:
+            self.errors += 1
+            logger.warning("Response cache read failed: %s", e)
+            cached = None
+        if cached is not None:
+            self.hits += 1
+            return self._to_response(cached)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return self._to_response(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # The request computing it was cancelled (client went away); compute it here
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            try:
+                snapshot = await self.backend.snapshot()
+            except PyMongoError as e:
+                self.errors += 1
+                logger.warning("Response cache read failed: %s", e)
+                snapshot = None
+            response, entry = await self._build(compute)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't log it as never retrieved
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(entry)
+        if generation == self._generation:
+            try:
+                await self.backend.set(key, entry, snapshot)
+            except PyMongoError as e:
+                self.errors += 1
+                logger.warning("Response cache write failed: %s", e)
+        return response
+
+    async def _build(self, compute) -> Tuple[Response, CachedResponse]:
+        headers: Dict[str, str] = {}
+        content, tags = await compute(headers)
+        body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode("utf-8")
+        entry = (body, headers, sorted(set(tags)))
+        return self._to_response(entry), entry
+
+    @staticmethod
+    def _to_response(entry: CachedResponse) -> Response:
+        body, headers, _ = entry
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        tags = set(tags)
+        if not tags:
+            return
+        if len(tags) > MAX_INVALIDATION_TAGS:
+            tags = collapse_tags(tags)
+        self._generation += 1
+        if self.backend is not None:
+            try:
+                await self.backend.invalidate(tags)
+            except PyMongoError as e:
+                self.errors += 1
+                logger.warning("Response cache invalidation failed: %s", e)
+
+    async def invalidate_changes(self, kind: str, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> None:
+        await self.invalidate(change_tags(kind, changes))
+
+    async def start(self, db) -> None:
+        if self.backend is not None:
+            await self.backend.start(db)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "backend": get_settings().response_cache_backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+            **(self.backend.stats() if self.backend is not None else {}),
+        }
+
+
+def build_response_cache() -> ResponseCache:
+    settings = get_settings()
+    if settings.response_cache_backend == "memory":
+        backend = MemoryBackend(
+            maxsize=settings.response_cache_size,
+            ttl=settings.response_cache_ttl_seconds,
+            max_bytes=settings.response_cache_max_bytes,
+        )
+    elif settings.response_cache_backend == "mongo":
+        backend = MongoBackend(
+            ttl=settings.response_cache_ttl_seconds,
+            max_entry_bytes=settings.response_cache_max_entry_bytes,
+        )
+    else:
+        backend = None
+    return ResponseCache(backend)
+
+
+response_cache = build_response_cache()
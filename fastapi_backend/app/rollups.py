@@ -0,0 +1,206 @@
+"""
+Deal metrics for the dashboard and the pipeline board.
+
+Metrics are computed with a single $group aggregation. When
+`dashboard_rollups_enabled` is set they are also materialized in the
+`dashboard_rollups` collection (one document for the totals, one for the
+per-stage counts and amounts) and kept current by the deal write paths with
+$inc deltas, so reading them is a single-document fetch. Rebuild the rollups
+from scratch with
+
+    python -m app.rollups
+
+Stages are compared exactly; `canonical_stage` maps spellings that differ only
+in case to the configured one on write, and `normalize_stages` fixes stored
+deals at startup.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+from app.deal_views import rebuild_deal_views
+from app.response_cache import EMBEDDING_LISTS, response_cache
+
+ROLLUP_ID = "deals"
+STAGE_ROLLUP_ID = "deal_stages"
+WON_STAGE = "WON"
+DEFAULT_STAGE = "NEW"  # Deals without a stage are counted (and shown) as NEW
+
+EMPTY_METRICS = {"total_deals": 0, "total_deal_value": 0.0, "won_deal_value": 0.0}
+EMPTY_STAGE_METRICS = {"count": 0, "total_amount": 0.0}
+
+
+def deal_contribution(deal: Optional[dict]) -> dict:
+    """What a single deal adds to the deal metrics."""
+    if not deal:
+        return dict(EMPTY_METRICS)
+    amount = deal.get("amount") or 0
+    return {
+        "total_deals": 1,
+        "total_deal_value": amount,
+        "won_deal_value": amount if deal.get("stage") == WON_STAGE else 0,
+    }
+
+
+def stage_field(stage: str) -> str:
+    """Field name for `stage` in the stage rollup (stage names may contain "." or "$")."""
+    return stage.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def deal_stage(deal: dict) -> str:
+    return deal.get("stage") or DEFAULT_STAGE
+
+
+def canonical_stage(stage: Optional[str]) -> Optional[str]:
+    """The configured spelling of `stage` if it differs only in case (e.g. "Won" -> "WON")."""
+    if not stage:
+        return stage
+    known = [s.strip() for s in get_settings().pipeline_stages.split(",") if s.strip()]
+    for name in known + [DEFAULT_STAGE, WON_STAGE]:
+        if name.lower() == stage.lower():
+            return name
+    return stage
+
+
+async def normalize_stages(db) -> int:
+    """
+    Rewrite stored stages that differ from a configured stage only in case, so
+    the exact, indexed stage matches of the board and the rollups find them.
+    Returns the number of deals changed.
+    """
+    renamed = 0
+    for stored in await db.deals.distinct("stage"):
+        if not isinstance(stored, str) or canonical_stage(stored) == stored:
+            continue
+        result = await db.deals.update_many(
+            {"stage": stored}, {"$set": {"stage": canonical_stage(stored)}, "$inc": {"version": 1}}
+        )
+        renamed += result.modified_count
+    if renamed:
+        if get_settings().dashboard_rollups_enabled:
+            await rebuild_rollup(db)
+        if get_settings().deal_views_enabled:
+            await rebuild_deal_views(db)
+        await response_cache.invalidate(EMBEDDING_LISTS["deal"])
+    return renamed
+
+
+async def apply_deal_change(db, before: Optional[dict], after: Optional[dict]) -> None:
+    """Move the rollup by the difference between a deal's old and new state."""
+    await apply_deal_changes(db, [(before, after)])
+
+
+async def apply_deal_changes(db, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """Move the rollup by the summed difference of several (before, after) deal states."""
+    if not get_settings().dashboard_rollups_enabled:
+        return
+    delta = dict.fromkeys(EMPTY_METRICS, 0)
+    for before, after in changes:
+        old, new = deal_contribution(before), deal_contribution(after)
+        for key in delta:
+            delta[key] += new[key] - old[key]
+    delta = {key: value for key, value in delta.items() if value}
+    stage_delta = defaultdict(int)
+    for before, after in changes:
+        for deal, sign in ((before, -1), (after, 1)):
+            if deal:
+                field = f"stages.{stage_field(deal_stage(deal))}"
+                stage_delta[f"{field}.count"] += sign
+                stage_delta[f"{field}.total_amount"] += sign * (deal.get("amount") or 0)
+    stage_delta = {key: value for key, value in stage_delta.items() if value}
+    # No upsert: a missing rollup is rebuilt from scratch on the next read
+    if delta:
+        await db.dashboard_rollups.update_one({"_id": ROLLUP_ID}, {"$inc": delta})
+    if stage_delta:
+        await db.dashboard_rollups.update_one({"_id": STAGE_ROLLUP_ID}, {"$inc": stage_delta})
+
+
+async def compute_deal_metrics(db) -> dict:
+    """Aggregate the deal metrics server-side."""
+    pipeline = [
+        {"$group": {
+            "_id": None,
+            "total_deals": {"$sum": 1},
+            "total_deal_value": {"$sum": {"$ifNull": ["$amount", 0]}},
+            "won_deal_value": {"$sum": {
+                "$cond": [{"$eq": ["$stage", WON_STAGE]}, {"$ifNull": ["$amount", 0]}, 0],
+            }},
+        }},
+    ]
+    result = await db.deals.aggregate(pipeline).to_list(length=1)
+    if not result:
+        return dict(EMPTY_METRICS)
+    return {key: result[0][key] for key in EMPTY_METRICS}
+
+
+async def compute_stage_metrics(db, stages: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Count and total amount per stage (only `stages`, if given), aggregated server-side."""
+    match = {}
+    if stages is not None:
+        match = {"stage": {"$in": stages + [None] if DEFAULT_STAGE in stages else stages}}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"$ifNull": ["$stage", DEFAULT_STAGE]},
+            "count": {"$sum": 1},
+            "total_amount": {"$sum": {"$ifNull": ["$amount", 0]}},
+        }},
+    ]
+    metrics = {}
+    async for group in db.deals.aggregate(pipeline):
+        metrics[group["_id"]] = {"count": group["count"], "total_amount": group["total_amount"]}
+    return metrics
+
+
+async def rebuild_rollup(db) -> dict:
+    """Recompute the materialized rollups from the deals collection."""
+    metrics = await compute_deal_metrics(db)
+    await db.dashboard_rollups.replace_one({"_id": ROLLUP_ID}, {"_id": ROLLUP_ID, **metrics}, upsert=True)
+    await rebuild_stage_rollup(db)
+    return metrics
+
+
+async def rebuild_stage_rollup(db) -> Dict[str, dict]:
+    stages = await compute_stage_metrics(db)
+    doc = {"_id": STAGE_ROLLUP_ID, "stages": {stage_field(stage): m for stage, m in stages.items()}}
+    await db.dashboard_rollups.replace_one({"_id": STAGE_ROLLUP_ID}, doc, upsert=True)
+    return stages
+
+
+async def get_deal_metrics(db) -> dict:
+    """Read deal metrics from the rollup when enabled, otherwise aggregate them."""
+    if not get_settings().dashboard_rollups_enabled:
+        return await compute_deal_metrics(db)
+    rollup = await db.dashboard_rollups.find_one({"_id": ROLLUP_ID})
+    if rollup is None:
+        return await rebuild_rollup(db)
+    return {key: rollup.get(key, 0) for key in EMPTY_METRICS}
+
+
+async def get_stage_metrics(db, stages: List[str]) -> Dict[str, dict]:
+    """Count and total amount for each of `stages`, from the stage rollup when enabled."""
+    if not get_settings().dashboard_rollups_enabled:
+        metrics = await compute_stage_metrics(db, stages)
+    else:
+        rollup = await db.dashboard_rollups.find_one(
+            {"_id": STAGE_ROLLUP_ID}, {f"stages.{stage_field(stage)}": 1 for stage in stages}
+        )
+        if rollup is None:
+            metrics = await rebuild_stage_rollup(db)
+        else:
+            stored = rollup.get("stages", {})
+            metrics = {stage: stored[stage_field(stage)] for stage in stages if stage_field(stage) in stored}
+    return {stage: {**EMPTY_STAGE_METRICS, **metrics.get(stage, {})} for stage in stages}
+
+
+async def _main() -> None:
+    from app.database import close_db, get_db
+
+    metrics = await rebuild_rollup(await get_db())
+    close_db()
+    print(f"Rebuilt dashboard rollup: {metrics}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,36 +1,57 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Response
 from typing import List, Optional
-from datetime import datetime
-from pydantic import BaseModel
-from app.models.activity_log import ActivityLog
+from app.database import get_db
+from app.models.activity_log import ActivityLogResponse
+from app.pagination import keyset_filter, set_next_cursor, sort_spec, trim_page
 
 router = APIRouter(prefix="/activity-log", tags=["activity"])
 
+MAX_ACTIVITY_PAGE = 200
 
-class ActivityLogResponse(BaseModel):
-    id: str
-    action: str
-    entity_type: str
-    entity_id: Optional[str]
-    details: Optional[str]
-    user_id: Optional[str]
-    timestamp: datetime
+
+def to_response(log: dict) -> ActivityLogResponse:
+    return ActivityLogResponse(
+        id=str(log["_id"]),
+        user=log["user_name"],
+        user_avatar=log.get("user_avatar") or "",
+        action_type=log["action_type"],
+        object_repr=log["object_repr"],
+        model=log["model"],
+        action_time=log["action_time"].isoformat(),
+    )
+
+
+async def find_activity_page(response: Response, match: dict, limit: int, before: Optional[str]):
+    """Newest-first page of activity logs, continuing after the `before` cursor."""
+    db = await get_db()
+    query = {**match, **keyset_filter("action_time", before, descending=True)}
+    logs = await db.activity_logs.find(query).sort(sort_spec("action_time", descending=True)) \
+        .limit(limit + 1).to_list(length=None)
+    logs, next_cursor = trim_page(logs, limit, "action_time")
+    set_next_cursor(response, next_cursor)
+    return [to_response(log) for log in logs]
 
 
 @router.get("/", response_model=List[ActivityLogResponse])
-async def list_activity_logs(limit: int = 50):
-    """Get recent activity logs."""
-    logs = await ActivityLog.find_all().sort(-ActivityLog.timestamp).limit(limit).to_list()
-    
-    return [
-        ActivityLogResponse(
-            id=str(log.id),
-            action=log.action,
-            entity_type=log.entity_type,
-            entity_id=str(log.entity_id) if log.entity_id else None,
-            details=log.details,
-            user_id=str(log.user_id) if log.user_id else None,
-            timestamp=log.timestamp,
-        )
-        for log in logs
-    ]
+async def list_activity_logs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_ACTIVITY_PAGE),
+    before: Optional[str] = None,
+):
+    """Get recent activity logs, newest first.
+
+    The cursor for older entries is sent in the X-Next-Cursor header; pass it back as `before`.
+    """
+    return await find_activity_page(response, {}, limit, before)
+
+
+@router.get("/{model}/{object_id}", response_model=List[ActivityLogResponse])
+async def list_entity_activity(
+    model: str,
+    object_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_ACTIVITY_PAGE),
+    before: Optional[str] = None,
+):
+    """Get the activity timeline of one company, customer or deal, newest first."""
+    return await find_activity_page(response, {"model": model, "object_id": object_id}, limit, before)
@@ -6,8 +6,10 @@ from typing import Optional
 import logging
 from app.models.user import User, UserCreate, UserResponse, Token
 from app.auth import (
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
+    password_needs_rehash,
+    invalidate_user,
     create_access_token,
     create_refresh_token,
     get_current_active_user,
@@ -108,7 +110,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Login and get access token."""
     user = await User.find_one({"username": form_data.username})
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -121,6 +123,11 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             detail="User account is disabled",
         )
     
+    # Transparently upgrade hashes made with an old cost factor
+    if password_needs_rehash(user.hashed_password):
+        await user.set({"hashed_password": await get_password_hash_async(form_data.password)})
+        await invalidate_user(user.username)
+    
     access_token = create_access_token(data={"sub": user.username})
     refresh_token = create_refresh_token(data={"sub": user.username})
     
@@ -168,7 +175,7 @@ async def register(user_data: UserCreate):
         username=user_data.username,
         email=user_data.email,
         full_name=user_data.full_name,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await get_password_hash_async(user_data.password),
         is_active=True,
         is_staff=False,
     )
@@ -1,11 +1,27 @@
-from fastapi import APIRouter, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from bson import ObjectId
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple
 from pydantic import BaseModel
+from app import deal_views
+from app.activity import record_activity
+from app.auth import get_optional_user
+from app.bulk import BulkRequest, BulkResponse, execute_bulk
 from app.database import get_db
+from app.export import export_response
+from app.models.activity_log import ActionType
+from app.models.user import User
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, keyset_filter, set_next_cursor, sort_spec, trim_page
+from app.response_cache import entity_tag, response_cache
+from app.writes import delete_versioned, update_versioned
 
 router = APIRouter(prefix="/companies", tags=["companies"])
 
+# Customers embedded per company in list responses (detail responses embed up to
+# MAX_EMBEDDED_CUSTOMERS); the full list is paged via /companies/{id}/customers
+DEFAULT_EMBEDDED_CUSTOMERS = 5
+MAX_EMBEDDED_CUSTOMERS = 100
+
 INDUSTRY_COLORS = {
     "TECHNOLOGY": "#3B82F6",
     "HEALTHCARE": "#10B981",
@@ -35,7 +51,9 @@ class CompanyResponse(BaseModel):
     industry: Optional[str] = None
     industry_color: str = "#6B7280"
     location: Optional[str] = None
+    customer_count: int = 0
     customers: List[CustomerInfo] = []
+    version: int = 0
 
 
 class CompanyCreate(BaseModel):
@@ -52,42 +70,125 @@ class CompanyUpdate(BaseModel):
     website: Optional[str] = None
     industry: Optional[str] = None
     location: Optional[str] = None
+    version: Optional[int] = None  # Version last read; the update fails with 409 if it changed
 
 
-async def get_company_response(company: dict, db) -> CompanyResponse:
-    """Convert company dict to response with customers."""
-    customers = await db.customers.find({"company_id": company["_id"]}).to_list(length=100)
-    customer_list = [
-        CustomerInfo(
-            id=str(c["_id"]),
-            name=c["name"],
-            email=c["email"],
-            phone_number=c.get("phone_number"),
-            position=c.get("position"),
-        )
-        for c in customers
-    ]
-    
-    industry = company.get("industry", "OTHER")
-    
-    return CompanyResponse(
-        id=str(company["_id"]),
-        name=company["name"],
-        description=company.get("description"),
-        website=company.get("website"),
-        industry=industry,
-        industry_color=INDUSTRY_COLORS.get(industry, "#6B7280"),
-        location=company.get("location"),
-        customers=customer_list,
+def to_customer_info(c: dict) -> CustomerInfo:
+    return CustomerInfo(
+        id=str(c["_id"]),
+        name=c["name"],
+        email=c["email"],
+        phone_number=c.get("phone_number"),
+        position=c.get("position"),
     )
 
 
+async def get_company_responses(
+    companies: List[dict], db, customers_limit: int = DEFAULT_EMBEDDED_CUSTOMERS
+) -> List[CompanyResponse]:
+    """Convert company dicts to responses with a customer count and the first customers.
+
+    The embedded customers come from one $lookup whose sub-pipeline stops after
+    `customers_limit` entries per company; the counts come from a separate
+    grouped count that only reads the company_id index.
+    """
+    counts, embedded = {}, {}
+    if companies:
+        company_ids = [c["_id"] for c in companies]
+        count_pipeline = [
+            {"$match": {"company_id": {"$in": company_ids}}},
+            {"$project": {"_id": 0, "company_id": 1}},
+            {"$group": {"_id": "$company_id", "count": {"$sum": 1}}},
+        ]
+        lookup_pipeline = [
+            {"$match": {"_id": {"$in": company_ids}}},
+            {"$lookup": {
+                "from": "customers",
+                "localField": "_id",
+                "foreignField": "company_id",
+                "pipeline": [
+                    {"$sort": {"_id": 1}},
+                    {"$limit": customers_limit},
+                    {"$project": {"name": 1, "email": 1, "phone_number": 1, "position": 1}},
+                ],
+                "as": "customers",
+            }},
+            {"$project": {"customers": 1}},
+        ]
+
+        async def load_counts():
+            async for group in db.customers.aggregate(count_pipeline):
+                counts[group["_id"]] = group["count"]
+
+        async def load_customers():
+            if customers_limit > 0:
+                async for company in db.companies.aggregate(lookup_pipeline):
+                    embedded[company["_id"]] = company["customers"]
+
+        await asyncio.gather(load_counts(), load_customers())
+    
+    responses = []
+    for company in companies:
+        industry = company.get("industry", "OTHER")
+        responses.append(CompanyResponse(
+            id=str(company["_id"]),
+            name=company["name"],
+            description=company.get("description"),
+            website=company.get("website"),
+            industry=industry,
+            industry_color=INDUSTRY_COLORS.get(industry, "#6B7280"),
+            location=company.get("location"),
+            customer_count=counts.get(company["_id"], 0),
+            customers=[to_customer_info(c) for c in embedded.get(company["_id"], [])],
+            version=company.get("version", 0),
+        ))
+    return responses
+
+
+async def get_company_response(company: dict, db) -> CompanyResponse:
+    """Convert a single company dict to a detail response (up to MAX_EMBEDDED_CUSTOMERS customers)."""
+    return (await get_company_responses([company], db, MAX_EMBEDDED_CUSTOMERS))[0]
+
+
+async def apply_changes(db, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """Propagate company writes to the deal views and the response cache."""
+    await deal_views.apply_company_changes(db, changes)
+    await response_cache.invalidate_changes("company", changes)
+
+
 @router.get("/", response_model=List[CompanyResponse])
-async def list_companies():
-    """Get all companies."""
+async def list_companies(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["_id", "name"] = "_id",
+    customers_limit: int = Query(DEFAULT_EMBEDDED_CUSTOMERS, ge=0, le=MAX_EMBEDDED_CUSTOMERS),
+):
+    """Get a page of companies with their customer count and first customers.
+
+    When there are more, the next page's cursor is sent in the X-Next-Cursor header.
+    """
+    async def compute(headers: dict):
+        db = await get_db()
+        query = db.companies.find(keyset_filter(sort, cursor)).sort(sort_spec(sort)).limit(limit + 1)
+        companies, next_cursor = trim_page(await query.to_list(length=None), limit, sort)
+        if next_cursor:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
+        responses = await get_company_responses(companies, db, customers_limit)
+        return responses, ["companies", *(entity_tag("company", c.id) for c in responses)]
+    
+    return await response_cache.serve(request, compute)
+
+
+COMPANY_EXPORT_COLUMNS = ["id", "name", "description", "website", "industry", "location"]
+
+
+@router.get("/export")
+async def export_companies(format: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    """Stream every company as NDJSON or CSV, optionally gzip-compressed."""
     db = await get_db()
-    companies = await db.companies.find().to_list(length=1000)
-    return [await get_company_response(c, db) for c in companies]
+    cursor = db.companies.find({}).sort("_id", 1)
+    return export_response(cursor, COMPANY_EXPORT_COLUMNS, lambda c: {**c, "id": c["_id"]}, format, gzip, "companies")
 
 
 @router.get("/{company_id}", response_model=CompanyResponse)
@@ -105,51 +206,103 @@ async def get_company(company_id: str):
     return await get_company_response(company, db)
 
 
+@router.get("/{company_id}/customers", response_model=List[CustomerInfo])
+async def list_company_customers(
+    company_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get a page of a company's customers, ordered by ID."""
+    db = await get_db()
+    try:
+        oid = ObjectId(company_id)
+    except:
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    if not await db.companies.find_one({"_id": oid}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    query = {"company_id": oid, **keyset_filter("_id", cursor)}
+    customers = await db.customers.find(query).sort("_id", 1).limit(limit + 1).to_list(length=None)
+    customers, next_cursor = trim_page(customers, limit, "_id")
+    set_next_cursor(response, next_cursor)
+    return [to_customer_info(c) for c in customers]
+
+
 @router.post("/", response_model=CompanyResponse, status_code=status.HTTP_201_CREATED)
-async def create_company(company_data: CompanyCreate):
+async def create_company(company_data: CompanyCreate, current_user: Optional[User] = Depends(get_optional_user)):
     """Create a new company."""
     db = await get_db()
     
     company = company_data.model_dump()
     result = await db.companies.insert_one(company)
     company["_id"] = result.inserted_id
+    await apply_changes(db, [(None, company)])
+    await record_activity(ActionType.create, "company", company["_id"], company["name"], current_user)
     
     return await get_company_response(company, db)
 
 
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_companies(request: BulkRequest, current_user: Optional[User] = Depends(get_optional_user)):
+    """Create, update and delete many companies in one request.
+
+    Each operation is validated on its own; the result lists the outcome per item.
+    """
+    db = await get_db()
+    return await execute_bulk(
+        db, "companies", "company", request.operations,
+        create_schema=CompanyCreate,
+        update_schema=CompanyUpdate,
+        to_document=lambda data: data,
+        repr_field="name",
+        on_applied=apply_changes,
+        user=current_user,
+    )
+
+
 @router.put("/{company_id}", response_model=CompanyResponse)
-async def update_company(company_id: str, company_data: CompanyUpdate):
+async def update_company(
+    company_id: str,
+    company_data: CompanyUpdate,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
     """Update an existing company."""
     db = await get_db()
     
     try:
-        company = await db.companies.find_one({"_id": ObjectId(company_id)})
+        oid = ObjectId(company_id)
     except:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    if not company:
-        raise HTTPException(status_code=404, detail="Company not found")
-    
     update_data = company_data.model_dump(exclude_unset=True)
+    expected_version = update_data.pop("version", None)
     
+    before, company = await update_versioned(db.companies, oid, update_data, expected_version, "Company")
     if update_data:
-        await db.companies.update_one({"_id": ObjectId(company_id)}, {"$set": update_data})
-        company = await db.companies.find_one({"_id": ObjectId(company_id)})
+        await apply_changes(db, [(before, company)])
+        await record_activity(ActionType.edit, "company", company["_id"], company["name"], current_user)
     
     return await get_company_response(company, db)
 
 
 @router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_company(company_id: str):
-    """Delete a company."""
+async def delete_company(
+    company_id: str,
+    version: Optional[int] = None,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """Delete a company; with `version`, only if it has not changed since."""
     db = await get_db()
     
     try:
-        result = await db.companies.delete_one({"_id": ObjectId(company_id)})
+        oid = ObjectId(company_id)
     except:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Company not found")
+    company = await delete_versioned(db.companies, oid, version, "Company")
+    await apply_changes(db, [(company, None)])
     
+    await record_activity(ActionType.delete, "company", company["_id"], company["name"], current_user)
     return None
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from bson import ObjectId
-from typing import List
+from typing import List, Literal, Tuple
 from pydantic import BaseModel, EmailStr
 from typing import Optional
+from app import deal_views
+from app.activity import record_activity
+from app.auth import get_optional_user
+from app.bulk import BulkRequest, BulkResponse, execute_bulk, find_missing_ids
 from app.database import get_db
+from app.export import export_response
+from app.models.activity_log import ActionType
+from app.models.user import User
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, keyset_filter, sort_spec, trim_page
+from app.response_cache import entity_tag, response_cache
+from app.writes import delete_versioned, update_versioned
 
 router = APIRouter(prefix="/customers", tags=["customers"])
 
@@ -17,6 +27,7 @@ class CustomerResponse(BaseModel):
     company_id: str
     company_name: Optional[str] = None
     industry: Optional[str] = None
+    version: int = 0
 
 
 class CustomerCreate(BaseModel):
@@ -33,32 +44,93 @@ class CustomerUpdate(BaseModel):
     phone_number: Optional[str] = None
     position: Optional[str] = None
     company_id: Optional[str] = None
+    version: Optional[int] = None  # Version last read; the update fails with 409 if it changed
+
+
+async def get_customer_responses(customers: List[dict], db) -> List[CustomerResponse]:
+    """Convert customer dicts to responses, fetching their companies in one query."""
+    company_ids = list({c["company_id"] for c in customers if c.get("company_id")})
+    companies = {}
+    if company_ids:
+        async for company in db.companies.find({"_id": {"$in": company_ids}}, {"name": 1, "industry": 1}):
+            companies[company["_id"]] = company
+    
+    responses = []
+    for customer in customers:
+        company = companies.get(customer.get("company_id"))
+        responses.append(CustomerResponse(
+            id=str(customer["_id"]),
+            name=customer["name"],
+            email=customer["email"],
+            phone_number=customer.get("phone_number"),
+            position=customer.get("position"),
+            company_id=str(customer["company_id"]) if customer.get("company_id") else "",
+            company_name=company["name"] if company else None,
+            industry=company.get("industry") if company else None,
+            version=customer.get("version", 0),
+        ))
+    return responses
 
 
 async def get_customer_response(customer: dict, db) -> CustomerResponse:
     """Convert customer dict to response with company info."""
-    company = None
-    if customer.get("company_id"):
-        company = await db.companies.find_one({"_id": customer["company_id"]})
-    
-    return CustomerResponse(
-        id=str(customer["_id"]),
-        name=customer["name"],
-        email=customer["email"],
-        phone_number=customer.get("phone_number"),
-        position=customer.get("position"),
-        company_id=str(customer["company_id"]) if customer.get("company_id") else "",
-        company_name=company["name"] if company else None,
-        industry=company.get("industry") if company else None,
-    )
+    return (await get_customer_responses([customer], db))[0]
+
+
+async def apply_changes(db, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """Propagate customer writes to the deal views and the response cache."""
+    await deal_views.apply_customer_changes(db, changes)
+    await response_cache.invalidate_changes("customer", changes)
 
 
 @router.get("/", response_model=List[CustomerResponse])
-async def list_customers():
-    """Get all customers."""
+async def list_customers(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["_id", "name"] = "_id",
+):
+    """Get a page of customers.
+
+    When there are more, the next page's cursor is sent in the X-Next-Cursor header.
+    """
+    async def compute(headers: dict):
+        db = await get_db()
+        query = db.customers.find(keyset_filter(sort, cursor)).sort(sort_spec(sort)).limit(limit + 1)
+        customers, next_cursor = trim_page(await query.to_list(length=None), limit, sort)
+        if next_cursor:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
+        responses = await get_customer_responses(customers, db)
+        tags = ["customers"]
+        for c in responses:
+            tags.append(entity_tag("customer", c.id))
+            if c.company_id:
+                tags.append(entity_tag("company", c.company_id))
+        return responses, tags
+    
+    return await response_cache.serve(request, compute)
+
+
+CUSTOMER_EXPORT_COLUMNS = ["id", "name", "email", "phone_number", "position", "company_id", "company_name"]
+
+
+@router.get("/export")
+async def export_customers(format: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    """Stream every customer with its company name as NDJSON or CSV, optionally gzip-compressed."""
     db = await get_db()
-    customers = await db.customers.find().to_list(length=1000)
-    return [await get_customer_response(c, db) for c in customers]
+    cursor = db.customers.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$lookup": {
+            "from": "companies",
+            "localField": "company_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1}}],
+            "as": "company",
+        }},
+        {"$set": {"id": "$_id", "company_name": {"$arrayElemAt": ["$company.name", 0]}}},
+        {"$unset": "company"},
+    ])
+    return export_response(cursor, CUSTOMER_EXPORT_COLUMNS, lambda c: c, format, gzip, "customers")
 
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
@@ -77,7 +149,7 @@ async def get_customer(customer_id: str):
 
 
 @router.post("/", response_model=CustomerResponse, status_code=status.HTTP_201_CREATED)
-async def create_customer(customer_data: CustomerCreate):
+async def create_customer(customer_data: CustomerCreate, current_user: Optional[User] = Depends(get_optional_user)):
     """Create a new customer."""
     db = await get_db()
     
@@ -99,46 +171,88 @@ async def create_customer(customer_data: CustomerCreate):
     }
     result = await db.customers.insert_one(customer)
     customer["_id"] = result.inserted_id
+    await apply_changes(db, [(None, customer)])
+    await record_activity(ActionType.create, "customer", customer["_id"], customer["name"], current_user)
     
     return await get_customer_response(customer, db)
 
 
+def customer_document(data: dict) -> dict:
+    """Stored form of validated customer fields."""
+    if data.get("company_id") is not None:
+        data["company_id"] = ObjectId(data["company_id"])
+    return data
+
+
+async def check_customer_references(db, customers: List[dict]) -> List[Optional[str]]:
+    """Per-customer reference errors, checked with one query for all companies."""
+    missing = await find_missing_ids(db.companies, [c.get("company_id") for c in customers])
+    return ["Company not found" if c.get("company_id") in missing else None for c in customers]
+
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_customers(request: BulkRequest, current_user: Optional[User] = Depends(get_optional_user)):
+    """Create, update and delete many customers in one request.
+
+    Each operation is validated on its own; the result lists the outcome per item.
+    """
+    db = await get_db()
+    return await execute_bulk(
+        db, "customers", "customer", request.operations,
+        create_schema=CustomerCreate,
+        update_schema=CustomerUpdate,
+        to_document=customer_document,
+        repr_field="name",
+        check_references=check_customer_references,
+        on_applied=apply_changes,
+        user=current_user,
+    )
+
+
 @router.put("/{customer_id}", response_model=CustomerResponse)
-async def update_customer(customer_id: str, customer_data: CustomerUpdate):
+async def update_customer(
+    customer_id: str,
+    customer_data: CustomerUpdate,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
     """Update an existing customer."""
     db = await get_db()
     
     try:
-        customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+        oid = ObjectId(customer_id)
     except:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    
     update_data = customer_data.model_dump(exclude_unset=True)
+    expected_version = update_data.pop("version", None)
     
     if "company_id" in update_data:
         update_data["company_id"] = ObjectId(update_data["company_id"])
     
+    before, customer = await update_versioned(db.customers, oid, update_data, expected_version, "Customer")
     if update_data:
-        await db.customers.update_one({"_id": ObjectId(customer_id)}, {"$set": update_data})
-        customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+        await apply_changes(db, [(before, customer)])
+        await record_activity(ActionType.edit, "customer", customer["_id"], customer["name"], current_user)
     
     return await get_customer_response(customer, db)
 
 
 @router.delete("/{customer_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_customer(customer_id: str):
-    """Delete a customer."""
+async def delete_customer(
+    customer_id: str,
+    version: Optional[int] = None,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """Delete a customer; with `version`, only if it has not changed since."""
     db = await get_db()
     
     try:
-        result = await db.customers.delete_one({"_id": ObjectId(customer_id)})
+        oid = ObjectId(customer_id)
     except:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    customer = await delete_versioned(db.customers, oid, version, "Customer")
+    await apply_changes(db, [(customer, None)])
     
+    await record_activity(ActionType.delete, "customer", customer["_id"], customer["name"], current_user)
     return None
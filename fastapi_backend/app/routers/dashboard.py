@@ -1,6 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from app.database import get_db
+from app.response_cache import response_cache
+from app.rollups import get_deal_metrics
 
 router = APIRouter(prefix="/dashboard-metrics", tags=["dashboard"])
 
@@ -14,28 +16,23 @@ class DashboardMetrics(BaseModel):
 
 
 @router.get("/", response_model=DashboardMetrics)
-async def get_dashboard_metrics():
+async def get_dashboard_metrics(request: Request):
     """Get dashboard metrics."""
-    db = await get_db()
+    async def compute(headers: dict):
+        db = await get_db()
+        
+        # Collection counts come from metadata rather than a scan
+        total_companies = await db.companies.estimated_document_count()
+        total_contacts = await db.customers.estimated_document_count()
+        
+        # Deal totals are aggregated server-side (or read from the rollup)
+        deal_metrics = await get_deal_metrics(db)
+        
+        metrics = DashboardMetrics(
+            total_companies=total_companies,
+            total_contacts=total_contacts,
+            **deal_metrics,
+        )
+        return metrics, ["companies", "customers", "deals"]
     
-    # Count companies
-    total_companies = await db.companies.count_documents({})
-    
-    # Count contacts (customers)
-    total_contacts = await db.customers.count_documents({})
-    
-    # Get all deals
-    deals = await db.deals.find().to_list(length=10000)
-    total_deals = len(deals)
-    
-    # Calculate total and won deal values
-    total_deal_value = sum(deal.get("amount", 0) for deal in deals)
-    won_deal_value = sum(deal.get("amount", 0) for deal in deals if deal.get("stage") == "WON")
-    
-    return DashboardMetrics(
-        total_companies=total_companies,
-        total_contacts=total_contacts,
-        total_deals=total_deals,
-        total_deal_value=total_deal_value,
-        won_deal_value=won_deal_value,
-    )
+    return await response_cache.serve(request, compute)
@@ -1,8 +1,11 @@
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from app.chat_memory import assemble_context, conversation_store
 from app.database import get_db
-from app.llm import generate_reply
+from app.llm import FALLBACK_REPLY, generate_reply, stream_reply
 
 router = APIRouter(prefix="/deal-chat", tags=["deal-chat"])
 
@@ -18,43 +21,85 @@ class DealState(BaseModel):
 class DealChatRequest(BaseModel):
     message: str
     deal_state: Optional[DealState] = None
+    session_id: Optional[str] = None  # Omit to start a new conversation
+    use_cache: bool = True  # Set to false to always ask the model
 
 
 class DealChatResponse(BaseModel):
     ai_message: str
     deal_state: Optional[DealState] = None
+    session_id: str
 
 
-@router.post("/", response_model=DealChatResponse)
-async def chat_about_deal(request: DealChatRequest):
-    """AI chat to help create or discuss a deal."""
-    
-    # Build context based on deal state
-    if request.deal_state:
-        context = f"""You are a helpful CRM assistant helping to create or manage a deal.
+def build_context(deal_state: Optional[DealState]) -> str:
+    """Build the context note based on deal state."""
+    if deal_state:
+        return f"""You are a helpful CRM assistant helping to create or manage a deal.
 Current deal information:
-- Title: {request.deal_state.title or 'Not set'}
-- Amount: ${request.deal_state.amount or 0:,.2f}
-- Company: {request.deal_state.company_name or 'Not set'}
-- Stage: {request.deal_state.stage or 'NEW'}
-- Close Date: {request.deal_state.close_date or 'Not set'}
+- Title: {deal_state.title or 'Not set'}
+- Amount: ${deal_state.amount or 0:,.2f}
+- Company: {deal_state.company_name or 'Not set'}
+- Stage: {deal_state.stage or 'NEW'}
+- Close Date: {deal_state.close_date or 'Not set'}
 
 Help the user with their request. If they're starting a new deal, ask for the deal title first, then amount, company, and expected close date."""
-    else:
-        context = """You are a helpful CRM assistant. The user wants to create a new deal.
+    return """You are a helpful CRM assistant. The user wants to create a new deal.
 Start by asking them for the deal title. Then you'll ask for the deal amount, company, and expected close date.
 Be friendly and helpful. Keep your responses concise."""
 
-    # Generate reply
-    messages = [{"role": "user", "content": request.message}]
+
+@router.post("/", response_model=DealChatResponse)
+async def chat_about_deal(request: DealChatRequest):
+    """AI chat to help create or discuss a deal."""
+    session = conversation_store.get_or_create(request.session_id)
+    context = assemble_context(session, build_context(request.deal_state), request.message)
     
+    # Generate reply
+    answered = False
     try:
-        reply = await generate_reply(context, messages)
+        reply = await generate_reply(request.message, context, request.use_cache)
+        answered = reply != FALLBACK_REPLY
     except Exception as e:
         reply = "I'm here to help you create and manage deals. What would you like to do?"
     
+    # Canned fallbacks are not model output; keep them out of the history
+    if answered:
+        session.add_turn("user", request.message)
+        session.add_turn("assistant", reply)
+    
     # Return response with updated deal state
     return DealChatResponse(
         ai_message=reply,
-        deal_state=request.deal_state or DealState()
+        deal_state=request.deal_state or DealState(),
+        session_id=session.id,
+    )
+
+
+@router.post("/stream")
+async def stream_chat_about_deal(request: DealChatRequest):
+    """
+    AI chat as Server-Sent Events: one `data: {"delta": ...}` event per chunk
+    as the model produces it, then a `done` event carrying the deal state
+    and session ID.
+    """
+    session = conversation_store.get_or_create(request.session_id)
+    context = assemble_context(session, build_context(request.deal_state), request.message)
+    deal_state = request.deal_state or DealState()
+    
+    async def events():
+        parts = []
+        async for delta in stream_reply(request.message, context, request.use_cache):
+            parts.append(delta)
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+        reply = "".join(parts)
+        if reply and reply != FALLBACK_REPLY:
+            session.add_turn("user", request.message)
+            session.add_turn("assistant", reply)
+        done = {"deal_state": deal_state.model_dump(), "session_id": session.id}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
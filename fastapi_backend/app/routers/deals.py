@@ -1,12 +1,30 @@
-from fastapi import APIRouter, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from bson import ObjectId
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field
+from app import deal_views
+from app.activity import record_activity
+from app.auth import get_optional_user
+from app.bulk import BulkRequest, BulkResponse, execute_bulk, find_missing_ids
+from app.config import get_settings
 from app.database import get_db
+from app.deal_views import deal_response_pipeline
+from app.export import export_response
+from app.models.activity_log import ActionType
+from app.models.user import User
+from app.rollups import DEFAULT_STAGE, apply_deal_changes, canonical_stage, get_stage_metrics
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, keyset_filter, sort_spec, trim_page
+from app.response_cache import entity_tag, response_cache
+from app.writes import delete_versioned, update_versioned, version_guard
 
 router = APIRouter(prefix="/deals", tags=["deals"])
 
-MUSTAFA_AVATAR_URL = "https://static.vecteezy.com/system/resources/previews/009/292/244/non_2x/default-avatar-icon-of-social-media-user-vector.jpg"
+# Cards returned per board column (and per column page)
+DEFAULT_BOARD_CARDS = 20
+MAX_BOARD_CARDS = 200
+
+MAX_MOVES = 1000
 
 
 class ContactInfo(BaseModel):
@@ -27,6 +45,52 @@ class DealResponse(BaseModel):
     stage: str
     close_date: Optional[str] = None
     contacts: List[ContactInfo] = []
+    version: int = 0
+
+
+class DealCard(BaseModel):
+    id: str
+    title: str
+    amount: float
+    company_id: str
+    company_name: Optional[str] = None
+    stage: str
+    close_date: Optional[str] = None
+    position: Optional[float] = None
+    version: int = 0
+
+
+class BoardColumn(BaseModel):
+    stage: str
+    count: int
+    total_amount: float
+    deals: List[DealCard] = []
+    next_cursor: Optional[str] = None
+
+
+class DealMove(BaseModel):
+    deal_id: str
+    stage: str
+    position: Optional[float] = None  # Omit to keep the current position
+    version: Optional[int] = None  # Version the client last saw; omit to skip the check
+
+
+class DealMoveRequest(BaseModel):
+    moves: List[DealMove] = Field(..., min_length=1, max_length=MAX_MOVES)
+
+
+class DealStageMove(BaseModel):
+    stage: str
+    position: Optional[float] = None
+    version: Optional[int] = None
+
+
+class DealMoveResult(BaseModel):
+    id: str
+    status: Literal["moved", "unchanged", "conflict", "not_found"]
+    stage: Optional[str] = None  # Current values; on conflict, the server's
+    position: Optional[float] = None
+    version: Optional[int] = None
 
 
 class DealCreate(BaseModel):
@@ -45,45 +109,190 @@ class DealUpdate(BaseModel):
     stage: Optional[str] = None
     close_date: Optional[str] = None
     contact_ids: Optional[List[str]] = None
+    version: Optional[int] = None  # Version last read; the update fails with 409 if it changed
 
 
-async def get_deal_response(deal: dict, db) -> DealResponse:
-    """Convert deal dict to response with company and contacts info."""
-    company = None
-    if deal.get("company_id"):
-        company = await db.companies.find_one({"_id": deal["company_id"]})
-    
-    contacts = []
-    for contact_id in deal.get("contact_ids", []):
-        customer = await db.customers.find_one({"_id": contact_id})
-        if customer:
-            contacts.append(ContactInfo(
-                id=str(customer["_id"]),
-                name=customer["name"],
-                email=customer["email"],
-                phone_number=customer.get("phone_number"),
-                avatar_url=MUSTAFA_AVATAR_URL,
-                position=customer.get("position"),
-            ))
-    
-    return DealResponse(
-        id=str(deal["_id"]),
-        title=deal["title"],
-        amount=deal["amount"],
-        company_id=str(deal["company_id"]) if deal.get("company_id") else "",
-        company_name=company["name"] if company else None,
-        stage=deal.get("stage", "NEW"),
-        close_date=deal.get("close_date"),
-        contacts=contacts,
-    )
+async def find_deal_docs(db, match: dict, sort: Optional[list] = None, limit: Optional[int] = None) -> List[dict]:
+    """Fetch deals matching `match` with company and contacts joined in one round trip.
+
+    With deal views enabled this is a plain indexed find on the projection.
+    """
+    if get_settings().deal_views_enabled:
+        query = db[deal_views.VIEW_COLLECTION].find(match)
+        if sort:
+            query = query.sort(sort)
+        if limit:
+            query = query.limit(limit)
+        return await query.to_list(length=None)
+    pipeline = deal_response_pipeline(match, sort, limit)
+    return await db.deals.aggregate(pipeline).to_list(length=None)
+
+
+async def apply_changes(db, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """Propagate deal writes to the dashboard rollup, the deal views and the response cache."""
+    await apply_deal_changes(db, changes)
+    await deal_views.apply_deal_changes(db, changes)
+    await response_cache.invalidate_changes("deal", changes)
+
+
+async def find_deal_responses(db, match: dict) -> List[DealResponse]:
+    return [DealResponse(**d) for d in await find_deal_docs(db, match)]
+
+
+async def get_deal_response(deal_id: ObjectId, db) -> DealResponse:
+    """Fetch a single deal response by ID."""
+    deals = await find_deal_responses(db, {"_id": deal_id})
+    if not deals:
+        raise HTTPException(status_code=404, detail="Deal not found")
+    return deals[0]
 
 
 @router.get("/", response_model=List[DealResponse])
-async def list_deals():
-    """Get all deals."""
+async def list_deals(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["_id", "amount", "close_date"] = "_id",
+):
+    """Get a page of deals.
+
+    When there are more, the next page's cursor is sent in the X-Next-Cursor header.
+    """
+    async def compute(headers: dict):
+        db = await get_db()
+        docs = await find_deal_docs(db, keyset_filter(sort, cursor), sort_spec(sort), limit + 1)
+        docs, next_cursor = trim_page(docs, limit, sort)
+        if next_cursor:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
+        responses = [DealResponse(**d) for d in docs]
+        tags = ["deals"]
+        for d in responses:
+            tags.append(entity_tag("deal", d.id))
+            if d.company_id:
+                tags.append(entity_tag("company", d.company_id))
+            tags.extend(entity_tag("customer", c.id) for c in d.contacts)
+        return responses, tags
+    
+    return await response_cache.serve(request, compute)
+
+
+DEAL_EXPORT_COLUMNS = ["id", "title", "amount", "company_id", "company_name", "stage", "close_date", "contact_ids"]
+
+
+@router.get("/export")
+async def export_deals(format: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    """Stream every deal with its company name as NDJSON or CSV, optionally gzip-compressed.
+
+    Contacts are exported as IDs (semicolon-separated in CSV).
+    """
     db = await get_db()
-    deals = await db.deals.find().to_list(length=1000)
-    return [await get_deal_response(d, db) for d in deals]
+    cursor = db.deals.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$lookup": {
+            "from": "companies",
+            "localField": "company_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1}}],
+            "as": "company",
+        }},
+        {"$set": {"id": "$_id", "company_name": {"$arrayElemAt": ["$company.name", 0]}}},
+        {"$unset": "company"},
+    ])
+    return export_response(cursor, DEAL_EXPORT_COLUMNS, lambda d: d, format, gzip, "deals")
+
+
+MAX_BOARD_STAGES = 20
+
+CARD_FIELDS = ["title", "amount", "company_id", "close_date", "position", "version"]
+
+
+def stage_match(stage: str) -> dict:
+    # Deals without a stage are shown in the NEW column
+    return {"stage": {"$in": [stage, None]}} if stage == DEFAULT_STAGE else {"stage": stage}
+
+
+def board_pipeline(stages: List[str], after: dict, cards: int) -> list:
+    """The first `cards` + 1 cards of each stage in board order (position, then _id), stage by stage.
+
+    Each column is its own $match + $sort + $limit on the stage_position_id index,
+    chained with $unionWith, so the work depends on the cards shown rather than
+    on the number of deals. The company is looked up for the selected cards only.
+    """
+    def column(stage: str) -> list:
+        return [
+            {"$match": {**stage_match(stage), **after}},
+            {"$sort": dict(sort_spec("position"))},
+            {"$limit": cards + 1},
+            {"$project": {**dict.fromkeys(CARD_FIELDS, 1), "stage": {"$literal": stage}}},
+        ]
+    
+    pipeline = column(stages[0])
+    for stage in stages[1:]:
+        pipeline.append({"$unionWith": {"coll": "deals", "pipeline": column(stage)}})
+    return pipeline + [
+        {"$lookup": {
+            "from": "companies",
+            "localField": "company_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1}}],
+            "as": "company",
+        }},
+        {"$project": {
+            "id": {"$toString": "$_id"},
+            "title": 1,
+            "amount": {"$ifNull": ["$amount", 0]},
+            "company_id": {"$ifNull": [{"$toString": "$company_id"}, ""]},
+            "company_name": {"$arrayElemAt": ["$company.name", 0]},
+            "stage": 1,
+            "close_date": 1,
+            "position": 1,
+            "version": {"$ifNull": ["$version", 0]},
+        }},
+    ]
+
+
+@router.get("/board", response_model=List[BoardColumn])
+async def get_deal_board(
+    cards: int = Query(DEFAULT_BOARD_CARDS, ge=1, le=MAX_BOARD_CARDS),
+    stages: Optional[str] = None,
+    stage: Optional[str] = None,
+    cursor: Optional[str] = None,
+):
+    """Get the pipeline board: one column per stage with its deal count, total amount and first cards.
+
+    `stages` lists the columns in board order (comma-separated; defaults to the
+    `pipeline_stages` setting). Pass `stage` (and the column's `next_cursor` as
+    `cursor`) to load more cards for one column.
+    """
+    db = await get_db()
+    if cursor and not stage:
+        raise HTTPException(status_code=400, detail="A cursor is only valid together with its stage")
+    if stage:
+        columns = [canonical_stage(stage)]
+    else:
+        columns = [canonical_stage(s.strip()) for s in (stages or get_settings().pipeline_stages).split(",") if s.strip()]
+        columns = list(dict.fromkeys(columns))
+        if not columns or len(columns) > MAX_BOARD_STAGES:
+            raise HTTPException(status_code=400, detail=f"Pass between 1 and {MAX_BOARD_STAGES} stages")
+    
+    pipeline = board_pipeline(columns, keyset_filter("position", cursor), cards)
+    cards_by_stage = {}
+    # $unionWith keeps each stage's cards together and in board order
+    async for card in db.deals.aggregate(pipeline):
+        cards_by_stage.setdefault(card["stage"], []).append(card)
+    metrics = await get_stage_metrics(db, columns)
+    
+    board = []
+    for name in columns:
+        stage_cards, next_cursor = trim_page(cards_by_stage.get(name, []), cards, "position")
+        board.append(BoardColumn(
+            stage=name,
+            count=metrics[name]["count"],
+            total_amount=metrics[name]["total_amount"],
+            deals=[DealCard(**c) for c in stage_cards],
+            next_cursor=next_cursor,
+        ))
+    return board
 
 
 @router.get("/{deal_id}", response_model=DealResponse)
@@ -91,18 +300,15 @@ async def get_deal(deal_id: str):
     """Get a specific deal by ID."""
     db = await get_db()
     try:
-        deal = await db.deals.find_one({"_id": ObjectId(deal_id)})
+        oid = ObjectId(deal_id)
     except:
         raise HTTPException(status_code=404, detail="Deal not found")
     
-    if not deal:
-        raise HTTPException(status_code=404, detail="Deal not found")
-    
-    return await get_deal_response(deal, db)
+    return await get_deal_response(oid, db)
 
 
 @router.post("/", response_model=DealResponse, status_code=status.HTTP_201_CREATED)
-async def create_deal(deal_data: DealCreate):
+async def create_deal(deal_data: DealCreate, current_user: Optional[User] = Depends(get_optional_user)):
     """Create a new deal."""
     db = await get_db()
     
@@ -122,30 +328,187 @@ async def create_deal(deal_data: DealCreate):
         "title": deal_data.title,
         "amount": deal_data.amount,
         "company_id": ObjectId(deal_data.company_id),
-        "stage": deal_data.stage,
+        "stage": canonical_stage(deal_data.stage),
         "close_date": deal_data.close_date,
         "contact_ids": contact_ids,
     }
     result = await db.deals.insert_one(deal)
-    deal["_id"] = result.inserted_id
+    await apply_changes(db, [(None, deal)])
+    await record_activity(ActionType.create, "deal", result.inserted_id, deal["title"], current_user)
+    
+    return await get_deal_response(result.inserted_id, db)
+
+
+def deal_document(data: dict) -> dict:
+    """Stored form of validated deal fields."""
+    if data.get("stage") is not None:
+        data["stage"] = canonical_stage(data["stage"])
+    if data.get("company_id") is not None:
+        data["company_id"] = ObjectId(data["company_id"])
+    if data.get("contact_ids") is not None:
+        data["contact_ids"] = [ObjectId(cid) for cid in data["contact_ids"]]
+    return data
+
+
+async def check_deal_references(db, deals: List[dict]) -> List[Optional[str]]:
+    """Per-deal reference errors, checked with one query per referenced collection."""
+    missing_companies = await find_missing_ids(db.companies, [d.get("company_id") for d in deals])
+    missing_contacts = await find_missing_ids(db.customers, [cid for d in deals for cid in d.get("contact_ids") or []])
+    errors = []
+    for deal in deals:
+        if deal.get("company_id") in missing_companies:
+            errors.append("Company not found")
+        elif any(cid in missing_contacts for cid in deal.get("contact_ids") or []):
+            errors.append("Contact not found")
+        else:
+            errors.append(None)
+    return errors
+
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_deals(request: BulkRequest, current_user: Optional[User] = Depends(get_optional_user)):
+    """Create, update and delete many deals in one request.
+
+    Each operation is validated on its own; the result lists the outcome per item.
+    """
+    db = await get_db()
+    return await execute_bulk(
+        db, "deals", "deal", request.operations,
+        create_schema=DealCreate,
+        update_schema=DealUpdate,
+        to_document=deal_document,
+        repr_field="title",
+        check_references=check_deal_references,
+        on_applied=apply_changes,
+        user=current_user,
+    )
+
+
+def _move_result(deal: dict, status: str) -> DealMoveResult:
+    return DealMoveResult(
+        id=str(deal["_id"]),
+        status=status,
+        stage=deal.get("stage", "NEW"),
+        position=deal.get("position"),
+        version=deal.get("version", 0),
+    )
+
+
+async def apply_moves(db, moves: List[DealMove], user=None) -> List[DealMoveResult]:
+    """Apply stage/position moves with one read and one guarded write per moved deal.
+
+    Moves of the same deal are coalesced (the last one wins, checked against the
+    first one's version). Each write is guarded by the version read just before,
+    so a concurrent edit turns the move into a conflict instead of being overwritten.
+    The writes run concurrently, and each reports whether it applied.
+    """
+    coalesced = {}
+    invalid = []
+    for move in moves:
+        try:
+            oid = ObjectId(move.deal_id)
+        except:
+            invalid.append(move.deal_id)
+            continue
+        if oid in coalesced:
+            move = move.model_copy(update={"version": coalesced[oid].version})
+        coalesced[oid] = move
+    
+    projection = {"title": 1, "amount": 1, "stage": 1, "position": 1, "version": 1}
+    before = {}
+    if coalesced:
+        async for deal in db.deals.find({"_id": {"$in": list(coalesced)}}, projection):
+            before[deal["_id"]] = deal
+    
+    results = {}
+    pending = {}
+    for oid, move in coalesced.items():
+        deal = before.get(oid)
+        if deal is None:
+            results[oid] = DealMoveResult(id=str(oid), status="not_found")
+            continue
+        current_version = deal.get("version", 0)
+        if move.version is not None and move.version != current_version:
+            results[oid] = _move_result(deal, "conflict")
+            continue
+        changes = {"stage": canonical_stage(move.stage)}
+        if move.position is not None:
+            changes["position"] = move.position
+        if all(deal.get(field) == value for field, value in changes.items()):
+            results[oid] = _move_result(deal, "unchanged")
+            continue
+        pending[oid] = changes
     
-    return await get_deal_response(deal, db)
+    async def write(oid, changes):
+        # The pre-read's version is the guard, so a match means `before[oid]` is the exact pre-image
+        updated = await db.deals.find_one_and_update(
+            {"_id": oid, "version": version_guard(before[oid].get("version", 0))},
+            {"$set": changes, "$inc": {"version": 1}},
+            projection={"_id": 1},
+        )
+        if updated is not None:
+            return oid, {**before[oid], **changes, "version": before[oid].get("version", 0) + 1}
+        # Changed or deleted between the read and the write
+        current = await db.deals.find_one({"_id": oid}, projection)
+        results[oid] = (
+            _move_result(current, "conflict") if current else DealMoveResult(id=str(oid), status="not_found")
+        )
+        return oid, None
+    
+    if pending:
+        written = await asyncio.gather(*(write(oid, changes) for oid, changes in pending.items()))
+        applied = {oid: after for oid, after in written if after is not None}
+        for oid, after in applied.items():
+            results[oid] = _move_result(after, "moved")
+            await record_activity(ActionType.edit, "deal", oid, after["title"], user)
+        await apply_changes(db, [(before[oid], after) for oid, after in applied.items()])
+    
+    return [DealMoveResult(id=deal_id, status="not_found") for deal_id in invalid] + list(results.values())
+
+
+@router.patch("/moves", response_model=List[DealMoveResult])
+async def move_deals(request: DealMoveRequest, current_user: Optional[User] = Depends(get_optional_user)):
+    """Move one or many deals between stages and positions in a single request.
+
+    Only the moved fields are returned. Clients should send rapid sequences of
+    drops as one request; repeated moves of a deal within it are coalesced.
+    """
+    db = await get_db()
+    return await apply_moves(db, request.moves, current_user)
+
+
+@router.patch("/{deal_id}", response_model=DealMoveResult)
+async def move_deal(
+    deal_id: str,
+    move: DealStageMove,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """Move a single deal to another stage and/or position."""
+    db = await get_db()
+    result = (await apply_moves(db, [DealMove(deal_id=deal_id, **move.model_dump())], current_user))[0]
+    if result.status == "not_found":
+        raise HTTPException(status_code=404, detail="Deal not found")
+    if result.status == "conflict":
+        raise HTTPException(status_code=409, detail=result.model_dump())
+    return result
 
 
 @router.put("/{deal_id}", response_model=DealResponse)
-async def update_deal(deal_id: str, deal_data: DealUpdate):
+async def update_deal(
+    deal_id: str,
+    deal_data: DealUpdate,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
     """Update an existing deal."""
     db = await get_db()
     
     try:
-        deal = await db.deals.find_one({"_id": ObjectId(deal_id)})
+        oid = ObjectId(deal_id)
     except:
         raise HTTPException(status_code=404, detail="Deal not found")
     
-    if not deal:
-        raise HTTPException(status_code=404, detail="Deal not found")
-    
     update_data = deal_data.model_dump(exclude_unset=True)
+    expected_version = update_data.pop("version", None)
     
     if "company_id" in update_data:
         update_data["company_id"] = ObjectId(update_data["company_id"])
@@ -153,24 +516,33 @@ async def update_deal(deal_id: str, deal_data: DealUpdate):
     if "contact_ids" in update_data:
         update_data["contact_ids"] = [ObjectId(cid) for cid in update_data["contact_ids"]]
     
+    if update_data.get("stage") is not None:
+        update_data["stage"] = canonical_stage(update_data["stage"])
+    
+    before, deal = await update_versioned(db.deals, oid, update_data, expected_version, "Deal")
     if update_data:
-        await db.deals.update_one({"_id": ObjectId(deal_id)}, {"$set": update_data})
-        deal = await db.deals.find_one({"_id": ObjectId(deal_id)})
+        await apply_changes(db, [(before, deal)])
+        await record_activity(ActionType.edit, "deal", deal["_id"], deal["title"], current_user)
     
-    return await get_deal_response(deal, db)
+    return await get_deal_response(deal["_id"], db)
 
 
 @router.delete("/{deal_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_deal(deal_id: str):
-    """Delete a deal."""
+async def delete_deal(
+    deal_id: str,
+    version: Optional[int] = None,
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """Delete a deal; with `version`, only if it has not changed since."""
     db = await get_db()
     
     try:
-        result = await db.deals.delete_one({"_id": ObjectId(deal_id)})
+        oid = ObjectId(deal_id)
     except:
         raise HTTPException(status_code=404, detail="Deal not found")
     
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Deal not found")
+    deal = await delete_versioned(db.deals, oid, version, "Deal")
     
+    await apply_changes(db, [(deal, None)])
+    await record_activity(ActionType.delete, "deal", deal["_id"], deal["title"], current_user)
     return None
@@ -0,0 +1,68 @@
+import asyncio
+import shutil
+import tempfile
+from datetime import datetime
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+from app.auth import get_optional_user
+from app.database import get_db
+from app.imports import import_jobs, run_import
+from app.models.user import User
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ImportJobResponse(BaseModel):
+    id: str
+    resource: str
+    filename: str
+    status: str
+    rows_processed: int
+    inserted: int
+    failed: int
+    errors: List[ImportRowError] = []
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+def spool_upload(upload) -> str:
+    """Copy an uploaded file to a temporary file the import job owns."""
+    with tempfile.NamedTemporaryFile(prefix="crm-import-", suffix=".csv", delete=False) as f:
+        shutil.copyfileobj(upload, f, length=1024 * 1024)
+        return f.name
+
+
+@router.post("/{resource}", response_model=ImportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def start_import(
+    resource: Literal["companies", "customers"],
+    file: UploadFile = File(...),
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """Start a background CSV import.
+
+    Companies use the CompanyCreate columns; customers use the CustomerCreate
+    columns with either `company_id` or `company_name`. Poll
+    /imports/jobs/{job_id} for progress and row errors.
+    """
+    db = await get_db()
+    path = await run_in_threadpool(spool_upload, file.file)
+    job = import_jobs.create(resource, file.filename or "upload.csv")
+    import_jobs.track(job, asyncio.create_task(run_import(job, path, db, current_user)))
+    return ImportJobResponse(**vars(job))
+
+
+@router.get("/jobs/{job_id}", response_model=ImportJobResponse)
+async def get_import_job(job_id: str):
+    """Get the progress and row errors of an import."""
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return ImportJobResponse(**vars(job))
@@ -0,0 +1,59 @@
+from fastapi import APIRouter
+from app.config import get_settings
+from app.activity import activity_writer
+from app.auth import password_hash_stats, user_cache
+from app.database import pool_stats
+from app.llm import completion_cache, llm_limiter, model_router
+from app.response_cache import response_cache
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/db-pool")
+async def get_db_pool_metrics():
+    """Get live MongoDB connection pool statistics."""
+    settings = get_settings()
+    return {
+        "max_pool_size": settings.mongo_max_pool_size,
+        "min_pool_size": settings.mongo_min_pool_size,
+        **pool_stats.snapshot(),
+    }
+
+
+@router.get("/user-cache")
+async def get_user_cache_metrics():
+    """Get authenticated-user cache hit/miss counters."""
+    return user_cache.stats()
+
+
+@router.get("/password-hashing")
+async def get_password_hashing_metrics():
+    """Get bcrypt executor usage and queue-time statistics."""
+    return password_hash_stats.snapshot()
+
+
+@router.get("/llm-cache")
+async def get_llm_cache_metrics():
+    """Get deal-chat completion cache hit rate and memory use."""
+    return completion_cache.stats()
+
+
+@router.get("/llm")
+async def get_llm_metrics():
+    """Get LLM admission queue depth, in-flight calls, and per-model latency, routing and breaker state."""
+    return {
+        **llm_limiter.stats(),
+        "models": model_router.snapshot(),
+    }
+
+
+@router.get("/activity-log")
+async def get_activity_log_metrics():
+    """Get activity-log buffer depth and write counters."""
+    return activity_writer.stats()
+
+
+@router.get("/response-cache")
+async def get_response_cache_metrics():
+    """Get response cache hit rate, coalesced misses and memory use."""
+    return response_cache.stats()
@@ -0,0 +1,70 @@
+"""
+Single-round-trip writes with optimistic concurrency.
+
+Documents carry a `version` that every write bumps (documents written before
+versioning are at 0). Callers may pass the version they last read; if the
+document has moved on since, the write is rejected with 409 instead of
+silently overwriting the other change.
+"""
+
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+
+def version_guard(version: int):
+    """Filter value matching a document at `version` (documents without one are at 0)."""
+    return version if version else {"$in": [0, None]}
+
+
+def versioned_filter(oid, expected_version: Optional[int]) -> dict:
+    query = {"_id": oid}
+    if expected_version is not None:
+        query["version"] = version_guard(expected_version)
+    return query
+
+
+async def _missing_or_conflict(collection, oid, expected_version: Optional[int], label: str) -> HTTPException:
+    """Tell a missing document from a version conflict (only runs when the write failed)."""
+    if expected_version is not None:
+        current = await collection.find_one({"_id": oid}, {"version": 1})
+        if current is not None:
+            return HTTPException(
+                status_code=409,
+                detail=f"{label} was modified by someone else (current version {current.get('version', 0)})",
+            )
+    return HTTPException(status_code=404, detail=f"{label} not found")
+
+
+async def update_versioned(
+    collection, oid, changes: dict, expected_version: Optional[int] = None, label: str = "Document"
+) -> Tuple[dict, dict]:
+    """
+    Apply `changes` with $set and bump the version in one find_one_and_update.
+
+    Returns (before, after). The pre-image is fetched so callers can compute
+    deltas (rollups, audit); the post-image is derived from it, which is
+    exact for a $set. With no changes the document is only read.
+    """
+    query = versioned_filter(oid, expected_version)
+    if not changes:
+        before = await collection.find_one(query)
+        if before is None:
+            raise await _missing_or_conflict(collection, oid, expected_version, label)
+        return before, before
+    before = await collection.find_one_and_update(
+        query,
+        {"$set": changes, "$inc": {"version": 1}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        raise await _missing_or_conflict(collection, oid, expected_version, label)
+    return before, {**before, **changes, "version": before.get("version", 0) + 1}
+
+
+async def delete_versioned(collection, oid, expected_version: Optional[int] = None, label: str = "Document") -> dict:
+    """Delete in one find_one_and_delete and return the deleted document."""
+    deleted = await collection.find_one_and_delete(versioned_filter(oid, expected_version))
+    if deleted is None:
+        raise await _missing_or_conflict(collection, oid, expected_version, label)
+    return deleted
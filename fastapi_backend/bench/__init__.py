@@ -0,0 +1,14 @@
+"""
+Benchmarks for the performance work on the API. Run them from the
+fastapi_backend directory, e.g.
+
+    python -m bench.deal_list
+
+The database-backed ones seed and then drop a throwaway database
+(BENCH_DATABASE_NAME, default "crm_bench") on the configured MONGO_URI.
+"""
+
+import os
+
+# Before any app module reads the settings: never point a benchmark at the real database
+os.environ["DATABASE_NAME"] = os.environ.get("BENCH_DATABASE_NAME", "crm_bench")
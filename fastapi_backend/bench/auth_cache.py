@@ -0,0 +1,65 @@
+"""
+Per-request cost of get_current_user with the authenticated-user cache, and
+with the cache emptied before every request (the previous behaviour: one
+users.find_one per authenticated request).
+
+    python -m bench.auth_cache [--requests 5000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Tuple
+from app.auth import create_access_token, get_current_user, user_cache
+from bench.common import bench_db, percentile, print_table
+
+
+async def run(token: str, requests: int, concurrency: int, cached: bool) -> Tuple[List[float], float]:
+    user_cache.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request():
+        async with semaphore:
+            if not cached:
+                user_cache.clear()
+            started = time.perf_counter()
+            await get_current_user(token)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    return latencies, requests / (time.perf_counter() - started)
+
+
+async def main(requests: int, concurrency: int) -> None:
+    rows = []
+    async with bench_db() as db:
+        await db.users.insert_one({
+            "username": "bench",
+            "email": "bench@example.com",
+            "hashed_password": "",
+            "full_name": "Bench User",
+            "is_active": True,
+            "is_staff": False,
+            "created_at": datetime.utcnow(),
+        })
+        token = create_access_token({"sub": "bench"})
+        # Warm the connection pool
+        await run(token, concurrency, concurrency, cached=False)
+        for label, cached in (("find_one per request", False), ("user cache", True)):
+            latencies, throughput = await run(token, requests, concurrency, cached)
+            rows.append([label, percentile(latencies, 0.5), percentile(latencies, 0.99), throughput])
+        stats = user_cache.stats()
+    print(f"{requests} authenticated requests, {concurrency} concurrent; latency in milliseconds")
+    print_table(["user lookup", "p50", "p99", "requests/s"], rows)
+    print(f"cache: {stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="get_current_user cost with and without the user cache")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
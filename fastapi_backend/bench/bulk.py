@@ -0,0 +1,82 @@
+"""
+Customer sync throughput: one create per request (the original path:
+company check, insert, then the company lookup for the response) against
+POST /customers/bulk in batches.
+
+The one-per-request path is timed on at most --single-limit items and its
+rate applied to the full size, so 100k items don't take an hour.
+
+    python -m bench.bulk [--items 10000,100000] [--batch 1000] [--single-limit 2000]
+"""
+
+import argparse
+import asyncio
+import time
+from bson import ObjectId
+from app.bulk import BulkOperation, BulkRequest
+from app.routers.customers import bulk_customers
+from bench.common import bench_db, print_table
+
+COMPANIES = 100
+
+
+def customer(i: int, company_id: ObjectId) -> dict:
+    return {
+        "name": f"Customer {i}",
+        "email": f"customer{i}@example.com",
+        "phone_number": "+1 555 0100",
+        "position": "Buyer",
+        "company_id": str(company_id),
+    }
+
+
+async def create_one_per_request(db, items: list) -> None:
+    for item in items:
+        company = await db.companies.find_one({"_id": ObjectId(item["company_id"])})
+        if not company:
+            raise RuntimeError("Company not found")
+        await db.customers.insert_one({**item, "company_id": company["_id"]})
+        await db.companies.find_one({"_id": company["_id"]})
+
+
+async def create_in_bulk(db, items: list, batch: int) -> None:
+    for start in range(0, len(items), batch):
+        operations = [BulkOperation(op="create", data=item) for item in items[start:start + batch]]
+        response = await bulk_customers(BulkRequest(operations=operations), current_user=None)
+        if response.failed:
+            raise RuntimeError(f"{response.failed} bulk items failed: {response.results[0]}")
+
+
+async def main(sizes: list, batch: int, single_limit: int) -> None:
+    rows = []
+    async with bench_db() as db:
+        companies = [{"name": f"Company {i}", "version": 0} for i in range(COMPANIES)]
+        await db.companies.insert_many(companies)
+        for size in sizes:
+            items = [customer(i, companies[i % COMPANIES]["_id"]) for i in range(size)]
+
+            await db.customers.delete_many({})
+            sample = items[:single_limit]
+            started = time.perf_counter()
+            await create_one_per_request(db, sample)
+            single_rate = len(sample) / (time.perf_counter() - started)
+
+            await db.customers.delete_many({})
+            started = time.perf_counter()
+            await create_in_bulk(db, items, batch)
+            bulk_seconds = time.perf_counter() - started
+            assert await db.customers.count_documents({}) == size
+
+            rows.append([size, single_rate, size / single_rate, size / bulk_seconds, bulk_seconds,
+                         f"{size / bulk_seconds / single_rate:.0f}x"])
+    print(f"Creating customers; bulk batches of {batch}, one-per-request rate measured on {single_limit} items")
+    print_table(["items", "single items/s", "single seconds (est.)", "bulk items/s", "bulk seconds", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Customer create throughput, one per request vs bulk")
+    parser.add_argument("--items", default="10000,100000", help="comma-separated batch sizes to sync")
+    parser.add_argument("--batch", type=int, default=1000, help="operations per bulk request")
+    parser.add_argument("--single-limit", type=int, default=2000, help="items timed on the one-per-request path")
+    args = parser.parse_args()
+    asyncio.run(main([int(n) for n in args.items.split(",")], args.batch, args.single_limit))
@@ -0,0 +1,41 @@
+import time
+from contextlib import asynccontextmanager
+from typing import List, Sequence
+from app.config import get_settings
+from app.database import close_db, get_client, init_db
+
+
+@asynccontextmanager
+async def bench_db():
+    """The benchmark database with the app's indexes and models set up; dropped afterwards."""
+    db = await init_db()
+    try:
+        yield db
+    finally:
+        await get_client().drop_database(get_settings().database_name)
+        close_db()
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+async def timed(func, *args, runs: int = 1) -> float:
+    """Median wall time of `runs` awaits of func(*args), in milliseconds."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 0.5)
+
+
+def print_table(headers: List[str], rows: List[list]) -> None:
+    cells = [headers] + [[f"{v:,.1f}" if isinstance(v, float) else f"{v:,}" if isinstance(v, int) else str(v) for v in row]
+                         for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for n, row in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if n == 0:
+            print("  ".join("-" * width for width in widths))
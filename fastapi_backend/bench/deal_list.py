@@ -0,0 +1,92 @@
+"""
+Deal list latency as the number of contacts per deal grows: the original
+per-deal lookups (one companies.find_one per deal and one customers.find_one
+per contact) against the single $lookup aggregation now behind GET /deals.
+
+    python -m bench.deal_list [--deals 1000] [--contacts 0,1,3,10,30] [--runs 5]
+"""
+
+import argparse
+import asyncio
+import random
+from app.routers.deals import find_deal_docs
+from bench.common import bench_db, print_table, timed
+
+COMPANIES = 100
+CUSTOMERS_PER_COMPANY = 40
+
+
+async def seed(db, deals: int, contacts_per_deal: int) -> None:
+    for name in ("companies", "customers", "deals"):
+        await db[name].delete_many({})
+    companies = [{"name": f"Company {i}", "industry": "TECHNOLOGY", "version": 0} for i in range(COMPANIES)]
+    await db.companies.insert_many(companies)
+    customers = [
+        {
+            "name": f"Contact {c['name']} {j}",
+            "email": f"contact{i}.{j}@example.com",
+            "position": "Buyer",
+            "company_id": c["_id"],
+            "version": 0,
+        }
+        for i, c in enumerate(companies)
+        for j in range(CUSTOMERS_PER_COMPANY)
+    ]
+    await db.customers.insert_many(customers)
+    by_company = {}
+    for customer in customers:
+        by_company.setdefault(customer["company_id"], []).append(customer["_id"])
+    rng = random.Random(42)
+    docs = []
+    for i in range(deals):
+        company = rng.choice(companies)
+        docs.append({
+            "title": f"Deal {i}",
+            "amount": float(rng.randint(1000, 100000)),
+            "company_id": company["_id"],
+            "stage": rng.choice(["NEW", "prospecting", "proposal", "WON"]),
+            "contact_ids": rng.sample(by_company[company["_id"]], min(contacts_per_deal, CUSTOMERS_PER_COMPANY)),
+            "version": 0,
+        })
+    await db.deals.insert_many(docs)
+
+
+async def list_with_per_deal_lookups(db, limit: int) -> list:
+    """The list endpoint as it was: a find, then lookups for every deal in turn."""
+    responses = []
+    for deal in await db.deals.find().to_list(length=limit):
+        company = await db.companies.find_one({"_id": deal["company_id"]})
+        contacts = []
+        for contact_id in deal.get("contact_ids", []):
+            customer = await db.customers.find_one({"_id": contact_id})
+            if customer:
+                contacts.append(customer)
+        responses.append({**deal, "company_name": company["name"] if company else None, "contacts": contacts})
+    return responses
+
+
+async def list_with_lookup(db, limit: int) -> list:
+    return await find_deal_docs(db, {}, sort=[("_id", 1)], limit=limit)
+
+
+async def main(deals: int, contact_counts: list, runs: int) -> None:
+    rows = []
+    async with bench_db() as db:
+        for contacts in contact_counts:
+            await seed(db, deals, contacts)
+            # Warm the cache and connection pool before measuring
+            await list_with_lookup(db, deals)
+            before = await timed(list_with_per_deal_lookups, db, deals, runs=runs)
+            after = await timed(list_with_lookup, db, deals, runs=runs)
+            rows.append([contacts, deals, before, after, f"{before / after:.1f}x"])
+    print(f"Median of {runs} runs, milliseconds per list of {deals} deals")
+    print_table(["contacts/deal", "deals", "per-deal lookups", "$lookup", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deal list latency: per-deal lookups against the $lookup aggregation")
+    parser.add_argument("--deals", type=int, default=1000)
+    parser.add_argument("--contacts", default="0,1,3,10,30", help="comma-separated contacts per deal")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.deals, [int(n) for n in args.contacts.split(",")], args.runs))
@@ -0,0 +1,85 @@
+"""
+CRUD latency while a burst of logins checks bcrypt passwords: inline on the
+event loop (the original verify_password call in /auth/token) against the
+bounded executor behind verify_password_async.
+
+A CRUD request is modelled as a coroutine awaiting a short I/O wait (a Mongo
+round trip); whatever it takes beyond that is time spent waiting for the
+event loop. No database is needed.
+
+    python -m bench.password_load [--logins 20] [--rounds 12] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Tuple
+from app.auth import get_password_hash, password_hash_stats, shutdown_password_executor, verify_password, verify_password_async
+from app.config import get_settings
+from bench.common import percentile, print_table
+
+IO_WAIT_SECONDS = 0.002
+CRUD_CLIENTS = 20
+
+
+async def crud_client(latencies: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(IO_WAIT_SECONDS)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def measure(login, logins: int) -> Tuple[List[float], float]:
+    """CRUD latencies (ms) observed while `logins` logins run concurrently, and the burst duration."""
+    latencies, stop = [], asyncio.Event()
+    clients = [asyncio.create_task(crud_client(latencies, stop)) for _ in range(CRUD_CLIENTS)]
+    await asyncio.sleep(0.2)
+    latencies.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    burst = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*clients)
+    return latencies, burst
+
+
+async def main(logins: int, rounds: int, workers: int) -> None:
+    settings = get_settings()
+    settings.bcrypt_rounds = rounds
+    settings.password_hash_workers = workers
+    hashed = get_password_hash("correct horse battery staple")
+
+    async def idle():
+        await asyncio.sleep(0.5)
+
+    async def inline_login():
+        # What /auth/token used to do: bcrypt in the handler, on the event loop
+        await asyncio.sleep(0)
+        verify_password("correct horse battery staple", hashed)
+
+    async def executor_login():
+        await verify_password_async("correct horse battery staple", hashed)
+
+    rows = []
+    for label, login, count in (
+        ("no logins", idle, 1),
+        ("bcrypt on the event loop", inline_login, logins),
+        (f"bcrypt executor ({workers} workers)", executor_login, logins),
+    ):
+        latencies, burst = await measure(login, count)
+        rows.append([label, percentile(latencies, 0.5), percentile(latencies, 0.99), max(latencies), burst])
+    shutdown_password_executor()
+
+    print(f"{logins} concurrent logins at bcrypt cost {rounds}; CRUD latency in milliseconds "
+          f"({IO_WAIT_SECONDS * 1000:.0f} ms of it is the simulated I/O)")
+    print_table(["password check", "CRUD p50", "CRUD p99", "CRUD max", "burst seconds"], rows)
+    print(f"executor: {password_hash_stats.snapshot()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CRUD latency during a login burst, bcrypt inline vs in the executor")
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=4, help="password hash executor size")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.rounds, args.workers))
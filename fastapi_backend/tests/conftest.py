@@ -0,0 +1,76 @@
+import os
+import uuid
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from openai import AsyncOpenAI
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from app import llm
+from app.config import get_settings
+from app.llm_router import build_model_router
+from tests.stubs import ModelBehavior, OpenAIServer
+
+# Tests that need MongoDB use a throwaway database on this server and are
+# skipped when it cannot be reached
+TEST_MONGO_URI = os.environ.get("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_available() -> bool:
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+@pytest.fixture
+async def mongo_db(mongo_available):
+    if not mongo_available:
+        pytest.skip(f"MongoDB is not available at {TEST_MONGO_URI}")
+    client = AsyncIOMotorClient(TEST_MONGO_URI)
+    db = client[f"crm_test_{uuid.uuid4().hex[:12]}"]
+    yield db
+    await client.drop_database(db.name)
+    client.close()
+
+
+@pytest.fixture
+def llm_settings(monkeypatch):
+    """Fast timeouts, no retries and a quick-tripping breaker for the LLM tests."""
+    settings = get_settings()
+    overrides = {
+        "llm_models": "primary,secondary",
+        "llm_timeout_seconds": 0.5,
+        "llm_max_retries": 0,
+        "llm_backoff_base_seconds": 0.0,
+        "llm_slow_p95_seconds": 0.2,
+        "llm_max_error_ratio": 0.2,
+        "llm_stats_window": 20,
+        "llm_breaker_failure_ratio": 0.5,
+        "llm_breaker_min_calls": 2,
+        "llm_breaker_window": 4,
+        "llm_breaker_reset_seconds": 60.0,
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    return settings
+
+
+@pytest.fixture
+async def stub_llm(llm_settings, monkeypatch):
+    """The LLM layer pointed at a local OpenAI-compatible server with models "primary" and "secondary"."""
+    behaviors = {
+        "primary": ModelBehavior(reply="Primary says hi"),
+        "secondary": ModelBehavior(reply="Secondary says hi"),
+    }
+    with OpenAIServer(behaviors) as server:
+        client = AsyncOpenAI(base_url=f"{server.url}/v1", api_key="test-key", max_retries=0)
+        monkeypatch.setattr(llm, "_client", client)
+        monkeypatch.setattr(llm, "model_router", build_model_router())
+        llm.completion_cache.clear()
+        yield server
+        await client.close()
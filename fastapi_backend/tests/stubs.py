@@ -0,0 +1,162 @@
+"""
+Local HTTP servers standing in for external services in tests.
+
+Each server listens on a free 127.0.0.1 port in a background thread; use it
+as a context manager and point the code under test at `url`.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+
+class StubServer:
+    """Base class; subclasses implement `handle` for every request."""
+
+    def __init__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._dispatch(self, None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                stub._dispatch(self, json.loads(self.rfile.read(length) or b"null"))
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _dispatch(self, request: BaseHTTPRequestHandler, body: Optional[Any]) -> None:
+        with self._lock:
+            self.requests += 1
+        try:
+            self.handle(request, body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up (e.g. timed out) mid-response
+
+    def handle(self, request: BaseHTTPRequestHandler, body: Optional[Any]) -> None:
+        raise NotImplementedError
+
+
+def send_json(request: BaseHTTPRequestHandler, status: int, payload: Any) -> None:
+    data = json.dumps(payload).encode()
+    request.send_response(status)
+    request.send_header("Content-Type", "application/json")
+    request.send_header("Content-Length", str(len(data)))
+    request.end_headers()
+    request.wfile.write(data)
+
+
+class ModelBehavior:
+    """How the stub OpenAI server answers for one model."""
+
+    def __init__(
+        self,
+        reply: str = "Hello from the stub",
+        latency: float = 0.0,
+        status: int = 200,
+        chunk_delay: float = 0.0,
+        stall_after: Optional[int] = None,
+        error_after: Optional[int] = None,
+        drop_after: Optional[int] = None,
+    ):
+        self.reply = reply
+        self.latency = latency  # Before the response (or the first chunk) is sent
+        self.status = status
+        self.chunk_delay = chunk_delay
+        # Streams only: after this many chunks, go silent / send an error event / cut the connection
+        self.stall_after = stall_after
+        self.error_after = error_after
+        self.drop_after = drop_after
+
+    def chunks(self) -> list:
+        words = self.reply.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+
+class OpenAIServer(StubServer):
+    """
+    Minimal OpenAI-compatible /v1/chat/completions endpoint. Each model answers
+    according to its ModelBehavior; `calls` lists the models requested, in order.
+    """
+
+    STALL_SECONDS = 5.0
+
+    def __init__(self, behaviors: dict):
+        super().__init__()
+        self.behaviors = behaviors
+        self.calls = []
+
+    def handle(self, request, body):
+        model = body["model"]
+        with self._lock:
+            self.calls.append(model)
+        behavior = self.behaviors[model]
+        time.sleep(behavior.latency)
+        if behavior.status != 200:
+            send_json(request, behavior.status, {"error": {"message": f"{model} failed", "type": "server_error"}})
+        elif body.get("stream"):
+            self._stream(request, model, behavior)
+        else:
+            send_json(request, 200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": behavior.reply},
+                    "finish_reason": "stop",
+                }],
+            })
+
+    def _stream(self, request, model: str, behavior: ModelBehavior) -> None:
+        events = []
+        for piece in behavior.chunks():
+            events.append({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream")
+        if behavior.drop_after is not None:
+            # Promise more than we send so the client sees a truncated body
+            request.send_header("Content-Length", "1000000")
+        request.end_headers()
+        for sent, event in enumerate(events):
+            if sent == behavior.stall_after:
+                time.sleep(self.STALL_SECONDS)
+                return
+            if sent == behavior.error_after:
+                request.wfile.write(b'data: {"error": {"message": "upstream failed mid-stream"}}\n\n')
+                return
+            if sent == behavior.drop_after:
+                return
+            request.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            request.wfile.flush()
+            time.sleep(behavior.chunk_delay)
+        request.wfile.write(b"data: [DONE]\n\n")
@@ -0,0 +1,214 @@
+"""Local verification of Azure AD tokens against a stub JWKS endpoint."""
+
+import asyncio
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+from app import azure_auth
+from app.azure_auth import JWKS_MIN_REFRESH_INTERVAL, AzureADSettings, JWKSCache, validate_azure_token_locally
+from tests.stubs import StubServer, send_json
+
+TENANT_ID = "11111111-2222-3333-4444-555555555555"
+CLIENT_ID = "66666666-7777-8888-9999-000000000000"
+AZURE_SETTINGS = AzureADSettings(tenant_id=TENANT_ID, client_id=CLIENT_ID)
+ISSUER = f"https://login.microsoftonline.com/{TENANT_ID}/v2.0"
+
+
+class SigningKey:
+    """An RSA key pair published under `kid`."""
+
+    def __init__(self, kid: str):
+        self.kid = kid
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        self.jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": kid, "use": "sig"}
+
+    def token(self, kid: str = None, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "aud": CLIENT_ID,
+            "iss": ISSUER,
+            "iat": now,
+            "nbf": now,
+            "exp": now + 600,
+            "oid": "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee",
+            "preferred_username": "ada@example.com",
+            "name": "Ada Lovelace",
+            **claims,
+        }
+        return jwt.encode(payload, self.private_pem, algorithm="RS256", headers={"kid": kid or self.kid})
+
+
+class JWKSServer(StubServer):
+    """Serves `keys` as the tenant's JWKS document, or `status` if it is not 200."""
+
+    def __init__(self, keys):
+        super().__init__()
+        self.keys = list(keys)
+        self.status = 200
+
+    def handle(self, request, body):
+        if self.status != 200:
+            send_json(request, self.status, {"error": "unavailable"})
+        else:
+            send_json(request, 200, {"keys": [key.jwk for key in self.keys]})
+
+
+@pytest.fixture(scope="module")
+def current_key():
+    return SigningKey("key-1")
+
+
+@pytest.fixture(scope="module")
+def next_key():
+    return SigningKey("key-2")
+
+
+@pytest.fixture
+async def jwks(current_key, monkeypatch):
+    with JWKSServer([current_key]) as server:
+        monkeypatch.setattr(azure_auth, "_jwks_cache", JWKSCache(f"{server.url}/discovery/v2.0/keys", 3600))
+        yield server
+        # The shared client belongs to this test's event loop
+        await azure_auth.close_http_client()
+
+
+def age_keys(seconds: float) -> None:
+    """Pretend the cached keys were fetched `seconds` earlier."""
+    azure_auth._jwks_cache._fetched_at -= seconds
+
+
+async def test_valid_token_is_accepted(jwks, current_key):
+    user = await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+
+    assert user.oid == "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"
+    assert user.preferred_username == "ada@example.com"
+    assert user.email == "ada@example.com"
+    assert user.name == "Ada Lovelace"
+
+
+@pytest.mark.parametrize("claims", [
+    {"aud": f"api://{CLIENT_ID}"},
+    {"iss": f"https://sts.windows.net/{TENANT_ID}/"},
+])
+async def test_alternate_audience_and_issuer_forms_are_accepted(jwks, current_key, claims):
+    user = await validate_azure_token_locally(current_key.token(**claims), AZURE_SETTINGS)
+
+    assert user.preferred_username == "ada@example.com"
+
+
+async def test_keys_are_fetched_once_and_cached(jwks, current_key):
+    for _ in range(3):
+        await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+
+    assert jwks.requests == 1
+
+
+async def test_expired_keys_are_refetched(jwks, current_key):
+    await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+    age_keys(3600)
+
+    await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+
+    assert jwks.requests == 2
+
+
+async def test_unknown_kid_refetch_is_rate_limited(jwks, current_key, next_key):
+    await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+    # The tenant rotates to a key we have not seen yet
+    jwks.keys = [current_key, next_key]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally(next_key.token(), AZURE_SETTINGS)
+    assert exc_info.value.status_code == 401
+    assert jwks.requests == 1
+
+    age_keys(JWKS_MIN_REFRESH_INTERVAL + 1)
+    user = await validate_azure_token_locally(next_key.token(), AZURE_SETTINGS)
+
+    assert user.preferred_username == "ada@example.com"
+    assert jwks.requests == 2
+
+
+async def test_concurrent_unknown_kid_lookups_share_one_refetch(jwks, current_key, next_key):
+    await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+    jwks.keys = [current_key, next_key]
+    age_keys(JWKS_MIN_REFRESH_INTERVAL + 1)
+
+    token = next_key.token()
+    users = await asyncio.gather(*(validate_azure_token_locally(token, AZURE_SETTINGS) for _ in range(10)))
+
+    assert len(users) == 10
+    assert jwks.requests == 2
+
+
+async def test_unknown_kid_after_refetch_is_rejected(jwks, current_key):
+    await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+    age_keys(JWKS_MIN_REFRESH_INTERVAL + 1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally(current_key.token(kid="retired-key"), AZURE_SETTINGS)
+
+    assert exc_info.value.status_code == 401
+    assert jwks.requests == 2
+
+
+@pytest.mark.parametrize("claims", [
+    {"aud": "some-other-app"},
+    {"aud": "https://graph.microsoft.com"},
+    {"iss": "https://login.microsoftonline.com/another-tenant/v2.0"},
+    {"iss": "https://evil.example.com/"},
+])
+async def test_wrong_audience_or_issuer_is_rejected(jwks, current_key, claims):
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally(current_key.token(**claims), AZURE_SETTINGS)
+
+    assert exc_info.value.status_code == 401
+
+
+async def test_expired_token_is_rejected(jwks, current_key):
+    now = int(time.time())
+    token = current_key.token(iat=now - 7200, nbf=now - 7200, exp=now - 3600)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally(token, AZURE_SETTINGS)
+
+    assert exc_info.value.status_code == 401
+
+
+async def test_token_signed_with_another_key_is_rejected(jwks, current_key):
+    # Claims the published kid but is signed with a key the tenant never published
+    forged = SigningKey(current_key.kid).token()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally(forged, AZURE_SETTINGS)
+
+    assert exc_info.value.status_code == 401
+
+
+async def test_malformed_token_is_rejected(jwks):
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally("not-a-jwt", AZURE_SETTINGS)
+
+    assert exc_info.value.status_code == 401
+    assert jwks.requests == 0
+
+
+async def test_jwks_outage_is_reported_as_unavailable(jwks, current_key):
+    jwks.status = 500
+
+    with pytest.raises(HTTPException) as exc_info:
+        await validate_azure_token_locally(current_key.token(), AZURE_SETTINGS)
+
+    assert exc_info.value.status_code == 503
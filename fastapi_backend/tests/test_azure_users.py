@@ -0,0 +1,115 @@
+"""Azure AD user provisioning: one atomic upsert, backed by the users indexes."""
+
+import asyncio
+from datetime import datetime
+import pytest
+from fastapi import HTTPException
+from app import azure_auth
+from app.azure_auth import AzureUser, get_or_create_azure_user
+from app.indexes import sync_indexes
+from app.models.user import User
+
+OID = "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"
+CONCURRENT_LOGINS = 25
+
+
+@pytest.fixture
+async def users_db(mongo_db, monkeypatch):
+    await sync_indexes(mongo_db, [User])
+
+    async def get_db():
+        return mongo_db
+
+    monkeypatch.setattr(azure_auth, "get_db", get_db)
+    return mongo_db
+
+
+def azure_user(oid: str = OID, username: str = "ada@example.com", name: str = "Ada Lovelace") -> AzureUser:
+    return AzureUser(oid=oid, preferred_username=username, email=username, name=name)
+
+
+async def insert_password_user(db, username: str, email: str) -> dict:
+    user = {
+        "username": username,
+        "email": email,
+        "hashed_password": "$2b$12$" + "x" * 53,
+        "full_name": username,
+        "is_active": True,
+        "is_staff": False,
+        "created_at": datetime.utcnow(),
+    }
+    await db.users.insert_one(user)
+    return user
+
+
+async def test_first_login_creates_user(users_db):
+    user = await get_or_create_azure_user(azure_user())
+
+    assert user["azure_oid"] == OID
+    assert user["username"] == "ada"
+    assert user["email"] == "ada@example.com"
+    assert user["auth_provider"] == "azure_ad"
+    assert user["hashed_password"] is None
+
+
+async def test_concurrent_first_logins_create_one_user(users_db):
+    users = await asyncio.gather(*(get_or_create_azure_user(azure_user()) for _ in range(CONCURRENT_LOGINS)))
+
+    assert len({user["_id"] for user in users}) == 1
+    assert await users_db.users.count_documents({}) == 1
+
+
+async def test_returning_user_gets_profile_refreshed(users_db):
+    first = await get_or_create_azure_user(azure_user())
+
+    again = await get_or_create_azure_user(azure_user(name="Ada King"))
+
+    assert again["_id"] == first["_id"]
+    assert again["full_name"] == "Ada King"
+    assert again["username"] == "ada"
+
+
+async def test_password_account_with_same_email_is_linked(users_db):
+    existing = await insert_password_user(users_db, "ada.l", "ada@example.com")
+
+    users = await asyncio.gather(*(get_or_create_azure_user(azure_user()) for _ in range(CONCURRENT_LOGINS)))
+
+    assert {user["_id"] for user in users} == {existing["_id"]}
+    linked = await users_db.users.find_one({"_id": existing["_id"]})
+    assert linked["azure_oid"] == OID
+    assert linked["auth_provider"] == "azure_ad"
+    assert linked["username"] == "ada.l"
+    assert await users_db.users.count_documents({}) == 1
+
+
+async def test_email_linked_to_another_azure_account_is_rejected(users_db):
+    other = await get_or_create_azure_user(azure_user(oid="ffffffff-0000-0000-0000-000000000000"))
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_or_create_azure_user(azure_user())
+
+    assert exc_info.value.status_code == 409
+    assert await users_db.users.count_documents({}) == 1
+    assert (await users_db.users.find_one({}))["_id"] == other["_id"]
+
+
+async def test_taken_username_falls_back_to_the_oid_suffix(users_db):
+    await insert_password_user(users_db, "ada", "someone.else@example.com")
+
+    user = await get_or_create_azure_user(azure_user())
+
+    assert user["username"] == f"ada_{OID[:8]}"
+
+
+async def test_concurrent_first_logins_sharing_a_username_get_distinct_users(users_db):
+    logins = [
+        azure_user(oid=f"{i:08d}-bbbb-cccc-dddd-eeeeeeeeeeee", username=f"ada@tenant{i}.example.com")
+        for i in range(3)
+    ]
+
+    users = await asyncio.gather(*(get_or_create_azure_user(login) for login in logins))
+
+    assert len({user["_id"] for user in users}) == 3
+    usernames = {user["azure_oid"]: user["username"] for user in users}
+    assert sorted(usernames.values()).count("ada") == 1
+    assert all(name in ("ada", f"ada_{oid[:8]}") for oid, name in usernames.items())
@@ -0,0 +1,61 @@
+"""Index planning against the index_information of an existing collection."""
+
+from app.indexes import plan_indexes
+from app.models.activity_log import ActivityLog
+
+
+class Collection:
+    def __init__(self, indexes: dict):
+        self.indexes = indexes
+
+    async def index_information(self) -> dict:
+        return self.indexes
+
+
+class Database(dict):
+    def __getitem__(self, name):
+        return self.get(name, Collection({"_id_": {"key": [("_id", 1)]}}))
+
+
+KEYSET_INDEXES = {
+    "action_time_id": {"key": [("action_time", -1), ("_id", -1)]},
+    "model_object_action_time_id": {
+        "key": [("model", -1), ("object_id", -1), ("action_time", -1), ("_id", -1)],
+    },
+}
+
+
+def activity_logs(**indexes) -> Database:
+    return Database(activity_logs=Collection({"_id_": {"key": [("_id", 1)]}, **KEYSET_INDEXES, **indexes}))
+
+
+async def test_plain_action_time_index_is_rebuilt_as_ttl():
+    db = activity_logs(action_time_desc={"key": [("action_time", -1)]})
+
+    changes = await plan_indexes(db, [ActivityLog])
+
+    assert [(c.action, c.name, c.replaces) for c in changes] == [("rebuild", "action_time_desc", None)]
+
+
+async def test_ttl_change_is_applied_in_place():
+    db = activity_logs(action_time_desc={"key": [("action_time", -1)], "expireAfterSeconds": 86400})
+
+    changes = await plan_indexes(db, [ActivityLog])
+
+    assert [(c.action, c.name) for c in changes] == [("collmod", "action_time_desc")]
+
+
+async def test_same_keys_under_another_name_are_replaced_not_duplicated():
+    db = activity_logs(action_time_ttl={"key": [("action_time", -1)]})
+
+    changes = await plan_indexes(db, [ActivityLog], drop_unknown=True)
+
+    assert [(c.action, c.name, c.replaces) for c in changes] == [("rebuild", "action_time_desc", "action_time_ttl")]
+
+
+async def test_missing_index_is_created():
+    db = activity_logs()
+
+    changes = await plan_indexes(db, [ActivityLog])
+
+    assert [(c.action, c.name) for c in changes] == [("create", "action_time_desc")]
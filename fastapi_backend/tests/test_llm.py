@@ -0,0 +1,119 @@
+"""generate_reply / stream_reply against a local OpenAI-compatible server."""
+
+import time
+import pytest
+from app import llm
+from app.llm import FALLBACK_REPLY, generate_reply, stream_reply
+
+
+async def collect(stream) -> list:
+    return [piece async for piece in stream]
+
+
+def failures(model: str) -> tuple:
+    """(errors in the router's stats, failures seen by the model's breaker)."""
+    return llm.model_router.stats[model].errors, llm.model_router.breakers[model]._outcomes.count(False)
+
+
+async def test_generate_reply_returns_the_completion(stub_llm):
+    reply = await generate_reply("How is the Acme deal going?", "Deal: Acme renewal", use_cache=False)
+
+    assert reply == "Primary says hi"
+    assert stub_llm.calls == ["primary"]
+    assert llm.model_router.stats["primary"].calls == 1
+
+
+async def test_identical_turns_are_answered_from_the_cache(stub_llm):
+    first = await generate_reply("How is the Acme deal going?", "Deal: Acme renewal")
+    second = await generate_reply("How is  the Acme deal going? ", "Deal: Acme renewal")
+
+    assert first == second == "Primary says hi"
+    assert stub_llm.calls == ["primary"]
+
+
+async def test_slow_model_times_out_and_the_next_one_answers(stub_llm):
+    stub_llm.behaviors["primary"].latency = 1.0
+
+    reply = await generate_reply("Hi", use_cache=False)
+
+    assert reply == "Secondary says hi"
+    assert stub_llm.calls == ["primary", "secondary"]
+    assert failures("primary") == (1, 1)
+
+
+async def test_server_error_falls_back_to_the_next_model(stub_llm):
+    stub_llm.behaviors["primary"].status = 500
+
+    reply = await generate_reply("Hi", use_cache=False)
+
+    assert reply == "Secondary says hi"
+    assert failures("primary") == (1, 1)
+    assert failures("secondary") == (0, 0)
+
+
+async def test_fallback_text_when_every_model_fails(stub_llm):
+    stub_llm.behaviors["primary"].status = 503
+    stub_llm.behaviors["secondary"].latency = 1.0
+
+    reply = await generate_reply("Hi")
+
+    assert reply == FALLBACK_REPLY
+    assert len(llm.completion_cache) == 0
+
+
+async def test_stream_forwards_chunks_as_they_arrive(stub_llm):
+    primary = stub_llm.behaviors["primary"]
+    primary.reply = "Closing is planned for Friday"
+    primary.chunk_delay = 0.15
+
+    started = time.perf_counter()
+    pieces, arrivals = [], []
+    async for piece in stream_reply("When does it close?", use_cache=False):
+        arrivals.append(time.perf_counter() - started)
+        pieces.append(piece)
+
+    assert pieces == ["Closing ", "is ", "planned ", "for ", "Friday"]
+    # The first token is not held back until the completion is done
+    assert arrivals[0] < arrivals[-1] - 0.4
+
+
+async def test_stream_failure_before_the_first_chunk_falls_back(stub_llm):
+    stub_llm.behaviors["primary"].status = 500
+
+    pieces = await collect(stream_reply("Hi", use_cache=False))
+
+    assert "".join(pieces) == "Secondary says hi"
+    assert stub_llm.calls == ["primary", "secondary"]
+    # Counted once, not once by the retry helper and again by stream_reply
+    assert failures("primary") == (1, 1)
+
+
+@pytest.mark.parametrize("failure", ["stall_after", "error_after", "drop_after"])
+async def test_stream_failing_before_any_text_falls_back(stub_llm, failure):
+    setattr(stub_llm.behaviors["primary"], failure, 0)
+
+    pieces = await collect(stream_reply("Hi", use_cache=False))
+
+    assert "".join(pieces) == "Secondary says hi"
+    assert failures("primary") == (1, 1)
+
+
+@pytest.mark.parametrize("failure", ["stall_after", "error_after", "drop_after"])
+async def test_stream_failing_mid_way_keeps_what_was_sent(stub_llm, failure):
+    setattr(stub_llm.behaviors["primary"], failure, 1)
+
+    pieces = await collect(stream_reply("Hi"))
+
+    # The user already sees the first words; switching models now would garble the reply
+    assert pieces == ["Primary "]
+    assert stub_llm.calls == ["primary"]
+    assert failures("primary") == (1, 1)
+    assert len(llm.completion_cache) == 0
+
+
+async def test_completed_stream_is_cached(stub_llm):
+    streamed = "".join(await collect(stream_reply("Hi", "Deal: Acme renewal")))
+
+    assert streamed == "Primary says hi"
+    assert await collect(stream_reply("Hi", "Deal: Acme renewal")) == ["Primary says hi"]
+    assert stub_llm.calls == ["primary"]
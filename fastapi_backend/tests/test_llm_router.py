@@ -0,0 +1,135 @@
+"""Model routing: ordering by health, latency and breaker state, driven directly and through the stub server."""
+
+from app import llm
+from app.llm import FALLBACK_REPLY, generate_reply
+from app.llm_router import MIN_LATENCY_SAMPLES, ModelRoute, ModelRouter, build_model_router, parse_routes
+from app.resilience import CircuitBreaker
+from tests.stubs import ModelBehavior
+
+
+def make_router(*routes) -> ModelRouter:
+    return ModelRouter(
+        [ModelRoute(name, limit) for name, limit in routes],
+        slow_p95_seconds=1.0,
+        max_error_ratio=0.2,
+        window=20,
+    )
+
+
+def record_latency(router: ModelRouter, name: str, seconds: float, samples: int = MIN_LATENCY_SAMPLES) -> None:
+    for _ in range(samples):
+        router.record_success(name, seconds)
+
+
+def open_circuit(router: ModelRouter, name: str) -> None:
+    breaker = router.breakers[name]
+    for _ in range(breaker.min_calls):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_healthy_first_then_degraded_by_p95_then_open_circuits(llm_settings):
+    router = make_router(("slowest", 100000), ("fresh", 100000), ("slow", 100000), ("broken", 100000), ("fast", 100000))
+    record_latency(router, "slowest", 3.0)
+    record_latency(router, "slow", 2.0)
+    record_latency(router, "fast", 0.1)
+    open_circuit(router, "broken")
+
+    assert router.route(100) == ["fresh", "fast", "slow", "slowest", "broken"]
+
+
+def test_error_ratio_demotes_a_model(llm_settings):
+    router = make_router(("primary", 100000), ("secondary", 100000))
+    record_latency(router, "primary", 0.1, samples=3)
+    router.record_failure("primary")
+    router.record_failure("primary")
+
+    assert router.route(100) == ["secondary", "primary"]
+
+
+def test_a_few_slow_samples_do_not_demote(llm_settings):
+    router = make_router(("primary", 100000), ("secondary", 100000))
+    record_latency(router, "primary", 5.0, samples=MIN_LATENCY_SAMPLES - 1)
+
+    assert router.route(100) == ["primary", "secondary"]
+
+
+def test_models_with_too_small_a_window_are_skipped(llm_settings):
+    router = make_router(("small", 1000), ("large", 100000))
+
+    assert router.route(500) == ["small", "large"]
+    assert router.route(5000) == ["large"]
+    # Nothing fits: only the largest window is tried
+    assert router.route(10 ** 6) == ["large"]
+
+
+def test_parse_routes():
+    routes = parse_routes("openai/gpt-4o-mini@120000, anthropic/claude-3-haiku", "default", 4000)
+
+    assert routes == [ModelRoute("openai/gpt-4o-mini", 120000), ModelRoute("anthropic/claude-3-haiku", 4000)]
+    assert parse_routes("", "default", 4000) == [ModelRoute("default", 4000)]
+
+
+def test_snapshot_reports_latency_percentiles_and_selections(llm_settings):
+    router = make_router(("primary", 100000), ("secondary", 100000))
+    for seconds in [0.1] * 18 + [2.0, 3.0]:
+        router.record_success("primary", seconds)
+    router.record_selection("primary", fallback=False)
+    router.record_selection("secondary", fallback=True)
+
+    snapshot = router.snapshot()
+
+    assert snapshot["primary"]["p50_seconds"] == 0.1
+    assert snapshot["primary"]["p95_seconds"] == 3.0
+    assert snapshot["primary"]["selected_as_primary"] == 1
+    assert snapshot["secondary"]["used_as_fallback"] == 1
+    assert snapshot["secondary"]["breaker"]["state"] == CircuitBreaker.CLOSED
+
+
+async def test_stub_latency_and_errors_reorder_the_chain(stub_llm, llm_settings, monkeypatch):
+    monkeypatch.setattr(llm_settings, "llm_models", "primary,secondary,tertiary")
+    monkeypatch.setattr(llm_settings, "llm_breaker_min_calls", 1)
+    monkeypatch.setattr(llm, "model_router", build_model_router())
+    stub_llm.behaviors["primary"].status = 500
+    stub_llm.behaviors["secondary"].latency = 0.3  # Within the 0.5 s timeout, over the 0.2 s p95 limit
+    stub_llm.behaviors["tertiary"] = ModelBehavior(reply="Tertiary says hi")
+
+    # The first failure opens the primary's circuit; the secondary answers
+    assert await generate_reply("question 0", use_cache=False) == "Secondary says hi"
+    assert llm.model_router.route(100) == ["secondary", "tertiary", "primary"]
+
+    # Once enough slow samples are in, the secondary is demoted below the tertiary
+    for i in range(1, MIN_LATENCY_SAMPLES):
+        assert await generate_reply(f"question {i}", use_cache=False) == "Secondary says hi"
+    assert await generate_reply("one more", use_cache=False) == "Tertiary says hi"
+
+    assert llm.model_router.route(100) == ["tertiary", "secondary", "primary"]
+    assert stub_llm.calls == ["primary"] + ["secondary"] * MIN_LATENCY_SAMPLES + ["tertiary"]
+    snapshot = llm.model_router.snapshot()
+    assert snapshot["secondary"]["p95_seconds"] >= 0.3
+    assert snapshot["tertiary"]["selected_as_primary"] == 1
+
+
+async def test_open_circuit_is_tried_last_and_short_circuited(stub_llm, llm_settings, monkeypatch):
+    monkeypatch.setattr(llm_settings, "llm_breaker_min_calls", 1)
+    monkeypatch.setattr(llm, "model_router", build_model_router())
+    stub_llm.behaviors["primary"].status = 500
+
+    assert await generate_reply("first", use_cache=False) == "Secondary says hi"
+    stub_llm.behaviors["secondary"].status = 500
+
+    # The secondary now fails too; the primary's open breaker rejects the call without a request
+    assert await generate_reply("second", use_cache=False) == FALLBACK_REPLY
+    assert stub_llm.calls == ["primary", "secondary", "secondary"]
+    assert llm.model_router.breakers["primary"].short_circuited == 1
+
+
+async def test_errors_demote_a_model_before_its_circuit_opens(stub_llm):
+    stub_llm.behaviors["primary"].status = 500
+    for i in range(3):
+        assert await generate_reply(f"question {i}", use_cache=False) == "Secondary says hi"
+
+    # One failure is over the 20% error ratio, but below the breaker's two-call minimum
+    assert llm.model_router.route(100) == ["secondary", "primary"]
+    assert llm.model_router.breakers["primary"].state == CircuitBreaker.CLOSED
+    assert stub_llm.calls == ["primary", "secondary", "secondary", "secondary"]